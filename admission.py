@@ -0,0 +1,311 @@
+"""
+Admission control in front of the Gemini API
+A token bucket keeps calls within the API quota, requests that cannot get a
+token in time are shed at once instead of queueing, and a circuit breaker stops
+calling the API after repeated quota or server errors, probing until it recovers.
+"""
+import asyncio
+import os
+import threading
+import time
+
+import metrics
+
+# Model calls per minute allowed by the API quota, and how many may go out back to back;
+# 0 turns the rate limit off
+LLM_RATE_LIMIT = float(os.getenv('LLM_RATE_LIMIT', 0))
+LLM_RATE_BURST = int(os.getenv('LLM_RATE_BURST', 10))
+# Requests waiting for a token: at most this many, for at most this many seconds
+LLM_QUEUE_MAX = int(os.getenv('LLM_QUEUE_MAX', 100))
+LLM_QUEUE_TIMEOUT = float(os.getenv('LLM_QUEUE_TIMEOUT', 10))
+# Consecutive quota/server errors that open the breaker, and seconds before the first probe
+LLM_BREAKER_FAILURES = int(os.getenv('LLM_BREAKER_FAILURES', 5))
+LLM_BREAKER_RESET = float(os.getenv('LLM_BREAKER_RESET', 30))
+# Each failed probe doubles the wait, up to this many seconds
+LLM_BREAKER_MAX_RESET = float(os.getenv('LLM_BREAKER_MAX_RESET', 300))
+
+BREAKER_STATES = ('closed', 'half_open', 'open')
+SHED_REASONS = ('rate_limited', 'queue_full', 'circuit_open')
+
+# Every state and reason is listed in /metrics, even before it first occurs
+for state in BREAKER_STATES:
+    metrics.BREAKER_STATE.inc(state, 0)
+for reason in SHED_REASONS:
+    metrics.SHED_REQUESTS.inc(reason, 0)
+
+
+class Overloaded(Exception):
+    """Raised instead of calling the model when the request is shed, or after the model
+    failed with a quota or server error (reason 'model_unavailable')"""
+
+    def __init__(self, reason, retry_after):
+        seconds = max(1, round(retry_after))
+        super().__init__(f"The assistant is busy right now ({reason.replace('_', ' ')}). "
+                         f"Please try again in {seconds} second{'s' if seconds != 1 else ''}.")
+        self.reason = reason
+        self.retry_after = retry_after
+
+    @property
+    def status_code(self):
+        # 429 when we turned the request away, 503 when the model itself failed
+        return 503 if self.reason == 'model_unavailable' else 429
+
+
+class TokenBucket:
+    """Refills rate tokens per second up to capacity; callers hold the controller's lock"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self._updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_take(self, now):
+        self._refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def wait_time(self, now, position=1):
+        """Seconds until the position-th waiter can expect a token"""
+        self._refill(now)
+        return max(0.0, (position - self.tokens) / self.rate)
+
+
+class CircuitBreaker:
+    """Opens after consecutive failures; lets one probe through after a cool-down"""
+
+    def __init__(self, failure_threshold=LLM_BREAKER_FAILURES, reset_timeout=LLM_BREAKER_RESET,
+                 max_reset_timeout=LLM_BREAKER_MAX_RESET):
+        self.failure_threshold = failure_threshold
+        self.base_reset_timeout = reset_timeout
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.state = 'closed'
+        self.failures = 0
+        self.opened = 0
+        self._opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+        metrics.BREAKER_STATE.inc('closed')
+
+    def _set_state(self, state):
+        metrics.BREAKER_STATE.dec(self.state)
+        metrics.BREAKER_STATE.inc(state)
+        self.state = state
+
+    def retry_after(self, now):
+        if self.state != 'open':
+            return self.reset_timeout
+        return max(0.0, self._opened_at + self.reset_timeout - now)
+
+    def rejects(self, now):
+        """True when allow() would refuse, without changing state"""
+        if self.state == 'open':
+            return now - self._opened_at < self.reset_timeout
+        return self.state == 'half_open' and self._probing
+
+    def allow(self, now):
+        """True when a call may go out; moves an expired open breaker to half-open"""
+        with self._lock:
+            if self.state == 'closed':
+                return True
+            if self.state == 'open' and now - self._opened_at >= self.reset_timeout:
+                self._set_state('half_open')
+            if self.state == 'half_open' and not self._probing:
+                # Exactly one probe at a time decides whether the API has recovered
+                self._probing = True
+                return True
+            return False
+
+    def release_probe(self):
+        """Forget a probe that was cancelled before the API answered"""
+        with self._lock:
+            self._probing = False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._probing = False
+            if self.state != 'closed':
+                self.reset_timeout = self.base_reset_timeout
+                self._set_state('closed')
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == 'half_open':
+                # The probe failed; wait longer before the next one
+                self._probing = False
+                self.reset_timeout = min(self.max_reset_timeout, self.reset_timeout * 2)
+                self._open()
+            elif self.state == 'closed' and self.failures >= self.failure_threshold:
+                self._open()
+
+    def _open(self):
+        self._opened_at = time.monotonic()
+        self.opened += 1
+        self._set_state('open')
+
+
+class AdmissionController:
+    """Decides whether a model call may go out now, after a short wait, or not at all"""
+
+    def __init__(self, rate_per_minute=LLM_RATE_LIMIT, burst=LLM_RATE_BURST, max_queue=LLM_QUEUE_MAX,
+                 queue_timeout=LLM_QUEUE_TIMEOUT, breaker=None):
+        self.bucket = TokenBucket(rate_per_minute / 60, burst) if rate_per_minute > 0 else None
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.breaker = breaker or CircuitBreaker()
+        self._lock = threading.Lock()
+        self.waiting = 0
+        self.admitted = 0
+        self.shed = 0
+
+    def share_quota(self, parts):
+        """Keep 1/parts of the rate limit and burst, for one of parts processes sharing the API quota"""
+        with self._lock:
+            if self.bucket is not None and parts > 1:
+                self.bucket = TokenBucket(self.bucket.rate / parts, max(1, self.bucket.capacity // parts))
+
+    def _shed(self, reason, retry_after):
+        self.shed += 1
+        metrics.SHED_REQUESTS.inc(reason)
+        return Overloaded(reason, retry_after)
+
+    def _try_enter(self, now, timeout, queued):
+        """Return 0 when admitted, else seconds to wait before trying again; raises when shed"""
+        if self.breaker.rejects(now):
+            raise self._shed('circuit_open', self.breaker.retry_after(now))
+        with self._lock:
+            if self.bucket is not None and not self.bucket.try_take(now):
+                # Shed at once when the queue is full or the wait would outlast the timeout
+                wait = self.bucket.wait_time(now, self.waiting if queued else self.waiting + 1)
+                if not queued and self.waiting >= self.max_queue:
+                    raise self._shed('queue_full', wait)
+                if wait > timeout:
+                    raise self._shed('rate_limited', wait)
+                return max(wait, 0.001)
+            if not self.breaker.allow(now):
+                # Another request became the probe meanwhile; give the token back
+                if self.bucket is not None:
+                    self.bucket.tokens += 1
+                raise self._shed('circuit_open', self.breaker.retry_after(now))
+            self.admitted += 1
+            return 0.0
+
+    def admit(self, timeout=LLM_QUEUE_TIMEOUT):
+        """Block until the call may go out, or raise Overloaded"""
+        deadline = time.monotonic() + min(timeout, self.queue_timeout)
+        queued = False
+        try:
+            while True:
+                now = time.monotonic()
+                wait = self._try_enter(now, deadline - now, queued)
+                if not wait:
+                    return
+                if not queued:
+                    queued = True
+                    self._enter_queue()
+                time.sleep(wait)
+        finally:
+            if queued:
+                self._leave_queue()
+
+    async def admit_async(self, timeout=LLM_QUEUE_TIMEOUT):
+        """Async counterpart of admit(); waits without blocking the event loop"""
+        deadline = time.monotonic() + min(timeout, self.queue_timeout)
+        queued = False
+        try:
+            while True:
+                now = time.monotonic()
+                wait = self._try_enter(now, deadline - now, queued)
+                if not wait:
+                    return
+                if not queued:
+                    queued = True
+                    self._enter_queue()
+                await asyncio.sleep(wait)
+        finally:
+            if queued:
+                self._leave_queue()
+
+    def try_admit(self):
+        """Admit without waiting (hedges and retries); returns False instead of raising"""
+        try:
+            return not self._try_enter(time.monotonic(), 0.0, False)
+        except Overloaded:
+            return False
+
+    def _enter_queue(self):
+        with self._lock:
+            self.waiting += 1
+        metrics.ADMISSION_QUEUE_DEPTH.inc()
+
+    def _leave_queue(self):
+        with self._lock:
+            self.waiting -= 1
+        metrics.ADMISSION_QUEUE_DEPTH.dec()
+
+    def record_success(self):
+        self.breaker.record_success()
+
+    def record_abandoned(self):
+        """An admitted call was cancelled before the API answered"""
+        self.breaker.release_probe()
+
+    def record_failure(self, error):
+        """Count quota, server and timeout errors towards opening the breaker"""
+        if is_breaker_failure(error):
+            self.breaker.record_failure()
+        else:
+            # The API answered (e.g. a bad request), so it is up
+            self.breaker.record_success()
+
+    def stats(self):
+        """Return queue depth and breaker state for the health endpoint"""
+        now = time.monotonic()
+        with self._lock:
+            tokens = None
+            if self.bucket is not None:
+                self.bucket._refill(now)
+                tokens = round(self.bucket.tokens, 2)
+            return {
+                'rate_limit_per_minute': self.bucket.rate * 60 if self.bucket else None,
+                'tokens_available': tokens,
+                'queue_depth': self.waiting,
+                'max_queue': self.max_queue,
+                'admitted': self.admitted,
+                'shed': self.shed,
+                'breaker': {
+                    'state': self.breaker.state,
+                    'consecutive_failures': self.breaker.failures,
+                    'times_opened': self.breaker.opened,
+                    'retry_after_seconds': round(self.breaker.retry_after(now), 2)
+                    if self.breaker.state == 'open' else None,
+                },
+            }
+
+
+# Status codes (as text) of server-side failures in google.api_core error messages
+SERVER_ERROR_CODES = ('500', '502', '503', '504')
+
+
+def is_breaker_failure(error):
+    """True for quota exhaustion, server errors and timeouts"""
+    if metrics.classify_error(error) in ('quota', 'timeout'):
+        return True
+    code = getattr(error, 'code', None)
+    if isinstance(code, int):
+        return code == 429 or code >= 500
+    message = str(error)
+    return message.startswith(SERVER_ERROR_CODES) or message.startswith('429')
+
+
+# Shared by every request in the process
+admission_controller = AdmissionController()
@@ -1,8 +1,27 @@
-from flask import Flask, render_template, request, jsonify
-import google.generativeai as genai
+from flask import Flask, Response, g, render_template, request, jsonify, stream_with_context
+from concurrent.futures import ThreadPoolExecutor
 import json
 import os
+import time
 from dotenv import load_dotenv
+from faq_index import build_index, get_index
+from faq_passages import build_passage_index, get_passage_index
+from prompt_builder import PROMPT_CANDIDATES, estimate_tokens, get_prompt_template, packing_stats
+import model_registry
+from response_cache import lookup_answer, normalize_question, response_cache, store_answer
+from semantic_cache import semantic_cache
+from faq_answers import CHAT_MODE, get_faq_response
+from faq_snapshot import DEFAULT_SNAPSHOT_PATH, load_snapshot
+from faq_ingest import load_faq_file
+from faq_store import CompactFAQ, compact_faq
+from request_coalescing import chat_singleflight
+from conversation import session_store
+from faq_reload import FAQReloader
+from request_policy import model_policy
+from admission import Overloaded, admission_controller, is_breaker_failure
+import math
+import hmac
+import metrics
 
 # Load environment variables
 load_dotenv()
@@ -17,121 +36,301 @@ if not GEMINI_API_KEY:
         "Please set it in your .env file or environment variables. "
         "Never commit API keys to version control!"
     )
-genai.configure(api_key=GEMINI_API_KEY)
+model_registry.configure(GEMINI_API_KEY)
+# Resolve the preferred model once; set GEMINI_VERIFY_MODELS=1 to check availability at startup
+model_registry.registry.resolve(verify=os.getenv('GEMINI_VERIFY_MODELS', '').lower() in ('1', 'true', 'yes'))
+
+# Batch endpoint limits: questions per request and concurrent LLM calls per batch
+BATCH_MAX_QUESTIONS = int(os.getenv('BATCH_MAX_QUESTIONS', 1000))
+BATCH_MAX_WORKERS = int(os.getenv('BATCH_MAX_WORKERS', 8))
+
+# Compiled FAQ snapshot (build with: python faq_snapshot.py)
+FAQ_SNAPSHOT_PATH = os.getenv('FAQ_SNAPSHOT_PATH', DEFAULT_SNAPSHOT_PATH)
 
 # Load FAQ data
-def load_faq_data(json_path='faq_data.json'):
-    """Load FAQ data from JSON file"""
+def load_faq_data(json_path='faq_data.json', snapshot_path=FAQ_SNAPSHOT_PATH):
+    """Load FAQ data and build its retrieval index, preferring an up-to-date snapshot"""
+    # The memory-mapped snapshot already contains the index and prompt context
+    snapshot = load_snapshot(snapshot_path, json_path)
+    if snapshot is not None:
+        return snapshot
+    
     try:
-        with open(json_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        # Entries are streamed, repaired and deduplicated rather than parsed in one piece
+        faq_data = load_faq_file(json_path)
     except FileNotFoundError:
         print(f"Warning: {json_path} not found. Loading from CSV...")
-        return load_faq_from_csv('Mental_Health_FAQ.csv')
+        faq_data = load_faq_from_csv('Mental_Health_FAQ.csv')
+    # Large corpora are kept column-wise with compressed answers
+    faq_data = compact_faq(faq_data)
+    build_index(faq_data)
+    build_passage_index(faq_data)
+    get_prompt_template(faq_data)
+    return faq_data
 
 def load_faq_from_csv(csv_path):
     """Load FAQ data from CSV file if JSON doesn't exist"""
-    import pandas as pd
-    df = pd.read_csv(csv_path)
-    faq_data = []
-    for idx, row in df.iterrows():
-        faq_data.append({
-            'question_id': str(row['Question_ID']),
-            'question': str(row['Questions']).strip(),
-            'answer': str(row['Answers']).strip()
-        })
-    return faq_data
-
-def create_faq_context(faq_data, max_entries=150):
-    """Create formatted context string from FAQ data"""
-    context_parts = []
-    # Use a subset to avoid token limits
-    for entry in faq_data[:max_entries]:
-        q = entry['question'].strip()
-        a = entry['answer'].strip()
-        context_parts.append(f"Q: {q}\nA: {a}\n")
-    return "\n".join(context_parts)
+    return load_faq_file(csv_path)
 
 def find_similar_question(user_question, faq_data, top_n=3):
-    """Find similar questions from FAQ using simple keyword matching"""
-    user_lower = user_question.lower()
-    scores = []
-    
-    for entry in faq_data:
-        question = entry['question'].lower()
-        # Simple keyword matching
-        keywords = user_lower.split()
-        matches = sum(1 for keyword in keywords if keyword in question)
-        if matches > 0:
-            scores.append((matches, entry))
-    
-    # Sort by match count and return top N
-    scores.sort(reverse=True, key=lambda x: x[0])
-    return [entry for _, entry in scores[:top_n]]
-
-def get_chatbot_response(user_question, faq_data, api_key):
-    """Generate response using Gemini API with FAQ context"""
+    """Find similar questions from FAQ using the BM25 retrieval index"""
+    index = get_index(faq_data)
+    return [faq_data[doc_id] for _, doc_id in index.search(user_question, top_n)]
+
+def find_relevant_passages(user_question, faq_data, top_n=PROMPT_CANDIDATES):
+    """Find the answer passages that best match the question using the BM25 passage index"""
+    return get_passage_index(faq_data).search(user_question, top_n)
+
+def build_chat_prompt(user_question, faq_data, relevant_passages=None, conversation=None):
+    """Build the full prompt for a user question and any earlier turns"""
+    # Retrieve ranked passages first (batch callers pass them in)
+    if relevant_passages is None:
+        query = user_question
+        if conversation:
+            # Follow-ups such as "what are the symptoms?" lean on the previous question
+            query = f"{conversation.last_user_message()} {user_question}"
+        with metrics.STAGE_SECONDS.time('retrieval'):
+            relevant_passages = find_relevant_passages(query, faq_data)
+    
+    # Static instructions are prebuilt per FAQ version; the best passages fill the token budget
+    with metrics.STAGE_SECONDS.time('prompt'):
+        history = conversation.render() if conversation else ''
+        prompt, context_tokens = get_prompt_template(faq_data).render_packed(
+            user_question, relevant_passages, history
+        )
+    metrics.PROMPT_TOKENS.observe(estimate_tokens(prompt))
+    app.logger.info(f"Packed {context_tokens} FAQ context tokens into the prompt")
+    return prompt
+
+def call_model(model, full_prompt):
+    """Generate a complete answer under the request policy, recording the call's latency"""
+    def attempt(attempt_model):
+        with metrics.LLM_CALLS_IN_FLIGHT.track():
+            return attempt_model.generate_content(full_prompt).text
+    
+    # Deadline, hedging after the recent p95 latency and retries of transient errors
+    with metrics.STAGE_SECONDS.time('llm'):
+        return model_policy.call(attempt, model, model_registry.get_hedge_model(model))
+
+def stream_model(model, full_prompt):
+    """Yield answer chunks as they arrive, recording time to first chunk and in total"""
+    started = time.perf_counter()
+    
+    def attempt(attempt_model):
+        # An attempt lasts until the first chunk; the winner's stream is read on below
+        with metrics.LLM_CALLS_IN_FLIGHT.track():
+            chunks = iter(attempt_model.generate_content(full_prompt, stream=True))
+            for chunk in chunks:
+                if chunk.text:
+                    return chunk.text, chunks
+        return '', iter(())
+    
+    # Opening the stream gets the deadline, hedging and retries of call_model
+    first, chunks = model_policy.call(attempt, model, model_registry.get_hedge_model(model))
+    metrics.STAGE_SECONDS.observe(time.perf_counter() - started, 'llm_first_chunk')
+    if first:
+        yield first
+    with metrics.LLM_CALLS_IN_FLIGHT.track():
+        for chunk in chunks:
+            text = chunk.text
+            if text:
+                yield text
+    metrics.STAGE_SECONDS.observe(time.perf_counter() - started, 'llm')
+
+def generate_chatbot_response(user_question, faq_data, relevant_passages=None, conversation=None):
+    """Generate response using Gemini API with FAQ context, raising on API errors"""
+    # Shared model client, resolved once at startup
+    model = model_registry.get_model()
+    
+    # Follow-ups depend on the conversation, so only standalone questions share answers
+    if conversation:
+        full_prompt = build_chat_prompt(user_question, faq_data, relevant_passages, conversation)
+        return call_model(model, full_prompt)
+    
+    # Answers are reused for the same (or a paraphrased) question, FAQ version and model
+    faq_version = get_index(faq_data).version
+    cached = lookup_answer(user_question, faq_version, model.model_name)
+    if cached is not None:
+        return cached
+    
+    def generate():
+        full_prompt = build_chat_prompt(user_question, faq_data, relevant_passages)
+        
+        # Generate response
+        response = call_model(model, full_prompt)
+        store_answer(user_question, faq_version, model.model_name, response)
+        return response
+    
+    # Identical questions already in flight share that call instead of starting another
+    coalescing_key = response_cache.make_key(user_question, faq_version, model.model_name)
+    return chat_singleflight.do(coalescing_key, generate)
+
+def get_chatbot_response(user_question, faq_data, api_key, conversation=None):
+    """Generate response using Gemini API with FAQ context, recording the turn in conversation"""
     if not api_key:
         return "Error: Gemini API key not configured. Please set GEMINI_API_KEY environment variable."
     
     try:
-        # Find similar questions first
-        similar_questions = find_similar_question(user_question, faq_data)
-        
-        # Create context from similar questions and general FAQ
-        relevant_context = ""
-        if similar_questions:
-            relevant_context = "Most relevant FAQ entries:\n"
-            for entry in similar_questions:
-                relevant_context += f"Q: {entry['question']}\nA: {entry['answer']}\n\n"
+        response = generate_chatbot_response(user_question, faq_data, conversation=conversation)
+    except Overloaded:
+        # The caller answers from the FAQ instead
+        raise
+    except Exception as e:
+        metrics.record_error(e)
+        if is_breaker_failure(e):
+            # Quota or server trouble: fall back to the FAQ rather than returning the error
+            raise Overloaded('model_unavailable', admission_controller.breaker.reset_timeout) from e
+        return f"I apologize, but I encountered an error: {str(e)}. Please try again or contact support."
+    if conversation is not None:
+        conversation.add_turn(user_question, response)
+    return response
+
+def get_chatbot_responses(questions, faq_data, api_key, max_workers=BATCH_MAX_WORKERS):
+    """Answer a batch of questions; results keep the input order and carry a per-item status"""
+    results = [None] * len(questions)
+    
+    # Identical questions (after normalization) are answered once
+    unique = {}
+    for position, question in enumerate(questions):
+        question = str(question or '').strip()
+        if not question:
+            results[position] = {'status': 'error', 'error': 'Message is required'}
+            continue
+        unique.setdefault(normalize_question(question), (question, []))[1].append(position)
+    
+    if unique:
+        # One retrieval pass over entries (direct answers) and one over passages (prompt context)
+        batch_questions = [question for question, _ in unique.values()]
+        with metrics.STAGE_SECONDS.time('retrieval'):
+            matches = get_index(faq_data).search_batch(batch_questions, top_n=1, typo_correction=False)
+            passages = get_passage_index(faq_data).search_batch(batch_questions, top_n=PROMPT_CANDIDATES)
         
-        # Add general FAQ context (limited to avoid token limits)
-        faq_context = create_faq_context(faq_data, max_entries=100)
+        def answer(question, question_matches, relevant_passages):
+            faq_response = get_faq_response(question, faq_data, results=question_matches)
+            if faq_response is not None:
+                metrics.ANSWERS.inc('faq')
+                return {**faq_response, 'status': 'success'}
+            if not api_key:
+                raise ValueError("Gemini API key not configured. Please set GEMINI_API_KEY environment variable.")
+            response = generate_chatbot_response(question, faq_data, relevant_passages)
+            metrics.ANSWERS.inc('llm')
+            return {'response': response, 'source': 'llm', 'status': 'success'}
         
-        system_prompt = f"""You are a helpful and empathetic mental health assistant chatbot. 
-Your role is to provide accurate, supportive, and compassionate information about mental health based on the following FAQ database.
+        # LLM calls run on a bounded pool so a large batch cannot flood the API
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(batch_questions)))) as pool:
+            futures = [
+                pool.submit(answer, question, question_matches, relevant_passages)
+                for question, question_matches, relevant_passages in zip(batch_questions, matches, passages)
+            ]
+            for (question, positions), future in zip(unique.values(), futures):
+                try:
+                    result = future.result()
+                except Overloaded as e:
+                    result = fallback_response(question, faq_data, e)
+                except Exception as e:
+                    metrics.record_error(e)
+                    if is_breaker_failure(e):
+                        overloaded = Overloaded('model_unavailable', admission_controller.breaker.reset_timeout)
+                        result = fallback_response(question, faq_data, overloaded)
+                    else:
+                        result = {'status': 'error', 'error': str(e)}
+                for position in positions:
+                    results[position] = result
+    
+    return [
+        {'index': position, 'question': question, **result}
+        for position, (question, result) in enumerate(zip(questions, results))
+    ]
 
-{relevant_context}
+def stream_chatbot_response(user_question, faq_data, api_key, conversation=None):
+    """Yield the Gemini response in chunks as they are generated
 
-Additional FAQ Database Context:
-{faq_context[:3000]}
+    Raises Overloaded when the model fails before the first chunk, so the caller
+    can still answer from the FAQ.
+    """
+    if not api_key:
+        raise ValueError("Gemini API key not configured. Please set GEMINI_API_KEY environment variable.")
+    
+    model = model_registry.get_model()
+    faq_version = get_index(faq_data).version
+    # Follow-ups depend on the conversation, so only standalone questions share answers
+    standalone = not conversation
+    cached = lookup_answer(user_question, faq_version, model.model_name) if standalone else None
+    if cached is not None:
+        yield cached
+        answer = cached
+    else:
+        full_prompt = build_chat_prompt(user_question, faq_data, conversation=conversation)
+        parts = []
+        try:
+            for text in stream_model(model, full_prompt):
+                parts.append(text)
+                yield text
+        except Overloaded:
+            raise
+        except Exception as e:
+            if parts:
+                raise
+            # Nothing was sent yet, so the caller can still answer from the FAQ
+            metrics.record_error(e)
+            raise Overloaded('model_unavailable', admission_controller.breaker.reset_timeout) from e
+        answer = "".join(parts)
+        if answer and standalone:
+            store_answer(user_question, faq_version, model.model_name, answer)
+    if answer and conversation is not None:
+        conversation.add_turn(user_question, answer)
 
-Instructions:
-1. Use the FAQ database above to answer user questions accurately
-2. If a question matches or is similar to a FAQ entry, provide that answer
-3. If the question is not directly in the FAQ, use your knowledge to provide helpful, empathetic responses
-4. Always be supportive, non-judgmental, and encourage professional help when appropriate
-5. If someone is in crisis or mentions self-harm, encourage them to seek immediate professional help
-6. Keep responses clear, concise, and easy to understand
-7. If you're unsure, acknowledge it and suggest consulting a mental health professional
+def fallback_response(user_question, faq_data, error):
+    """FAQ-only answer for a request shed by admission control"""
+    metrics.ANSWERS.inc('fallback')
+    return {
+        **get_faq_response(user_question, faq_data, mode='faq-only'),
+        'status': 'overloaded',
+        'notice': str(error),
+        'retry_after': math.ceil(error.retry_after),
+    }
 
-Remember: You are not a replacement for professional mental health care. Always encourage users to consult with qualified mental health professionals for diagnosis and treatment.
-"""
-        
-        # Initialize model - using gemini-2.5-flash (faster) or gemini-2.5-pro (more capable)
-        # Model names must include 'models/' prefix
-        try:
-            model = genai.GenerativeModel('models/gemini-2.5-flash')
-        except Exception:
-            try:
-                model = genai.GenerativeModel('models/gemini-2.5-pro')
-            except Exception:
-                # Fallback to latest versions
-                model = genai.GenerativeModel('models/gemini-flash-latest')
-        
-        # Create full prompt
-        full_prompt = f"{system_prompt}\n\nUser Question: {user_question}\n\nPlease provide a helpful and empathetic response:"
-        
-        # Generate response
-        response = model.generate_content(full_prompt)
-        return response.text
-        
-    except Exception as e:
-        return f"I apologize, but I encountered an error: {str(e)}. Please try again or contact support."
+def format_sse(data, event=None):
+    """Format a payload as a server-sent event"""
+    message = f"data: {json.dumps(data)}\n\n"
+    if event:
+        message = f"event: {event}\n{message}"
+    return message
 
 # Load FAQ data at startup
 faq_data = load_faq_data()
 
+# Shared secret for POST /admin/reload; the endpoint is disabled when unset
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN')
+
+def swap_faq_data(new_faq_data):
+    """Serve new FAQ data from the next request on (a single reference assignment)"""
+    global faq_data
+    faq_data = new_faq_data
+
+# Rebuilt in the background when faq_data.json, the snapshot or the CSV changes
+faq_reloader = FAQReloader(
+    load_faq_data,
+    ('faq_data.json', FAQ_SNAPSHOT_PATH, 'Mental_Health_FAQ.csv'),
+    swap_faq_data
+)
+faq_reloader.start(faq_data)
+
+# Chat endpoints are counted and timed from the first byte in to the last byte out
+METERED_ENDPOINTS = frozenset(('chat', 'chat_batch', 'chat_stream'))
+
+@app.before_request
+def start_request_metrics():
+    if request.endpoint in METERED_ENDPOINTS:
+        g.metrics_started = metrics.start_request(request.endpoint)
+
+@app.teardown_request
+def finish_request_metrics(error=None):
+    # Runs after a streamed response has finished, not when the view returns
+    started = g.pop('metrics_started', None)
+    if started is not None:
+        metrics.finish_request(request.endpoint, started)
+
 @app.route('/')
 def index():
     """Render the main chat interface"""
@@ -147,28 +346,153 @@ def chat():
         if not user_message:
             return jsonify({'error': 'Message is required'}), 400
         
+        # Earlier turns are kept server-side; the client only echoes its session_id
+        session_id, conversation = session_store.get_or_create(data.get('session_id'))
+        
+        # Read once so a reload mid-request cannot mix FAQ versions
+        current_faq = faq_data
+        
+        # Answer straight from the FAQ when the mode allows and the match is confident
+        faq_response = get_faq_response(user_message, current_faq)
+        if faq_response is not None:
+            conversation.add_turn(user_message, faq_response['response'])
+            metrics.ANSWERS.inc('faq')
+            return jsonify({**faq_response, 'session_id': session_id, 'status': 'success'})
+        
         # Get response from chatbot
-        bot_response = get_chatbot_response(user_message, faq_data, GEMINI_API_KEY)
+        try:
+            bot_response = get_chatbot_response(user_message, current_faq, GEMINI_API_KEY, conversation)
+        except Overloaded as e:
+            # Shed fast with the closest FAQ answer rather than queueing behind the quota
+            fallback = fallback_response(user_message, current_faq, e)
+            return (jsonify({**fallback, 'session_id': session_id}), e.status_code,
+                    {'Retry-After': str(fallback['retry_after'])})
+        metrics.ANSWERS.inc('llm')
         
         return jsonify({
             'response': bot_response,
+            'source': 'llm',
+            'session_id': session_id,
             'status': 'success'
         })
         
     except Exception as e:
+        metrics.record_error(e)
         return jsonify({
             'error': str(e),
             'status': 'error'
         }), 500
 
+@app.route('/chat/batch', methods=['POST'])
+def chat_batch():
+    """Answer a list of questions in one request"""
+    data = request.get_json(silent=True) or {}
+    questions = data.get('questions')
+    
+    if not isinstance(questions, list) or not questions:
+        return jsonify({'error': 'questions must be a non-empty list', 'status': 'error'}), 400
+    if len(questions) > BATCH_MAX_QUESTIONS:
+        return jsonify({
+            'error': f'At most {BATCH_MAX_QUESTIONS} questions per batch',
+            'status': 'error'
+        }), 400
+    
+    results = get_chatbot_responses(questions, faq_data, GEMINI_API_KEY)
+    return jsonify({'results': results, 'status': 'success'})
+
+@app.route('/chat/stream', methods=['POST'])
+def chat_stream():
+    """Stream the chatbot response as server-sent events"""
+    data = request.get_json(silent=True) or {}
+    user_message = data.get('message', '').strip()
+    
+    if not user_message:
+        return jsonify({'error': 'Message is required'}), 400
+    
+    session_id, conversation = session_store.get_or_create(data.get('session_id'))
+    # Read once so a reload mid-stream cannot mix FAQ versions
+    current_faq = faq_data
+    faq_response = get_faq_response(user_message, current_faq)
+    
+    def generate():
+        if faq_response is not None:
+            conversation.add_turn(user_message, faq_response['response'])
+            metrics.ANSWERS.inc('faq')
+            yield format_sse({'text': faq_response['response']})
+            yield format_sse({
+                'status': 'success',
+                'source': 'faq',
+                'question_id': faq_response['question_id'],
+                'session_id': session_id
+            }, event='done')
+            return
+        try:
+            for text in stream_chatbot_response(user_message, current_faq, GEMINI_API_KEY, conversation):
+                yield format_sse({'text': text})
+            metrics.ANSWERS.inc('llm')
+            yield format_sse({'status': 'success', 'source': 'llm', 'session_id': session_id}, event='done')
+        except Overloaded as e:
+            fallback = fallback_response(user_message, current_faq, e)
+            yield format_sse({'text': fallback['response']})
+            yield format_sse({
+                'status': 'overloaded',
+                'source': 'faq',
+                'question_id': fallback['question_id'],
+                'notice': fallback['notice'],
+                'retry_after': fallback['retry_after'],
+                'session_id': session_id
+            }, event='done')
+        except Exception as e:
+            metrics.record_error(e)
+            yield format_sse({'error': str(e), 'status': 'error'}, event='error')
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+def health_status():
+    """Collect the health check payload"""
+    return {
+        'status': 'healthy',
+        'faq_entries': len(faq_data),
+        'faq_version': faq_reloader.version,
+        'faq_reload': faq_reloader.stats(),
+        'api_configured': bool(GEMINI_API_KEY),
+        'chat_mode': CHAT_MODE,
+        'response_cache': response_cache.stats(),
+        'semantic_cache': semantic_cache.stats(),
+        'coalescing': chat_singleflight.stats(),
+        'prompt_packing': packing_stats.stats(),
+        'sessions': session_store.stats(),
+        'model_policy': model_policy.stats(),
+        'admission': admission_controller.stats(),
+        'faq_store': faq_data.stats() if isinstance(faq_data, CompactFAQ) else None
+    }
+
+@app.route('/admin/reload', methods=['POST'])
+def admin_reload():
+    """Reload the FAQ data now instead of waiting for the file watcher"""
+    if not ADMIN_TOKEN:
+        return jsonify({'error': 'Reload endpoint is disabled. Set ADMIN_TOKEN to enable it.'}), 404
+    auth = request.headers.get('Authorization', '')
+    token = auth[len('Bearer '):].strip() if auth.startswith('Bearer ') else ''
+    if not hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    result = faq_reloader.reload()
+    return jsonify(result), 500 if result['status'] == 'error' else 200
+
 @app.route('/health')
 def health():
     """Health check endpoint"""
-    return jsonify({
-        'status': 'healthy',
-        'faq_entries': len(faq_data),
-        'api_configured': bool(GEMINI_API_KEY)
-    })
+    return jsonify(health_status())
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus metrics endpoint"""
+    return Response(metrics.render_metrics(), content_type=metrics.CONTENT_TYPE)
 
 if __name__ == '__main__':
     port = int(os.getenv('PORT', 5000))
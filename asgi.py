@@ -0,0 +1,408 @@
+"""
+ASGI entry point for async serving of the Mental Health FAQ Chatbot
+/chat and /chat/stream await Gemini on the event loop, so one process can hold
+hundreds of in-flight chats; every other route is served by the Flask app.
+
+Run with:
+    uvicorn asgi:app --host 0.0.0.0 --port 5000
+"""
+import asyncio
+import json
+import os
+import time
+
+from asgiref.wsgi import WsgiToAsgi
+
+import app as web
+import metrics
+import model_registry
+from conversation import session_store
+from faq_answers import get_faq_response
+from faq_index import get_index
+from request_coalescing import async_chat_singleflight
+from admission import Overloaded, admission_controller, is_breaker_failure
+from request_policy import model_policy
+from response_cache import lookup_answer, response_cache, store_answer
+
+# Cap on outstanding Gemini calls; further requests wait for a free slot
+LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', 64))
+MAX_BODY_BYTES = 1024 * 1024
+
+
+class LLMConcurrencyLimiter:
+    """Bounds concurrent LLM calls and counts the requests waiting for one"""
+
+    def __init__(self, limit=LLM_MAX_CONCURRENCY):
+        self.limit = limit
+        self.in_flight = 0
+        self.waiting = 0
+        # Created on first use so it binds to the server's event loop
+        self._semaphore = None
+
+    async def __aenter__(self):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.limit)
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.in_flight -= 1
+        self._semaphore.release()
+
+    def stats(self):
+        return {'limit': self.limit, 'in_flight': self.in_flight, 'waiting': self.waiting}
+
+
+llm_limiter = LLMConcurrencyLimiter()
+
+
+async def run_blocking(func, *args):
+    """Run CPU-bound work (retrieval, prompt building) off the event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, func, *args)
+
+
+async def call_model_async(model, full_prompt):
+    """Generate a complete answer under the request policy, recording the call's latency"""
+    async def attempt(attempt_model):
+        # Hedges and retries take a concurrency slot like any other call
+        async with llm_limiter:
+            with metrics.LLM_CALLS_IN_FLIGHT.track():
+                response = await attempt_model.generate_content_async(full_prompt)
+        return response.text
+
+    with metrics.STAGE_SECONDS.time('llm'):
+        return await model_policy.call_async(attempt, model, model_registry.get_hedge_model(model))
+
+
+async def generate_chatbot_response_async(user_question, faq_data, conversation=None):
+    """Async counterpart of app.generate_chatbot_response"""
+    model = model_registry.get_model()
+
+    # Follow-ups depend on the conversation, so only standalone questions share answers
+    if conversation:
+        full_prompt = await run_blocking(web.build_chat_prompt, user_question, faq_data, None, conversation)
+        return await call_model_async(model, full_prompt)
+
+    faq_version = get_index(faq_data).version
+    cached = await run_blocking(lookup_answer, user_question, faq_version, model.model_name)
+    if cached is not None:
+        return cached
+
+    async def generate():
+        full_prompt = await run_blocking(web.build_chat_prompt, user_question, faq_data)
+        response = await call_model_async(model, full_prompt)
+        store_answer(user_question, faq_version, model.model_name, response)
+        return response
+
+    # Identical questions already in flight share that call instead of starting another
+    coalescing_key = response_cache.make_key(user_question, faq_version, model.model_name)
+    return await async_chat_singleflight.do(coalescing_key, generate)
+
+
+async def get_chatbot_response_async(user_question, faq_data, api_key, conversation=None):
+    """Async counterpart of app.get_chatbot_response"""
+    if not api_key:
+        return "Error: Gemini API key not configured. Please set GEMINI_API_KEY environment variable."
+
+    try:
+        response = await generate_chatbot_response_async(user_question, faq_data, conversation)
+    except Overloaded:
+        raise
+    except Exception as e:
+        metrics.record_error(e)
+        if is_breaker_failure(e):
+            raise Overloaded('model_unavailable', admission_controller.breaker.reset_timeout) from e
+        return f"I apologize, but I encountered an error: {str(e)}. Please try again or contact support."
+    if conversation is not None:
+        conversation.add_turn(user_question, response)
+    return response
+
+
+async def stream_model_async(model, full_prompt):
+    """Async counterpart of app.stream_model"""
+    started = time.perf_counter()
+
+    async def attempt(attempt_model):
+        # An attempt lasts until the first chunk; the winner's stream is read on below
+        async with llm_limiter:
+            with metrics.LLM_CALLS_IN_FLIGHT.track():
+                response = await attempt_model.generate_content_async(full_prompt, stream=True)
+                chunks = response.__aiter__()
+                async for chunk in chunks:
+                    if chunk.text:
+                        return chunk.text, chunks
+        return '', None
+
+    # Opening the stream gets the deadline, hedging and retries of call_model_async
+    first, chunks = await model_policy.call_async(attempt, model, model_registry.get_hedge_model(model))
+    metrics.STAGE_SECONDS.observe(time.perf_counter() - started, 'llm_first_chunk')
+    if first:
+        yield first
+    if chunks is not None:
+        async with llm_limiter:
+            with metrics.LLM_CALLS_IN_FLIGHT.track():
+                async for chunk in chunks:
+                    text = chunk.text
+                    if text:
+                        yield text
+    metrics.STAGE_SECONDS.observe(time.perf_counter() - started, 'llm')
+
+
+async def stream_chatbot_response_async(user_question, faq_data, api_key, conversation=None):
+    """Async counterpart of app.stream_chatbot_response"""
+    if not api_key:
+        raise ValueError("Gemini API key not configured. Please set GEMINI_API_KEY environment variable.")
+
+    model = model_registry.get_model()
+    faq_version = get_index(faq_data).version
+    standalone = not conversation
+    cached = None
+    if standalone:
+        cached = await run_blocking(lookup_answer, user_question, faq_version, model.model_name)
+    if cached is not None:
+        yield cached
+        answer = cached
+    else:
+        full_prompt = await run_blocking(web.build_chat_prompt, user_question, faq_data, None, conversation)
+        parts = []
+        try:
+            async for text in stream_model_async(model, full_prompt):
+                parts.append(text)
+                yield text
+        except Overloaded:
+            raise
+        except Exception as e:
+            if parts:
+                raise
+            # Nothing was sent yet, so the caller can still answer from the FAQ
+            metrics.record_error(e)
+            raise Overloaded('model_unavailable', admission_controller.breaker.reset_timeout) from e
+        answer = "".join(parts)
+        if answer and standalone:
+            store_answer(user_question, faq_version, model.model_name, answer)
+    if answer and conversation is not None:
+        conversation.add_turn(user_question, answer)
+
+
+async def read_json_body(receive):
+    """Read the request body and decode it as JSON (empty dict if absent or invalid)"""
+    chunks = []
+    size = 0
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return None
+        body = message.get('body', b'')
+        size += len(body)
+        if size > MAX_BODY_BYTES:
+            return {}
+        chunks.append(body)
+        if not message.get('more_body', False):
+            break
+    try:
+        data = json.loads(b''.join(chunks) or b'{}')
+    except ValueError:
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+async def wait_for_disconnect(receive):
+    """Return once the client has gone away"""
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return
+
+
+async def cancel_on_disconnect(coroutine, receive):
+    """Await coroutine and return (finished, result); cancel it if the client disconnects first"""
+    task = asyncio.ensure_future(coroutine)
+    watcher = asyncio.ensure_future(wait_for_disconnect(receive))
+    try:
+        await asyncio.wait({task, watcher}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        watcher.cancel()
+    if task.done():
+        return True, task.result()
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+    return False, None
+
+
+async def send_json(send, payload, status=200, headers=()):
+    body = json.dumps(payload).encode('utf-8')
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(body)).encode()),
+            *headers,
+        ],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def chat(scope, receive, send):
+    """Handle chat requests"""
+    data = await read_json_body(receive)
+    if data is None:
+        return
+    user_message = str(data.get('message', '')).strip()
+
+    if not user_message:
+        await send_json(send, {'error': 'Message is required'}, 400)
+        return
+
+    try:
+        session_id, conversation = session_store.get_or_create(data.get('session_id'))
+        # faq_data is read once so a reload mid-request cannot mix versions
+        faq_data = web.faq_data
+        faq_response = await run_blocking(get_faq_response, user_message, faq_data)
+        if faq_response is not None:
+            conversation.add_turn(user_message, faq_response['response'])
+            metrics.ANSWERS.inc('faq')
+            await send_json(send, {**faq_response, 'session_id': session_id, 'status': 'success'})
+            return
+
+        try:
+            finished, bot_response = await cancel_on_disconnect(
+                get_chatbot_response_async(user_message, faq_data, web.GEMINI_API_KEY, conversation),
+                receive
+            )
+        except Overloaded as e:
+            fallback = await run_blocking(web.fallback_response, user_message, faq_data, e)
+            await send_json(send, {**fallback, 'session_id': session_id}, e.status_code,
+                            [(b'retry-after', str(fallback['retry_after']).encode())])
+            return
+        if finished:
+            metrics.ANSWERS.inc('llm')
+            await send_json(send, {
+                'response': bot_response,
+                'source': 'llm',
+                'session_id': session_id,
+                'status': 'success'
+            })
+    except Exception as e:
+        metrics.record_error(e)
+        await send_json(send, {'error': str(e), 'status': 'error'}, 500)
+
+
+async def chat_stream(scope, receive, send):
+    """Stream the chatbot response as server-sent events"""
+    data = await read_json_body(receive)
+    if data is None:
+        return
+    user_message = str(data.get('message', '')).strip()
+
+    if not user_message:
+        await send_json(send, {'error': 'Message is required'}, 400)
+        return
+
+    session_id, conversation = session_store.get_or_create(data.get('session_id'))
+    faq_data = web.faq_data
+    faq_response = await run_blocking(get_faq_response, user_message, faq_data)
+
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [
+            (b'content-type', b'text/event-stream'),
+            (b'cache-control', b'no-cache'),
+            (b'x-accel-buffering', b'no'),
+        ],
+    })
+
+    async def send_event(data, event=None):
+        await send({
+            'type': 'http.response.body',
+            'body': web.format_sse(data, event).encode('utf-8'),
+            'more_body': True,
+        })
+
+    if faq_response is not None:
+        conversation.add_turn(user_message, faq_response['response'])
+        metrics.ANSWERS.inc('faq')
+        await send_event({'text': faq_response['response']})
+        await send_event({
+            'status': 'success',
+            'source': 'faq',
+            'question_id': faq_response['question_id'],
+            'session_id': session_id
+        }, event='done')
+    else:
+        try:
+            async for text in stream_chatbot_response_async(user_message, faq_data, web.GEMINI_API_KEY, conversation):
+                await send_event({'text': text})
+            metrics.ANSWERS.inc('llm')
+            await send_event({'status': 'success', 'source': 'llm', 'session_id': session_id}, event='done')
+        except Overloaded as e:
+            fallback = await run_blocking(web.fallback_response, user_message, faq_data, e)
+            await send_event({'text': fallback['response']})
+            await send_event({
+                'status': 'overloaded',
+                'source': 'faq',
+                'question_id': fallback['question_id'],
+                'notice': fallback['notice'],
+                'retry_after': fallback['retry_after'],
+                'session_id': session_id
+            }, event='done')
+        except Exception as e:
+            metrics.record_error(e)
+            await send_event({'error': str(e), 'status': 'error'}, event='error')
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+async def health(scope, receive, send):
+    """Health check endpoint, including async LLM concurrency"""
+    status = await run_blocking(web.health_status)
+    await send_json(send, {
+        **status,
+        'llm_concurrency': llm_limiter.stats(),
+        'async_coalescing': async_chat_singleflight.stats()
+    })
+
+
+ROUTES = {
+    ('POST', '/chat'): chat,
+    ('POST', '/chat/stream'): chat_stream,
+    ('GET', '/health'): health,
+}
+
+flask_asgi = WsgiToAsgi(web.app)
+
+
+async def app(scope, receive, send):
+    """ASGI application: async chat routes, everything else via Flask"""
+    if scope['type'] == 'http':
+        handler = ROUTES.get((scope['method'], scope['path']))
+        if handler is not None:
+            # Handlers share their names with the Flask endpoints they replace
+            endpoint = handler.__name__
+            if endpoint not in web.METERED_ENDPOINTS:
+                await handler(scope, receive, send)
+                return
+            started = metrics.start_request(endpoint)
+            try:
+                await handler(scope, receive, send)
+            finally:
+                metrics.finish_request(endpoint, started)
+            return
+    if scope['type'] == 'lifespan':
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+    await flask_asgi(scope, receive, send)
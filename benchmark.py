@@ -0,0 +1,468 @@
+"""
+Offline benchmark for the Mental Health FAQ Chatbot
+Replaces Gemini with a local stub model, generates synthetic FAQ corpora and
+measures retrieval, prompt building, memory and end-to-end /chat latency
+without using any API quota. Results are written as JSON so runs can be
+compared for regressions.
+
+Usage:
+    python benchmark.py [--sizes 1000,10000,100000] [--concurrency 1,8,32]
+                        [--output benchmark_results.json] [--compare baseline.json]
+"""
+import argparse
+import asyncio
+import http.client
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+# The app refuses to start without a key, watches files and caches answers;
+# none of that should affect a benchmark, so set it up before importing it
+os.environ.setdefault('GEMINI_API_KEY', 'benchmark-offline-key')
+os.environ.setdefault('FAQ_RELOAD_INTERVAL', '0')
+os.environ.setdefault('CHAT_MODE', 'llm')
+
+# Fix encoding for Windows PowerShell
+if sys.platform == 'win32':
+    sys.stdout.reconfigure(encoding='utf-8')
+
+FILLER_WORDS = (
+    'feel', 'help', 'support', 'mental', 'health', 'anxiety', 'depression', 'stress', 'sleep',
+    'therapy', 'therapist', 'counselling', 'family', 'friend', 'symptoms', 'treatment',
+    'medication', 'doctor', 'recovery', 'crisis', 'mood', 'panic', 'grief', 'school', 'work',
+)
+
+
+class ServiceUnavailable(Exception):
+    """Named like google.api_core's 503 error so the request policy retries it"""
+
+
+class FakeResponse:
+    """Mimics the part of a Gemini response the app reads"""
+
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeGeminiModel:
+    """Local stand-in for genai.GenerativeModel with configurable latency and output length"""
+
+    def __init__(self, latency=0.5, latency_sigma=0.4, output_words=150, chunk_words=20,
+                 first_chunk_fraction=0.3, error_rate=0.0, seed=None, model_name='models/fake-gemini'):
+        self.model_name = model_name
+        # Latencies follow a log-normal distribution with the given median (seconds)
+        self.latency = latency
+        self.latency_sigma = latency_sigma
+        self.output_words = output_words
+        self.chunk_words = chunk_words
+        self.first_chunk_fraction = first_chunk_fraction
+        # Fraction of non-streaming calls that fail with a transient 503
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+
+    def _sample(self):
+        with self._lock:
+            self.calls += 1
+            latency = self.latency * self._random.lognormvariate(0, self.latency_sigma) if self.latency else 0.0
+            words = [self._random.choice(FILLER_WORDS) for _ in range(self.output_words)]
+            fails = self._random.random() < self.error_rate
+        return latency, words, fails
+
+    @staticmethod
+    def _check_fields(fields):
+        # The pinned client turns extra keyword arguments into request fields and rejects unknown ones
+        for name in fields:
+            raise ValueError(f"Unknown field for GenerateContentRequest: {name}")
+
+    @staticmethod
+    def _outcome(latency, fails):
+        """Return (seconds to wait, error to raise afterwards or None)"""
+        if fails:
+            # Overloaded backends fail fast
+            return latency * 0.1, ServiceUnavailable("503 The model is overloaded. Please try again later.")
+        return latency, None
+
+    def _chunks(self, words):
+        return [' '.join(words[i:i + self.chunk_words]) + ' ' for i in range(0, len(words), self.chunk_words)]
+
+    def generate_content(self, contents, *, generation_config=None, safety_settings=None, stream=False, **kwargs):
+        self._check_fields(kwargs)
+        latency, words, fails = self._sample()
+        if not stream:
+            delay, error = self._outcome(latency, fails)
+            time.sleep(delay)
+            if error is not None:
+                raise error
+            return FakeResponse(' '.join(words))
+        return self._stream(latency, self._chunks(words))
+
+    def _stream(self, latency, chunks):
+        time.sleep(latency * self.first_chunk_fraction)
+        rest = latency * (1 - self.first_chunk_fraction) / max(1, len(chunks) - 1)
+        for i, chunk in enumerate(chunks):
+            if i:
+                time.sleep(rest)
+            yield FakeResponse(chunk)
+
+    async def generate_content_async(self, contents, *, generation_config=None, safety_settings=None,
+                                     stream=False, **kwargs):
+        self._check_fields(kwargs)
+        latency, words, fails = self._sample()
+        if not stream:
+            delay, error = self._outcome(latency, fails)
+            await asyncio.sleep(delay)
+            if error is not None:
+                raise error
+            return FakeResponse(' '.join(words))
+        return self._stream_async(latency, self._chunks(words))
+
+    async def _stream_async(self, latency, chunks):
+        await asyncio.sleep(latency * self.first_chunk_fraction)
+        rest = latency * (1 - self.first_chunk_fraction) / max(1, len(chunks) - 1)
+        for i, chunk in enumerate(chunks):
+            if i:
+                await asyncio.sleep(rest)
+            yield FakeResponse(chunk)
+
+
+def load_vocabulary(path='faq_data.json'):
+    """Words of the real FAQ ordered by frequency, so synthetic text has a realistic spread"""
+    from faq_index import TOKEN_PATTERN
+    counts = {}
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            for entry in json.load(f):
+                for field in ('question', 'answer'):
+                    for word in TOKEN_PATTERN.findall(entry.get(field, '').lower()):
+                        counts[word] = counts.get(word, 0) + 1
+    words = sorted(counts, key=counts.get, reverse=True)
+    return words or list(FILLER_WORDS)
+
+
+def synthetic_faq(size, vocabulary, answer_words=120, seed=0):
+    """Generate size FAQ entries whose word frequencies follow Zipf's law"""
+    rng = random.Random(seed)
+    weights = [1.0 / rank for rank in range(1, len(vocabulary) + 1)]
+    # Draw words in large batches; random.choices is much faster than one call per word
+    pool = []
+    position = 0
+
+    def words(count):
+        nonlocal pool, position
+        if position + count > len(pool):
+            pool = rng.choices(vocabulary, weights, k=max(count, 100000))
+            position = 0
+        position += count
+        return pool[position - count:position]
+
+    faq_data = []
+    for i in range(size):
+        question = ' '.join(words(rng.randint(5, 12))).capitalize() + '?'
+        paragraphs = []
+        remaining = answer_words
+        while remaining > 0:
+            length = min(remaining, rng.randint(25, 60))
+            paragraphs.append(' '.join(words(length)).capitalize() + '.')
+            remaining -= length
+        faq_data.append({'question_id': str(i), 'question': question, 'answer': '\n'.join(paragraphs)})
+    return faq_data
+
+
+def synthetic_queries(faq_data, vocabulary, count, seed=1):
+    """Half rephrased FAQ questions, half free-form questions"""
+    rng = random.Random(seed)
+    queries = []
+    for i in range(count):
+        if i % 2 == 0:
+            words = faq_data[rng.randrange(len(faq_data))]['question'].rstrip('?').split()
+            rng.shuffle(words)
+            queries.append(' '.join(words[:rng.randint(3, len(words))]) + '?')
+        else:
+            queries.append(' '.join(rng.choices(vocabulary[:2000], k=rng.randint(4, 10))) + '?')
+    return queries
+
+
+def percentiles(samples):
+    """Summary statistics in milliseconds"""
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def at(fraction):
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000
+
+    return {
+        'count': len(ordered),
+        'mean_ms': round(statistics.fmean(ordered) * 1000, 4),
+        'p50_ms': round(at(0.50), 4),
+        'p90_ms': round(at(0.90), 4),
+        'p99_ms': round(at(0.99), 4),
+        'max_ms': round(ordered[-1] * 1000, 4),
+    }
+
+
+def timed(func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - started, result
+
+
+def measure_memory(func, *args):
+    """Return the bytes still allocated by func(*args) once it returns
+
+    Tracing slows allocation-heavy code several times over, so this runs
+    separately from the timed builds.
+    """
+    tracemalloc.start()
+    try:
+        result = func(*args)
+        retained, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+    return retained
+
+
+def bench_corpus(size, args, vocabulary, web):
+    """Build, retrieval and prompt-building numbers for one corpus size"""
+    from faq_index import FAQIndex, build_index
+    from faq_passages import PassageIndex, build_passage_index
+    from faq_store import CompactFAQ
+    from prompt_builder import get_prompt_template
+
+    print(f"\nCorpus of {size} entries")
+    generate_seconds, faq_data = timed(synthetic_faq, size, vocabulary, args.answer_words)
+    index_seconds, index = timed(build_index, faq_data)
+    passage_seconds, passage_index = timed(build_passage_index, faq_data)
+    get_prompt_template(faq_data)
+    print(f"  generated in {generate_seconds:.2f}s, index {index_seconds:.2f}s, passages {passage_seconds:.2f}s")
+
+    memory = None
+    if size <= args.memory_max_size:
+        memory = {
+            'corpus': measure_memory(synthetic_faq, size, vocabulary, args.answer_words),
+            'compact_corpus': measure_memory(CompactFAQ, faq_data),
+            'index': measure_memory(FAQIndex, faq_data),
+            'passage_index': measure_memory(PassageIndex, faq_data),
+        }
+
+    queries = synthetic_queries(faq_data, vocabulary, args.queries)
+    search_times = [timed(index.search, query, 3)[0] for query in queries]
+    passage_times = [timed(passage_index.search, query, 20)[0] for query in queries]
+    batch_seconds, _ = timed(index.search_batch, queries, 3)
+    prompt_times = []
+    prompt_sizes = []
+    for query in queries:
+        elapsed, prompt = timed(web.build_chat_prompt, query, faq_data)
+        prompt_times.append(elapsed)
+        prompt_sizes.append(len(prompt))
+
+    result = {
+        'entries': size,
+        'passages': len(passage_index),
+        'build_seconds': {
+            'generate': round(generate_seconds, 4),
+            'index': round(index_seconds, 4),
+            'passage_index': round(passage_seconds, 4),
+        },
+        'memory_bytes': memory,
+        'retrieval': percentiles(search_times),
+        'passage_retrieval': percentiles(passage_times),
+        'batch_retrieval_per_query_ms': round(batch_seconds / len(queries) * 1000, 4),
+        'prompt_build': percentiles(prompt_times),
+        'prompt_chars_mean': round(statistics.fmean(prompt_sizes), 1),
+    }
+    print(f"  retrieval p50 {result['retrieval']['p50_ms']:.3f} ms, "
+          f"prompt build p50 {result['prompt_build']['p50_ms']:.3f} ms"
+          + (f", index {memory['index'] / 1e6:.1f} MB" if memory else ''))
+    return faq_data, result
+
+
+def post_chat(port, message):
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=120)
+    try:
+        body = json.dumps({'message': message})
+        connection.request('POST', '/chat', body, {'Content-Type': 'application/json'})
+        response = connection.getresponse()
+        response.read()
+        return response.status
+    finally:
+        connection.close()
+
+
+def bench_chat(port, queries, concurrency, requests_per_level):
+    """Drive /chat over HTTP with a fixed number of concurrent clients"""
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+
+    def client(message):
+        nonlocal errors
+        started = time.perf_counter()
+        try:
+            status = post_chat(port, message)
+        except OSError:
+            status = None
+        elapsed = time.perf_counter() - started
+        with lock:
+            if status == 200:
+                latencies.append(elapsed)
+            else:
+                errors += 1
+
+    messages = [f"{queries[i % len(queries)]} ({concurrency}-{i})" for i in range(requests_per_level)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(client, messages))
+    wall = time.perf_counter() - started
+    result = {
+        'concurrency': concurrency,
+        'requests': requests_per_level,
+        'errors': errors,
+        'throughput_rps': round(len(latencies) / wall, 2) if wall else 0.0,
+        'latency': percentiles(latencies),
+    }
+    print(f"  concurrency {concurrency:>3}: {result['throughput_rps']:.1f} req/s, "
+          f"p50 {result['latency'].get('p50_ms', 0):.1f} ms, p99 {result['latency'].get('p99_ms', 0):.1f} ms, "
+          f"{errors} errors")
+    return result
+
+
+def run_chat_benchmark(web, faq_data, args, vocabulary):
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    class QuietRequestHandler(WSGIRequestHandler):
+        def log_request(self, *args):
+            pass
+
+    web.swap_faq_data(faq_data)
+    server = make_server('127.0.0.1', 0, web.app, threaded=True, request_handler=QuietRequestHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    print(f"\nEnd-to-end /chat on {len(faq_data)} entries "
+          f"(fake model median latency {args.latency * 1000:.0f} ms)")
+    try:
+        queries = synthetic_queries(faq_data, vocabulary, 1000, seed=2)
+        return [
+            bench_chat(server.server_port, queries, concurrency, args.requests)
+            for concurrency in args.concurrency
+        ]
+    finally:
+        server.shutdown()
+
+
+def flatten(data, prefix=''):
+    """Flatten nested results into {'path': number} for comparison"""
+    values = {}
+    if isinstance(data, dict):
+        for key, value in data.items():
+            values.update(flatten(value, f"{prefix}{key}."))
+    elif isinstance(data, list):
+        for item in data:
+            # Lists hold one result per corpus size or concurrency level
+            label = item.get('entries', item.get('concurrency')) if isinstance(item, dict) else None
+            values.update(flatten(item, f"{prefix}{label}."))
+    elif isinstance(data, (int, float)) and not isinstance(data, bool):
+        values[prefix.rstrip('.')] = data
+    return values
+
+
+def compare(results, baseline_path):
+    """Print the change of every shared metric relative to a saved run"""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = flatten(json.load(f)['results'])
+    current = flatten(results)
+    print(f"\nChange relative to {baseline_path}:")
+    for key in sorted(current.keys() & baseline.keys()):
+        old, new = baseline[key], current[key]
+        if old:
+            print(f"  {key:<60} {old:>12} -> {new:<12} ({(new - old) / old * 100:+.1f}%)")
+
+
+def parse_list(value):
+    return [int(item) for item in value.split(',') if item.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=parse_list, default=[1000, 10000, 100000],
+                        help='comma-separated synthetic corpus sizes (1k-1M)')
+    parser.add_argument('--answer-words', type=int, default=120, help='words per synthetic answer')
+    parser.add_argument('--queries', type=int, default=500, help='queries per retrieval benchmark')
+    parser.add_argument('--concurrency', type=parse_list, default=[1, 8, 32],
+                        help='comma-separated concurrent /chat clients')
+    parser.add_argument('--requests', type=int, default=200, help='/chat requests per concurrency level')
+    parser.add_argument('--chat-size', type=int, default=None,
+                        help='corpus size for the /chat benchmark (default: the smallest size)')
+    parser.add_argument('--latency', type=float, default=0.5, help='fake model median latency in seconds')
+    parser.add_argument('--latency-sigma', type=float, default=0.4, help='spread of the log-normal latency')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='fraction of fake model calls failing with a transient 503')
+    parser.add_argument('--output-words', type=int, default=150, help='words per fake model answer')
+    parser.add_argument('--memory-max-size', type=int, default=10000,
+                        help='largest corpus whose memory is traced (tracing is slow)')
+    parser.add_argument('--with-cache', action='store_true', help='keep the response caches enabled')
+    parser.add_argument('--skip-chat', action='store_true', help='skip the end-to-end /chat benchmark')
+    parser.add_argument('--output', default='benchmark_results.json', help='where to write the JSON results')
+    parser.add_argument('--compare', help='earlier results file to compare against')
+    args = parser.parse_args()
+
+    if not args.with_cache:
+        # Every request should reach the model, as on a cold cache
+        os.environ['RESPONSE_CACHE_SIZE'] = '0'
+        os.environ['SEMANTIC_CACHE_SIZE'] = '0'
+
+    import app as web
+    import model_registry
+
+    model = FakeGeminiModel(args.latency, args.latency_sigma, args.output_words,
+                            error_rate=args.error_rate, seed=0)
+    model_registry.registry.use_model(model)
+    vocabulary = load_vocabulary()
+
+    corpora = {}
+    corpus_results = []
+    chat_size = args.chat_size or min(args.sizes)
+    for size in args.sizes:
+        faq_data, result = bench_corpus(size, args, vocabulary, web)
+        corpus_results.append(result)
+        if size == chat_size:
+            corpora[size] = faq_data
+    results = {'corpora': corpus_results}
+
+    if not args.skip_chat:
+        faq_data = corpora.get(chat_size) or bench_corpus(chat_size, args, vocabulary, web)[0]
+        results['chat'] = run_chat_benchmark(web, faq_data, args, vocabulary)
+        results['model_calls'] = model.calls
+        results['model_policy'] = web.model_policy.stats()
+
+    report = {
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+        },
+        'config': {key: value for key, value in vars(args).items() if key not in ('output', 'compare')},
+        'results': results,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+    if args.compare:
+        compare(results, args.compare)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
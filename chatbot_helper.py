@@ -1,7 +1,8 @@
-import google.generativeai as genai
 import json
 import os
 
+import model_registry
+
 def load_faq_data(json_path='faq_data.json'):
     """Load FAQ data from JSON file"""
     with open(json_path, 'r', encoding='utf-8') as f:
@@ -18,8 +19,8 @@ def create_faq_context(faq_data, max_entries=100):
 
 def get_chatbot_response(user_question, faq_data, api_key):
     """Generate response using Gemini API with FAQ context"""
-    # Configure Gemini
-    genai.configure(api_key=api_key)
+    # Configure Gemini (no-op after the first call with the same key)
+    model_registry.configure(api_key)
     
     # Create context (use first 100 entries to avoid token limits)
     faq_context = create_faq_context(faq_data[:100])
@@ -41,16 +42,8 @@ Instructions:
 Remember: You are not a replacement for professional mental health care. Always encourage users to consult with qualified mental health professionals for diagnosis and treatment.
 """
     
-    # Initialize model - using gemini-2.5-flash (faster) or gemini-2.5-pro (more capable)
-    # Model names must include 'models/' prefix
-    try:
-        model = genai.GenerativeModel('models/gemini-2.5-flash')
-    except Exception:
-        try:
-            model = genai.GenerativeModel('models/gemini-2.5-pro')
-        except Exception:
-            # Fallback to latest versions
-            model = genai.GenerativeModel('models/gemini-flash-latest')
+    # Shared model client, resolved once per process
+    model = model_registry.get_model()
     
     # Create full prompt
     full_prompt = f"{system_prompt}\n\nUser Question: {user_question}"
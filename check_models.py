@@ -59,12 +59,12 @@ try:
         
         if recommended:
             print(f"Recommended model: {recommended}")
-            print(f"\nUpdate your app.py to use:")
-            print(f'  model = genai.GenerativeModel("{recommended}")')
+            print(f"\nAdd it to PREFERRED_MODELS in model_registry.py:")
+            print(f"  '{recommended}',")
         else:
             print(f"First available model: {available_models[0]}")
-            print(f"\nUpdate your app.py to use:")
-            print(f'  model = genai.GenerativeModel("{available_models[0]}")')
+            print(f"\nAdd it to PREFERRED_MODELS in model_registry.py:")
+            print(f"  '{available_models[0]}',")
     
 except Exception as e:
     print(f"Error: {str(e)}")
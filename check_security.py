@@ -1,10 +1,22 @@
 """
 Security check script - Run before committing to GitHub
 Checks for exposed API keys and sensitive data
+
+Files are memory-mapped and each pattern searches a whole file at once; files
+with NUL bytes are searched with those removed, and oversized files are skipped.
+Large trees are scanned by a pool of processes, and --changed / --incremental
+limit a run to files that changed.
 """
+import argparse
+import hashlib
+import json
+import mmap
 import os
 import re
+import subprocess
 import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
 
 # Fix encoding for Windows
 if sys.platform == 'win32':
@@ -18,63 +30,189 @@ API_KEY_PATTERNS = [
     r'xox[baprs]-[A-Za-z0-9-]{10,}',  # Slack tokens
 ]
 
+# Searched over the raw bytes of a whole file; each pattern starts with a literal,
+# which re scans for quickly (one alternation of all of them would lose that)
+COMPILED_PATTERNS = [re.compile(pattern.encode('ascii')) for pattern in API_KEY_PATTERNS]
+
 # Files to check
-CHECK_EXTENSIONS = ['.py', '.ps1', '.js', '.html', '.md', '.txt', '.json']
-IGNORE_PATTERNS = ['.git', 'venv', '__pycache__', '.env.example']
+CHECK_EXTENSIONS = ['.py', '.ps1', '.js', '.html', '.md', '.txt', '.json', '.ipynb']
+IGNORE_PATTERNS = ['.git', 'venv', '__pycache__', '.env.example', '.security_scan_cache']
 
-def check_file(filepath):
-    """Check a single file for API keys"""
+# Files larger than this are reported as skipped instead of scanned (e.g. data dumps)
+MAX_FILE_MB = float(os.getenv('SECURITY_SCAN_MAX_FILE_MB', 20))
+# A NUL byte in the first block marks a binary (or UTF-16) file
+BINARY_SNIFF_BYTES = 8192
+# Below this many files a process pool costs more than it saves
+PARALLEL_MIN_FILES = 200
+# Results of earlier --incremental runs, keyed by path, size and modification time
+CACHE_PATH = '.security_scan_cache.json'
+
+def _scan_file(filepath, max_bytes):
+    """Return (filepath, status, issues, bytes scanned) for one file"""
     issues = []
     try:
-        with open(filepath, 'r', encoding='utf-8', errors='ignore') as f:
-            content = f.read()
-            lines = content.split('\n')
-            
-            for i, line in enumerate(lines, 1):
-                for pattern in API_KEY_PATTERNS:
-                    matches = re.finditer(pattern, line)
-                    for match in matches:
-                        # Check if it's in a comment or example
-                        if 'example' in line.lower() or 'your_' in line.lower():
-                            continue
-                        issues.append({
-                            'file': filepath,
-                            'line': i,
-                            'match': match.group()[:20] + '...',
-                            'pattern': pattern
-                        })
-    except Exception as e:
-        pass  # Skip files that can't be read
-    
-    return issues
+        size = os.path.getsize(filepath)
+        if size == 0:
+            return filepath, 'scanned', issues, 0
+        if size > max_bytes:
+            return filepath, 'oversize', issues, 0
+        with open(filepath, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            status = 'scanned'
+            if b'\0' in data[:BINARY_SNIFF_BYTES]:
+                # Keys are ASCII: dropping the NULs joins the text of UTF-16 files and
+                # leaves strings embedded in binary data intact, newlines included
+                status = 'binary'
+                data = data[:].replace(b'\0', b'')
+            matches = sorted(
+                (match.start(), number, match)
+                for number, pattern in enumerate(COMPILED_PATTERNS)
+                for match in pattern.finditer(data)
+            )
+            line = 1
+            counted = 0
+            for start, number, match in matches:
+                line += data[counted:start].count(b'\n')
+                counted = start
+                line_start = data.rfind(b'\n', 0, start) + 1
+                line_end = data.find(b'\n', match.end())
+                text = data[line_start:line_end if line_end != -1 else len(data)].lower()
+                # Check if it's in a comment or example
+                if b'example' in text or b'your_' in text:
+                    continue
+                issues.append({
+                    'file': filepath,
+                    'line': line,
+                    'match': match.group().decode('ascii')[:20] + '...',
+                    'pattern': API_KEY_PATTERNS[number]
+                })
+    except (OSError, ValueError):
+        return filepath, 'unreadable', issues, 0  # Skip files that can't be read
+    return filepath, status, issues, size
 
-def scan_directory(directory='.'):
-    """Scan directory for potential security issues"""
-    all_issues = []
-    
+def check_file(filepath, max_bytes=MAX_FILE_MB * 1024 * 1024):
+    """Check a single file for API keys"""
+    return _scan_file(filepath, max_bytes)[2]
+
+def is_checked(rel_path):
+    """True for files with a checked extension outside the ignored paths"""
+    if any(ignore in rel_path for ignore in IGNORE_PATTERNS):
+        return False
+    return any(rel_path.endswith(ext) for ext in CHECK_EXTENSIONS)
+
+def collect_files(directory='.'):
+    """Return every file under directory that should be checked"""
+    paths = []
     for root, dirs, files in os.walk(directory):
         # Skip ignored directories
         dirs[:] = [d for d in dirs if not any(ignore in d for ignore in IGNORE_PATTERNS)]
-        
+
         for file in files:
             filepath = os.path.join(root, file)
-            rel_path = os.path.relpath(filepath, directory)
-            
-            # Skip ignored files
-            if any(ignore in rel_path for ignore in IGNORE_PATTERNS):
-                continue
-            
-            # Check only relevant extensions
-            if any(file.endswith(ext) for ext in CHECK_EXTENSIONS):
-                issues = check_file(filepath)
-                all_issues.extend(issues)
-    
-    return all_issues
+            if is_checked(os.path.relpath(filepath, directory)):
+                paths.append(filepath)
+    return paths
+
+def changed_files(directory='.'):
+    """Return checked files that git reports as staged, modified or untracked, or None without git"""
+    commands = [
+        ['git', 'diff', '--name-only', '--diff-filter=ACMR', '--cached'],
+        ['git', 'ls-files', '--others', '--exclude-standard'],
+    ]
+    names = set()
+    try:
+        top = subprocess.run(['git', 'rev-parse', '--show-toplevel'], cwd=directory, capture_output=True,
+                             text=True, check=True).stdout.strip()
+        # Before the first commit everything is staged or untracked
+        if subprocess.run(['git', 'rev-parse', '--verify', '-q', 'HEAD'], cwd=top,
+                          capture_output=True).returncode == 0:
+            commands.append(['git', 'diff', '--name-only', '--diff-filter=ACMR', 'HEAD'])
+        for command in commands:
+            output = subprocess.run(command, cwd=top, capture_output=True, text=True, check=True).stdout
+            names.update(name for name in output.splitlines() if name)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    paths = []
+    for name in sorted(names):
+        filepath = os.path.relpath(os.path.join(top, name), directory)
+        if not filepath.startswith('..') and os.path.isfile(filepath) and is_checked(filepath):
+            paths.append(os.path.join(directory, filepath))
+    return paths
+
+def _fingerprint(max_bytes):
+    """Cached results are only valid for the same patterns and limits"""
+    settings = json.dumps([API_KEY_PATTERNS, max_bytes, BINARY_SNIFF_BYTES, 'binary-scanned'])
+    return hashlib.sha1(settings.encode('utf-8')).hexdigest()
+
+def load_cache(path, max_bytes):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if cache.get('fingerprint') != _fingerprint(max_bytes):
+        return {}
+    return cache.get('files', {})
+
+def save_cache(path, files, max_bytes):
+    try:
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'fingerprint': _fingerprint(max_bytes), 'files': files}, f)
+    except OSError as e:
+        print(f"⚠️  Could not save the scan cache: {e}")
+
+def scan_files(paths, jobs=1, cache=None, max_bytes=MAX_FILE_MB * 1024 * 1024):
+    """Scan paths, reusing results in cache for unchanged files; returns (issues, stats)
+
+    cache maps path -> [size, mtime_ns, status, issues] and is updated in place.
+    """
+    started = time.perf_counter()
+    stats = {'files': len(paths), 'cached': 0, 'bytes': 0, 'binary': [], 'oversize': [], 'unreadable': []}
+    results = []
+    pending = []
+    stamps = {}
+    for filepath in paths:
+        try:
+            stat = os.stat(filepath)
+            stamps[filepath] = [stat.st_size, stat.st_mtime_ns]
+        except OSError:
+            pass
+        cached = cache.get(filepath) if cache is not None else None
+        if cached is not None and cached[:2] == stamps.get(filepath):
+            stats['cached'] += 1
+            results.append((filepath, cached[2], cached[3], 0))
+        else:
+            pending.append(filepath)
+
+    if jobs > 1 and len(pending) >= PARALLEL_MIN_FILES:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            chunksize = max(1, len(pending) // (jobs * 8))
+            scanned = list(pool.map(_scan_file, pending, [max_bytes] * len(pending), chunksize=chunksize))
+    else:
+        scanned = [_scan_file(filepath, max_bytes) for filepath in pending]
+
+    for result in scanned:
+        filepath, status, issues, size = result
+        stats['bytes'] += size
+        if cache is not None and filepath in stamps:
+            cache[filepath] = stamps[filepath] + [status, issues]
+    results.extend(scanned)
+
+    all_issues = []
+    for filepath, status, issues, size in results:
+        if status != 'scanned':
+            stats[status].append(filepath)
+        all_issues.extend(issues)
+    stats['seconds'] = time.perf_counter() - started
+    return all_issues, stats
+
+def scan_directory(directory='.', jobs=1, cache=None):
+    """Scan directory for potential security issues"""
+    return scan_files(collect_files(directory), jobs=jobs, cache=cache)[0]
 
 def check_env_file():
     """Check if .env exists and is in .gitignore"""
     issues = []
-    
+
     if os.path.exists('.env'):
         # Check .gitignore
         if os.path.exists('.gitignore'):
@@ -90,13 +228,25 @@ def check_env_file():
                 'type': 'error',
                 'message': '.env file exists but .gitignore not found!'
             })
-    
+
     return issues
 
 def main():
+    parser = argparse.ArgumentParser(description="Scan the project for exposed API keys")
+    parser.add_argument('--changed', action='store_true',
+                        help="only scan files git reports as staged, modified or untracked")
+    parser.add_argument('--incremental', action='store_true',
+                        help=f"reuse results for files unchanged since the last --incremental run ({CACHE_PATH})")
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1,
+                        help="processes scanning files in parallel (default: CPU count)")
+    parser.add_argument('--max-file-mb', type=float, default=MAX_FILE_MB,
+                        help="skip files larger than this (default: SECURITY_SCAN_MAX_FILE_MB or 20)")
+    args = parser.parse_args()
+    max_bytes = args.max_file_mb * 1024 * 1024
+
     print("Security Check - Scanning for exposed credentials...\n")
     print("=" * 60)
-    
+
     # Check .env file
     env_issues = check_env_file()
     if env_issues:
@@ -106,11 +256,36 @@ def main():
             else:
                 print(f"⚠️  {issue['message']}")
         print()
-    
+
     # Scan for API keys
     print("Scanning files for API keys...")
-    issues = scan_directory()
-    
+    paths = None
+    if args.changed:
+        paths = changed_files()
+        if paths is None:
+            print("⚠️  Could not get the changed files from git; scanning every file")
+    if paths is None:
+        paths = collect_files()
+
+    cache = load_cache(CACHE_PATH, max_bytes) if args.incremental else None
+    issues, stats = scan_files(paths, jobs=args.jobs, cache=cache, max_bytes=max_bytes)
+    if cache is not None:
+        if not args.changed:
+            # Forget files that no longer exist
+            cache = {path: cache[path] for path in paths if path in cache}
+        save_cache(CACHE_PATH, cache, max_bytes)
+
+    seconds = stats['seconds']
+    print(f"Checked {stats['files']} files ({stats['cached']} unchanged since the last run, "
+          f"{stats['bytes'] / (1024 * 1024):.1f} MB read) in {seconds:.2f}s "
+          f"({stats['files'] / seconds if seconds else 0:.0f} files/s)")
+    for path in stats['oversize']:
+        print(f"⚠️  Skipped (larger than {args.max_file_mb:g} MB): {path}")
+    for path in stats['binary']:
+        print(f"ℹ️  Binary file, scanned with NUL bytes removed: {path}")
+    for path in stats['unreadable']:
+        print(f"⚠️  Could not read: {path}")
+
     if issues:
         print(f"\n[ERROR] Found {len(issues)} potential security issues:\n")
         for issue in issues:
@@ -118,7 +293,7 @@ def main():
             print(f"  Line: {issue['line']}")
             print(f"  Match: {issue['match']}")
             print()
-        
+
         print("[WARNING] Do not commit these files!")
         print("   Remove API keys and use environment variables instead.\n")
         return 1
@@ -129,4 +304,3 @@ def main():
 
 if __name__ == '__main__':
     sys.exit(main())
-
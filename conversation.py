@@ -0,0 +1,178 @@
+"""
+Multi-turn conversation history for the Mental Health FAQ Chatbot
+Recent turns are kept verbatim; older turns are folded one at a time into a
+bounded rolling summary, so the history added to a prompt stays the same size
+however long the conversation runs. Sessions live server-side in an LRU store.
+"""
+import os
+import re
+import secrets
+import threading
+import time
+from collections import OrderedDict, deque
+
+from prompt_builder import estimate_tokens
+
+# Token budget for the verbatim recent turns and for the rolling summary
+HISTORY_TOKEN_BUDGET = int(os.getenv('HISTORY_TOKEN_BUDGET', 600))
+SUMMARY_TOKEN_BUDGET = int(os.getenv('SUMMARY_TOKEN_BUDGET', 200))
+# At most this many turns are kept verbatim
+HISTORY_RECENT_TURNS = int(os.getenv('HISTORY_RECENT_TURNS', 3))
+
+# Server-side sessions: idle sessions expire, and the least recently used go first when full
+SESSION_MAX_COUNT = int(os.getenv('SESSION_MAX_COUNT', 10000))
+SESSION_TTL = float(os.getenv('SESSION_TTL', 1800))
+
+# Folded turns keep the question and the first sentence of the answer
+SUMMARY_QUESTION_CHARS = 150
+SUMMARY_ANSWER_CHARS = 200
+SENTENCE_END_PATTERN = re.compile(r'(?<=[.!?])\s')
+
+
+def _shorten(text, max_chars):
+    """Collapse whitespace and cut text to max_chars on a word boundary"""
+    text = ' '.join(text.split())
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars].rsplit(' ', 1)[0] + '…'
+
+
+def summarize_turn(user_message, assistant_message):
+    """Compress one turn into a single summary line"""
+    first_sentence = SENTENCE_END_PATTERN.split(assistant_message.strip(), 1)[0]
+    return (f"- User asked: {_shorten(user_message, SUMMARY_QUESTION_CHARS)} "
+            f"Assistant said: {_shorten(first_sentence, SUMMARY_ANSWER_CHARS)}")
+
+
+class Conversation:
+    """History of one chat session"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (user_message, assistant_message, tokens) for the verbatim turns
+        self._recent = deque()
+        self._recent_tokens = 0
+        # (line, tokens) for the folded turns, oldest first
+        self._summary = deque()
+        self._summary_tokens = 0
+        self.turn_count = 0
+
+    def __bool__(self):
+        return self.turn_count > 0
+
+    def add_turn(self, user_message, assistant_message):
+        """Record a finished turn, folding the oldest verbatim turns into the summary"""
+        tokens = estimate_tokens(user_message) + estimate_tokens(assistant_message)
+        with self._lock:
+            self._recent.append((user_message, assistant_message, tokens))
+            self._recent_tokens += tokens
+            self.turn_count += 1
+            # The newest turn always stays verbatim
+            while len(self._recent) > 1 and (len(self._recent) > HISTORY_RECENT_TURNS
+                                             or self._recent_tokens > HISTORY_TOKEN_BUDGET):
+                self._fold_oldest()
+
+    def _fold_oldest(self):
+        # Only the turn leaving the verbatim window is summarized; the summary
+        # built so far is never recomputed
+        user_message, assistant_message, tokens = self._recent.popleft()
+        self._recent_tokens -= tokens
+        line = summarize_turn(user_message, assistant_message)
+        line_tokens = estimate_tokens(line)
+        self._summary.append((line, line_tokens))
+        self._summary_tokens += line_tokens
+        while len(self._summary) > 1 and self._summary_tokens > SUMMARY_TOKEN_BUDGET:
+            _, dropped_tokens = self._summary.popleft()
+            self._summary_tokens -= dropped_tokens
+
+    def last_user_message(self):
+        """Return the most recent user message, or an empty string"""
+        with self._lock:
+            return self._recent[-1][0] if self._recent else ''
+
+    def render(self):
+        """Format the history for the prompt (empty when there is none)"""
+        with self._lock:
+            if not self._recent:
+                return ''
+            parts = ["Conversation so far:\n"]
+            if self._summary:
+                parts.append("Earlier in the conversation:\n")
+                parts.extend(f"{line}\n" for line, _ in self._summary)
+                parts.append("\n")
+            parts.append("Recent messages:\n")
+            for user_message, assistant_message, _ in self._recent:
+                parts.append(f"User: {user_message.strip()}\nAssistant: {assistant_message.strip()}\n\n")
+            return "".join(parts)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'turns': self.turn_count,
+                'recent_turns': len(self._recent),
+                'summary_lines': len(self._summary),
+                'history_tokens': self._recent_tokens + self._summary_tokens,
+            }
+
+
+class SessionStore:
+    """Server-side conversations keyed by session id, with LRU and idle-time eviction"""
+
+    def __init__(self, max_sessions=SESSION_MAX_COUNT, ttl=SESSION_TTL):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        # session_id -> (last_used, Conversation), least recently used first
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self.created = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get_or_create(self, session_id=None):
+        """Return (session_id, conversation), starting a new session if needed"""
+        now = time.monotonic()
+        with self._lock:
+            item = self._sessions.get(session_id) if session_id else None
+            if item is not None and now - item[0] > self.ttl:
+                del self._sessions[session_id]
+                self.expirations += 1
+                item = None
+            if item is None:
+                # Unknown ids are replaced so clients cannot choose their own
+                session_id = secrets.token_urlsafe(16)
+                conversation = Conversation()
+                self.created += 1
+            else:
+                conversation = item[1]
+            self._sessions[session_id] = (now, conversation)
+            self._sessions.move_to_end(session_id)
+            self._evict(now)
+            return session_id, conversation
+
+    def _evict(self, now):
+        # Idle sessions sit at the front, so expiry stops at the first live one
+        while self._sessions:
+            last_used, _ = next(iter(self._sessions.values()))
+            if now - last_used <= self.ttl:
+                break
+            self._sessions.popitem(last=False)
+            self.expirations += 1
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self):
+        """Return counters for the health endpoint"""
+        with self._lock:
+            return {
+                'active': len(self._sessions),
+                'max_sessions': self.max_sessions,
+                'ttl_seconds': self.ttl,
+                'created': self.created,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+            }
+
+
+# Shared by every request in the process
+session_store = SessionStore()
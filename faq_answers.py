@@ -0,0 +1,76 @@
+"""
+Direct FAQ answers that skip the LLM for high-confidence matches
+"""
+import os
+
+from faq_index import get_index
+
+# llm: always call Gemini
+# faq-first: answer straight from the FAQ when the best match is confident enough
+# faq-only: never call Gemini; answer with the best FAQ match that is at all relevant
+CHAT_MODES = ('llm', 'faq-first', 'faq-only')
+CHAT_MODE = os.getenv('CHAT_MODE', 'llm').lower()
+if CHAT_MODE not in CHAT_MODES:
+    raise ValueError(f"CHAT_MODE must be one of {', '.join(CHAT_MODES)}, got '{CHAT_MODE}'")
+
+FAQ_MATCH_THRESHOLD = float(os.getenv('FAQ_MATCH_THRESHOLD', 0.75))
+# No FAQ answer is given below this confidence in any mode (including the overload
+# fallback); an unrelated answer to a message in distress is worse than none
+FAQ_MIN_CONFIDENCE = float(os.getenv('FAQ_MIN_CONFIDENCE', 0.3))
+FAQ_ANSWER_PREFACE = os.getenv('FAQ_ANSWER_PREFACE', 'true').lower() in ('1', 'true', 'yes')
+
+PREFACE_TEMPLATE = "Thank you for reaching out. Here is what our FAQ says about \"{question}\":\n\n"
+
+NO_MATCH_MESSAGE = (
+    "I'm sorry, I couldn't find an answer to that in our FAQ right now. "
+    "Please try rephrasing your question, or reach out to a qualified mental health professional. "
+    "If you're in crisis, please contact emergency services or a crisis hotline immediately."
+)
+
+
+def find_faq_answer(user_question, faq_data, threshold=FAQ_MATCH_THRESHOLD, results=None):
+    """Return the best FAQ entry and its confidence; the entry is None below threshold"""
+    index = get_index(faq_data)
+    # results may be passed in when retrieval already ran (e.g. for a batch); either
+    # way they come from the question as typed, never from guessed typo corrections
+    if results is None:
+        results = index.search(user_question, top_n=1, typo_correction=False)
+    if not results:
+        return None, 0.0
+    entry = faq_data[results[0][1]]
+    confidence = index.match_confidence(user_question, entry['question'])
+    if confidence < threshold:
+        return None, confidence
+    return entry, confidence
+
+
+def format_faq_answer(entry, preface=FAQ_ANSWER_PREFACE):
+    """Render a FAQ entry as a chatbot reply"""
+    answer = entry['answer'].strip()
+    if preface:
+        return PREFACE_TEMPLATE.format(question=entry['question'].strip()) + answer
+    return answer
+
+
+def get_faq_response(user_question, faq_data, mode=CHAT_MODE, results=None):
+    """Answer from the FAQ without the LLM when the mode allows it, or return None"""
+    if mode == 'llm':
+        return None
+    # faq-only settles for a weaker match rather than calling the LLM, but not an unrelated one
+    threshold = FAQ_MIN_CONFIDENCE if mode == 'faq-only' else max(FAQ_MATCH_THRESHOLD, FAQ_MIN_CONFIDENCE)
+    entry, confidence = find_faq_answer(user_question, faq_data, threshold, results)
+    if entry is not None:
+        return {
+            'response': format_faq_answer(entry),
+            'source': 'faq',
+            'question_id': entry['question_id'],
+            'confidence': round(confidence, 4),
+        }
+    if mode == 'faq-only':
+        return {
+            'response': NO_MATCH_MESSAGE,
+            'source': 'faq',
+            'question_id': None,
+            'confidence': 0.0,
+        }
+    return None
@@ -0,0 +1,343 @@
+"""
+Inverted-index retrieval for the FAQ database
+Builds BM25 postings over the question and answer fields once at load time
+"""
+import hashlib
+import math
+import os
+import re
+import threading
+from collections import Counter
+from functools import lru_cache
+
+import numpy as np
+
+from faq_spelling import CORRECTION_WEIGHTS, TermCorrector, known_words
+
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Questions are short and precise, so a hit there counts more than in an answer
+FIELD_WEIGHTS = {
+    'question': 2.0,
+    'answer': 1.0,
+}
+
+# Postings are stored in descending impact order; very common terms only
+# contribute their strongest documents so query time stays bounded
+MAX_POSTINGS_PER_TERM = 1000
+
+# search_batch scores up to this many (query, document) pairs in one matrix, and
+# only when at least 1 / BATCH_MIN_DENSITY of the pairs have postings
+BATCH_MATRIX_CELLS = 1 << 21
+BATCH_MIN_DENSITY = 8
+
+# Match misspelled query words to the closest FAQ word ('anxeity' -> 'anxiety') in
+# retrieval; direct FAQ answers and match confidence always use the words as typed
+FAQ_TYPO_CORRECTION = os.getenv('FAQ_TYPO_CORRECTION', 'true').lower() == 'true'
+
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+
+STOP_WORDS = frozenset("""
+a about above after again against all am an and any are aren as at be because
+been before being below between both but by can could did didn do does doesn
+doing don down during each few for from further had has have having he her here
+hers herself him himself his how i if in into is isn it its itself just ll me
+more most my myself no nor not now of off on once only or other our ours
+ourselves out over own re s same she should so some such t than that the their
+theirs them themselves then there these they this those through to too under
+until up ve very was we were what when where which while who whom why will with
+would you your yours yourself yourselves
+""".split())
+
+SUFFIXES = ('ation', 'ness', 'ion', 'ing', 'ive', 'ed', 'ly')
+
+# Negations flip the meaning of a question; retrieval drops them, but
+# match_confidence keeps every word after one (up to the end of the clause) apart
+NEGATIONS = frozenset("""
+no not nor never none nothing nobody nowhere neither cannot without
+""".split())
+CLAUSE_BREAKS = frozenset('.,;:!?') | {'but', 'although', 'though', 'however'}
+CLAUSE_PATTERN = re.compile(r"[a-z0-9]+|[.,;:!?]")
+CONTRACTED_NOT = re.compile(r"n['\u2019]t\b")
+
+
+@lru_cache(maxsize=65536)
+def stem(token):
+    """Strip common English suffixes so 'depressed' and 'depression' match"""
+    if len(token) > 4:
+        if token.endswith('ies'):
+            token = token[:-3] + 'y'
+        elif token.endswith('sses'):
+            token = token[:-2]
+        elif token.endswith('s') and not token.endswith(('ss', 'us', 'is')):
+            token = token[:-1]
+    for suffix in SUFFIXES:
+        if token.endswith(suffix) and len(token) - len(suffix) >= 4:
+            return token[:-len(suffix)]
+    return token
+
+
+def tokenize(text):
+    """Lowercase text and split it into stemmed, stop-word-filtered tokens"""
+    return [stem(t) for t in TOKEN_PATTERN.findall(text.lower()) if t not in STOP_WORDS]
+
+
+def negation_aware_tokens(text):
+    """Like tokenize, with 'not_' before the words a negation applies to"""
+    text = CONTRACTED_NOT.sub(' not', text.lower()).replace('cannot', 'can not')
+    tokens = []
+    negated = False
+    for word in CLAUSE_PATTERN.findall(text):
+        if word in CLAUSE_BREAKS:
+            negated = False
+        elif word in NEGATIONS:
+            negated = True
+        elif word not in STOP_WORDS:
+            tokens.append('not_' + stem(word) if negated else stem(word))
+    return tokens
+
+
+def top_positions(scores, top_n):
+    """Positions of the top_n highest scores, best first"""
+    if top_n <= 0:
+        return np.zeros(0, dtype=np.int64)
+    if len(scores) > top_n:
+        # Everything tied with the top_n-th score stays a candidate, so ties go to the lowest position
+        kth = np.partition(scores, len(scores) - top_n)[len(scores) - top_n]
+        candidates = np.flatnonzero(scores >= kth)
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.argsort(-scores[candidates], kind='stable')][:top_n]
+
+
+def faq_version(faq_data):
+    """Return a short content hash identifying this version of the FAQ data"""
+    digest = hashlib.sha1()
+    for entry in faq_data:
+        for field in ('question_id', 'question', 'answer'):
+            digest.update(str(entry.get(field, '')).encode('utf-8'))
+            digest.update(b'\0')
+    return digest.hexdigest()[:12]
+
+
+class FAQIndex:
+    """BM25F inverted index over FAQ questions and answers"""
+
+    def __init__(self, faq_data, k1=BM25_K1, b=BM25_B, field_weights=None,
+                 max_postings=MAX_POSTINGS_PER_TERM, typo_correction=FAQ_TYPO_CORRECTION):
+        field_weights = field_weights or FIELD_WEIGHTS
+        self.size = len(faq_data)
+        self.version = faq_version(faq_data)
+        self.max_postings = max_postings
+
+        # Tokenize every field once and remember document lengths per field
+        field_tfs = {field: [] for field in field_weights}
+        field_lengths = {field: [] for field in field_weights}
+        # Unstemmed words per document, for typo correction
+        word_frequencies = Counter()
+        for entry in faq_data:
+            entry_words = set()
+            for field in field_weights:
+                words = [t for t in TOKEN_PATTERN.findall(entry.get(field, '').lower()) if t not in STOP_WORDS]
+                tokens = [stem(word) for word in words]
+                field_tfs[field].append(Counter(tokens))
+                field_lengths[field].append(len(tokens))
+                entry_words.update(words)
+            if typo_correction:
+                word_frequencies.update(entry_words)
+
+        avg_lengths = {
+            field: (sum(lengths) / len(lengths) if lengths and sum(lengths) else 1.0)
+            for field, lengths in field_lengths.items()
+        }
+
+        # Combine length-normalized term frequencies across fields (BM25F)
+        weighted_tfs = {}
+        for field, weight in field_weights.items():
+            avg_length = avg_lengths[field]
+            for doc_id, tfs in enumerate(field_tfs[field]):
+                norm = 1 - b + b * field_lengths[field][doc_id] / avg_length
+                for term, tf in tfs.items():
+                    docs = weighted_tfs.setdefault(term, {})
+                    docs[doc_id] = docs.get(doc_id, 0.0) + weight * tf / norm
+
+        # Precompute per-document impacts so a query is just a sum of lookups.
+        # Every posting list lives in two flat arrays (doc ids and impacts, strongest
+        # first) addressed by per-term offsets
+        self._terms = {}
+        self._idf = {}
+        offsets = [0]
+        doc_chunks = []
+        impact_chunks = []
+        for term, docs in weighted_tfs.items():
+            df = len(docs)
+            idf = math.log(1 + (self.size - df + 0.5) / (df + 0.5))
+            self._terms[term] = len(self._terms)
+            self._idf[term] = idf
+            doc_ids = np.fromiter(docs.keys(), dtype=np.int32, count=df)
+            tfs = np.fromiter(docs.values(), dtype=np.float64, count=df)
+            impacts = idf * tfs * (k1 + 1) / (tfs + k1)
+            order = np.argsort(-impacts, kind='stable')
+            doc_chunks.append(doc_ids[order])
+            impact_chunks.append(impacts[order])
+            offsets.append(offsets[-1] + df)
+        self._offsets = np.array(offsets, dtype=np.int64)
+        self._doc_ids = np.concatenate(doc_chunks) if doc_chunks else np.zeros(0, dtype=np.int32)
+        self._impacts = (np.concatenate(impact_chunks) if impact_chunks else np.zeros(0)).astype(np.float32)
+
+        # Trigram index over the unstemmed vocabulary for words the postings do not contain
+        self._corrector = None
+        if typo_correction and known_words() is not None:
+            self._corrector = TermCorrector(word_frequencies)
+
+    def __len__(self):
+        return self.size
+
+    def correct(self, word, typo_correction=True):
+        """Return (indexed term, weight) for an unstemmed query word, or None if nothing is close"""
+        term = stem(word)
+        if term in self._terms:
+            return term, 1.0
+        if not typo_correction or self._corrector is None:
+            return None
+        correction = self._corrector.correct(word)
+        if correction is None:
+            return None
+        corrected, distance = correction
+        term = stem(corrected)
+        if term not in self._terms:
+            return None
+        return term, CORRECTION_WEIGHTS[distance]
+
+    def query_terms(self, query, typo_correction=True):
+        """Return {indexed term: weight} for the query, with misspelled words corrected"""
+        terms = {}
+        for word in set(TOKEN_PATTERN.findall(query.lower())) - STOP_WORDS:
+            match = self.correct(word, typo_correction)
+            if match is not None:
+                term, weight = match
+                terms[term] = max(weight, terms.get(term, 0.0))
+        return terms
+
+    def _postings(self, term, weight):
+        """Return the strongest postings of term as (doc ids, weighted impacts)"""
+        term_id = self._terms[term]
+        start = int(self._offsets[term_id])
+        end = min(int(self._offsets[term_id + 1]), start + self.max_postings)
+        return self._doc_ids[start:end], self._impacts[start:end] * weight
+
+    def search(self, query, top_n=3, typo_correction=True):
+        """Return up to top_n (score, doc_id) pairs for the query, best first"""
+        return self._rank(self._query_postings(query, typo_correction), top_n)
+
+    def _query_postings(self, query, typo_correction=True):
+        return [self._postings(term, weight) for term, weight in self.query_terms(query, typo_correction).items()]
+
+    def _rank(self, postings, top_n):
+        """Sum the postings of one query per document and return the top_n"""
+        if not postings:
+            return []
+        if len(postings) == 1:
+            # A single posting list is already sorted by impact
+            doc_ids, scores = postings[0]
+            return [(float(score), int(doc_id)) for doc_id, score in zip(doc_ids[:top_n], scores[:top_n])]
+
+        # Sum impacts per document over all query terms
+        doc_ids, inverse = np.unique(np.concatenate([ids for ids, _ in postings]), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate([impacts for _, impacts in postings]))
+        best = top_positions(scores, top_n)
+        return [(float(scores[i]), int(doc_ids[i])) for i in best]
+
+    def search_batch(self, queries, top_n=3, typo_correction=True):
+        """Search many queries at once; returns one (score, doc_id) list per query
+
+        A block of queries whose postings cover enough of the corpus is scored
+        as a whole: one bincount sums every posting into a queries x documents
+        matrix, and each argmax over it ranks the next document of every query.
+        Queries matching few documents of a large corpus are searched one by one.
+        """
+        postings = [self._query_postings(query, typo_correction) for query in queries]
+        block_rows = max(1, BATCH_MATRIX_CELLS // max(1, self.size))
+        results = []
+        for first in range(0, len(postings), block_rows):
+            block = postings[first:first + block_rows]
+            matched = sum(len(doc_ids) for query in block for doc_ids, _ in query)
+            if matched * BATCH_MIN_DENSITY >= len(block) * self.size:
+                results.extend(self._rank_matrix(block, top_n))
+            else:
+                results.extend(self._rank(query, top_n) for query in block)
+        return results
+
+    def _rank_matrix(self, block, top_n):
+        """Rank a block of queries' postings together through one dense score matrix"""
+        ranked = [[] for _ in block]
+        keys = [doc_ids + np.int64(row * self.size) for row, query in enumerate(block) for doc_ids, _ in query]
+        if not keys:
+            return ranked
+        impacts = [impacts for query in block for _, impacts in query]
+        scores = np.bincount(np.concatenate(keys), weights=np.concatenate(impacts),
+                             minlength=len(block) * self.size).reshape(len(block), self.size)
+        rows = np.arange(len(block))
+        for _ in range(min(top_n, self.size)):
+            # argmax takes the lowest document id among ties, like search
+            best = scores.argmax(axis=1)
+            best_scores = scores[rows, best]
+            found = best_scores > 0
+            if not found.any():
+                break
+            for row, score, doc_id in zip(rows[found].tolist(), best_scores[found].tolist(), best[found].tolist()):
+                ranked[row].append((score, doc_id))
+            scores[rows, best] = 0.0
+        return ranked
+
+    def match_confidence(self, query, question):
+        """Score in [0, 1] for how closely the query restates a FAQ question"""
+        # IDF-weighted Jaccard overlap: rare shared words count for more than
+        # common ones, and extra words on either side lower the score.
+        # Words are compared as typed: a guessed correction must never make a
+        # question look like an exact match. Negated words only match negated
+        # words, so "what does not cause ..." is far from "what causes ..."
+        query_terms = set(negation_aware_tokens(query))
+        question_terms = set(negation_aware_tokens(question))
+        union = query_terms | question_terms
+        if not union:
+            return 0.0
+        # Terms unseen in the corpus get the highest possible IDF
+        default_idf = math.log(1 + (self.size + 0.5) / 0.5)
+
+        def idf(term):
+            return self._idf.get(term[4:] if term.startswith('not_') else term, default_idf)
+
+        total = sum(idf(term) for term in union)
+        shared = sum(idf(term) for term in query_terms & question_terms)
+        return shared / total
+
+
+# Indexes are keyed by the identity of the FAQ list they were built from
+_indexes = {}
+_indexes_lock = threading.Lock()
+MAX_CACHED_INDEXES = 4
+
+
+def register_index(faq_data, index):
+    """Register a prebuilt index (e.g. from a snapshot) for faq_data"""
+    with _indexes_lock:
+        _indexes[id(faq_data)] = (faq_data, index)
+        while len(_indexes) > MAX_CACHED_INDEXES:
+            del _indexes[next(iter(_indexes))]
+    return index
+
+
+def build_index(faq_data):
+    """Build the retrieval index for faq_data and register it for reuse"""
+    return register_index(faq_data, FAQIndex(faq_data))
+
+
+def get_index(faq_data):
+    """Return the index built for faq_data, building it on first use"""
+    cached = _indexes.get(id(faq_data))
+    if cached is not None and cached[0] is faq_data and len(cached[1]) == len(faq_data):
+        return cached[1]
+    return build_index(faq_data)
@@ -0,0 +1,208 @@
+"""
+Streaming, bounded-memory ingestion of FAQ data
+Reads CSV, JSON Lines and JSON array files row by row, repairs and validates
+entries, drops duplicate question IDs and yields the results in chunks.
+
+Usage:
+    python faq_ingest.py <source> [output.json]
+"""
+import csv
+import json
+import os
+import re
+import sys
+
+DEFAULT_CHUNK_SIZE = 1000
+READ_BUFFER_SIZE = 1 << 16
+
+# Column names used by Mental_Health_FAQ.csv, mapped onto runtime field names
+CSV_COLUMNS = {
+    'Question_ID': 'question_id',
+    'Questions': 'question',
+    'Answers': 'answer',
+}
+
+# UTF-8 text that was decoded as Windows-1252 turns each multi-byte character
+# into a lead byte in Â-ô followed by one to three continuation characters,
+# e.g. 'â€™' for a right single quote
+MOJIBAKE_PATTERN = re.compile(
+    '[Â-ô]'
+    '[\u0080-¿ŒœŠšŸŽžƒˆ˜'
+    '–—‘-„†-•…‰‹›€™]{1,3}'
+)
+
+
+def _to_cp1252_bytes(text):
+    """Encode as Windows-1252, passing through the five bytes it leaves undefined"""
+    data = bytearray()
+    for char in text:
+        try:
+            data += char.encode('cp1252')
+        except UnicodeEncodeError:
+            data.append(ord(char))
+    return bytes(data)
+
+
+def _repair_match(match):
+    text = match.group()
+    try:
+        return _to_cp1252_bytes(text).decode('utf-8')
+    except (UnicodeError, ValueError):
+        return text
+
+
+def repair_mojibake(text):
+    """Undo UTF-8 text that was mis-decoded as Windows-1252"""
+    if not MOJIBAKE_PATTERN.search(text):
+        return text
+    return MOJIBAKE_PATTERN.sub(_repair_match, text)
+
+
+def iter_csv_rows(path):
+    """Yield raw rows from a FAQ CSV file one at a time"""
+    with open(path, 'r', encoding='utf-8', errors='replace', newline='') as f:
+        for row in csv.DictReader(f):
+            yield {field: row.get(column) for column, field in CSV_COLUMNS.items()}
+
+
+def iter_jsonl_rows(path):
+    """Yield raw rows from a JSON Lines file one at a time"""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def iter_json_array_rows(path, buffer_size=READ_BUFFER_SIZE):
+    """Yield the objects of a top-level JSON array without loading the whole file"""
+    decoder = json.JSONDecoder()
+    with open(path, 'r', encoding='utf-8') as f:
+        buffer = f.read(buffer_size).lstrip()
+        if not buffer.startswith('['):
+            raise ValueError(f"{path} does not contain a JSON array")
+        buffer = buffer[1:]
+        eof = False
+        while True:
+            buffer = buffer.lstrip().lstrip(',').lstrip()
+            if buffer.startswith(']'):
+                return
+            try:
+                item, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                # The next item is not complete yet; read more of the file
+                if eof:
+                    raise
+                more = f.read(buffer_size)
+                eof = not more
+                buffer += more
+                continue
+            yield item
+            buffer = buffer[end:]
+
+
+def iter_rows(path):
+    """Pick a row reader from the file extension"""
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.csv':
+        return iter_csv_rows(path)
+    if extension in ('.jsonl', '.ndjson'):
+        return iter_jsonl_rows(path)
+    return iter_json_array_rows(path)
+
+
+def normalize_entry(row):
+    """Validate a raw row and return a cleaned FAQ entry, or None if unusable"""
+    if not isinstance(row, dict):
+        return None
+    entry = {}
+    for field in ('question_id', 'question', 'answer'):
+        value = row.get(field)
+        if value is None:
+            return None
+        value = repair_mojibake(str(value)).strip()
+        if not value or value.lower() == 'nan':
+            return None
+        entry[field] = value
+    return entry
+
+
+class IngestStats:
+    """Counters collected while ingesting a file"""
+
+    def __init__(self):
+        self.rows = 0
+        self.accepted = 0
+        self.invalid = 0
+        self.duplicates = 0
+
+    def as_dict(self):
+        return {
+            'rows': self.rows,
+            'accepted': self.accepted,
+            'invalid': self.invalid,
+            'duplicates': self.duplicates,
+        }
+
+
+def ingest(rows, chunk_size=DEFAULT_CHUNK_SIZE, stats=None):
+    """Normalize and deduplicate rows, yielding lists of at most chunk_size entries"""
+    stats = stats if stats is not None else IngestStats()
+    seen_ids = set()
+    chunk = []
+    for row in rows:
+        stats.rows += 1
+        entry = normalize_entry(row)
+        if entry is None:
+            stats.invalid += 1
+            continue
+        if entry['question_id'] in seen_ids:
+            stats.duplicates += 1
+            continue
+        seen_ids.add(entry['question_id'])
+        stats.accepted += 1
+        chunk.append(entry)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def load_faq_file(path, chunk_size=DEFAULT_CHUNK_SIZE, stats=None):
+    """Stream a CSV, JSON Lines or JSON file into the runtime list of FAQ entries"""
+    faq_data = []
+    for chunk in ingest(iter_rows(path), chunk_size, stats):
+        faq_data.extend(chunk)
+    return faq_data
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("Usage: python faq_ingest.py <source> [output.json]")
+        return 1
+    source_path = sys.argv[1]
+    output_path = sys.argv[2] if len(sys.argv) > 2 else None
+    stats = IngestStats()
+
+    if output_path:
+        # Write entries as they arrive so the output never sits in memory
+        with open(output_path, 'w', encoding='utf-8') as f:
+            f.write('[')
+            first = True
+            for chunk in ingest(iter_rows(source_path), stats=stats):
+                for entry in chunk:
+                    f.write('\n  ' if first else ',\n  ')
+                    f.write(json.dumps(entry, ensure_ascii=False))
+                    first = False
+            f.write('\n]\n')
+    else:
+        for _ in ingest(iter_rows(source_path), stats=stats):
+            pass
+
+    print(json.dumps(stats.as_dict(), indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
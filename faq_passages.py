@@ -0,0 +1,139 @@
+"""
+Passage-level segmentation and retrieval of FAQ answers
+Long answers are split into paragraph-sized passages that keep their
+question_id, so prompts can include only the parts of an answer that match.
+"""
+import os
+import re
+import threading
+
+from faq_index import FAQIndex, faq_version
+from faq_store import CompactFAQ
+
+# Passages grow paragraph by paragraph up to this size; longer paragraphs are
+# split between sentences
+PASSAGE_MAX_CHARS = int(os.getenv('PASSAGE_MAX_CHARS', 600))
+# A passage shorter than this always takes the next paragraph too (e.g. "Here are some tips:")
+PASSAGE_MIN_CHARS = 120
+
+# Passages scoring below this fraction of the best passage are left out of the prompt
+PASSAGE_MIN_SCORE_RATIO = float(os.getenv('PASSAGE_MIN_SCORE_RATIO', 0.4))
+
+PARAGRAPH_PATTERN = re.compile(r'\s*\n\s*')
+SENTENCE_PATTERN = re.compile(r'(?<=[.!?])\s+')
+
+
+def _split_long(paragraph, max_chars):
+    """Split one paragraph between sentences into pieces of at most max_chars"""
+    pieces = []
+    current = ''
+    for sentence in SENTENCE_PATTERN.split(paragraph):
+        if current and len(current) + 1 + len(sentence) > max_chars:
+            pieces.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}" if current else sentence
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def split_passages(text, max_chars=PASSAGE_MAX_CHARS, min_chars=PASSAGE_MIN_CHARS):
+    """Split an answer into paragraph-sized passages"""
+    paragraphs = []
+    for paragraph in PARAGRAPH_PATTERN.split(text.strip()):
+        if paragraph:
+            paragraphs.extend(_split_long(paragraph, max_chars))
+
+    passages = []
+    current = ''
+    for paragraph in paragraphs:
+        if current and len(current) >= min_chars and len(current) + 1 + len(paragraph) > max_chars:
+            passages.append(current)
+            current = paragraph
+        else:
+            current = f"{current}\n{paragraph}" if current else paragraph
+    if current:
+        passages.append(current)
+    return passages
+
+
+def segment_faq(faq_data, max_chars=PASSAGE_MAX_CHARS):
+    """Return the passages of every answer as FAQ-shaped entries
+
+    Each passage keeps the question_id and question of its entry, its answer
+    text is the passage alone, and part numbers its position in the answer.
+    """
+    passages = []
+    for entry in faq_data:
+        for part, text in enumerate(split_passages(entry['answer'], max_chars)):
+            passages.append({
+                'question_id': entry['question_id'],
+                'question': entry['question'],
+                'answer': text,
+                'part': part,
+                'passage_id': f"{entry['question_id']}#{part}",
+            })
+    return passages
+
+
+class PassageIndex:
+    """BM25F retrieval over answer passages instead of whole entries"""
+
+    def __init__(self, faq_data, max_chars=PASSAGE_MAX_CHARS):
+        self.size = len(faq_data)
+        self.version = faq_version(faq_data)
+        self.passages = segment_faq(faq_data, max_chars)
+        self._index = FAQIndex(self.passages)
+        if isinstance(faq_data, CompactFAQ):
+            # Passages would otherwise hold every answer uncompressed again
+            self.passages = CompactFAQ(self.passages)
+
+    def __len__(self):
+        return len(self.passages)
+
+    def _matching(self, results, min_score_ratio):
+        """Keep the passages that score close enough to the best one"""
+        if not results:
+            return []
+        cutoff = results[0][0] * min_score_ratio
+        return [self.passages[doc_id] for score, doc_id in results if score >= cutoff]
+
+    def search(self, query, top_n=3, min_score_ratio=PASSAGE_MIN_SCORE_RATIO):
+        """Return up to top_n matching passages for the query, best first"""
+        return self._matching(self._index.search(query, top_n), min_score_ratio)
+
+    def search_batch(self, queries, top_n=3, min_score_ratio=PASSAGE_MIN_SCORE_RATIO):
+        """Search many queries in one pass; returns one passage list per query"""
+        return [
+            self._matching(results, min_score_ratio)
+            for results in self._index.search_batch(queries, top_n)
+        ]
+
+
+# Passage indexes are keyed by the identity of the FAQ list, like faq_index
+_passage_indexes = {}
+_passage_indexes_lock = threading.Lock()
+MAX_CACHED_PASSAGE_INDEXES = 4
+
+
+def register_passage_index(faq_data, passage_index):
+    """Register a prebuilt passage index (e.g. from a snapshot) for faq_data"""
+    with _passage_indexes_lock:
+        _passage_indexes[id(faq_data)] = (faq_data, passage_index)
+        while len(_passage_indexes) > MAX_CACHED_PASSAGE_INDEXES:
+            del _passage_indexes[next(iter(_passage_indexes))]
+    return passage_index
+
+
+def build_passage_index(faq_data):
+    """Segment faq_data, index its passages and register the result for reuse"""
+    return register_passage_index(faq_data, PassageIndex(faq_data))
+
+
+def get_passage_index(faq_data):
+    """Return the passage index built for faq_data, building it on first use"""
+    cached = _passage_indexes.get(id(faq_data))
+    if cached is not None and cached[0] is faq_data and cached[1].size == len(faq_data):
+        return cached[1]
+    return build_passage_index(faq_data)
@@ -0,0 +1,127 @@
+"""
+Hot reload of FAQ data
+A new FAQ list, its indexes and prompt template are built off the request
+path and swapped in with one reference assignment, so in-flight requests
+finish on the version they started with.
+"""
+import os
+import threading
+import time
+
+from faq_index import get_index
+from response_cache import invalidate_version
+
+# Seconds between checks of the FAQ files for changes; 0 turns the watcher off
+FAQ_RELOAD_INTERVAL = float(os.getenv('FAQ_RELOAD_INTERVAL', 5))
+
+
+class FAQReloader:
+    """Watches the FAQ source files and swaps in a rebuilt version when they change"""
+
+    def __init__(self, loader, paths, on_swap, interval=FAQ_RELOAD_INTERVAL):
+        # loader() returns FAQ data with its indexes and template already registered
+        self._loader = loader
+        self._paths = tuple(paths)
+        self._on_swap = on_swap
+        self.interval = interval
+        # One reload at a time; requests never wait on this lock
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._stamps = None
+        self.version = None
+        self.reloads = 0
+        self.failures = 0
+        self.last_duration = None
+        self.last_reload_at = None
+        self.last_error = None
+
+    def _file_stamps(self):
+        stamps = []
+        for path in self._paths:
+            try:
+                stat = os.stat(path)
+                stamps.append((stat.st_size, stat.st_mtime_ns))
+            except OSError:
+                stamps.append(None)
+        return stamps
+
+    def start(self, faq_data):
+        """Record the version loaded at startup and start watching for changes"""
+        self.version = get_index(faq_data).version
+        self._stamps = self._file_stamps()
+        if self.interval > 0 and self._thread is None:
+            self._thread = threading.Thread(target=self._watch, name='faq-reload', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stop watching, waiting for a reload in progress to finish"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def resume(self):
+        """Watch again after stop(), e.g. in a forked worker; files changed since the
+        last load are reloaded at the first check"""
+        if self.interval > 0 and self._thread is None:
+            self._stop = threading.Event()
+            self._thread = threading.Thread(target=self._watch, name='faq-reload', daemon=True)
+            self._thread.start()
+
+    def _watch(self):
+        while not self._stop.wait(self.interval):
+            if self._file_stamps() != self._stamps:
+                self.reload()
+
+    def reload(self):
+        """Rebuild the FAQ data and swap it in; returns a dict describing the outcome"""
+        with self._lock:
+            started = time.perf_counter()
+            # Taken before loading so a write during the load triggers another reload
+            self._stamps = self._file_stamps()
+            try:
+                faq_data = self._loader()
+                if not faq_data:
+                    raise ValueError("no FAQ entries found")
+                version = get_index(faq_data).version
+            except Exception as e:
+                # Keep serving the current version (e.g. the file is mid-write)
+                self.failures += 1
+                self.last_error = str(e)
+                print(f"Warning: FAQ reload failed, keeping version {self.version}: {e}")
+                return {'status': 'error', 'error': str(e), 'version': self.version}
+
+            old_version = self.version
+            # Swapped even when unchanged so the freshly registered indexes stay in use
+            self._on_swap(faq_data)
+            self.version = version
+            changed = version != old_version
+            invalidated = 0
+            if changed:
+                self.reloads += 1
+                # Answers generated from the old content must not be served again
+                invalidated = invalidate_version(old_version)
+            self.last_duration = time.perf_counter() - started
+            self.last_reload_at = time.time()
+            self.last_error = None
+            return {
+                'status': 'reloaded' if changed else 'unchanged',
+                'version': version,
+                'previous_version': old_version,
+                'entries': len(faq_data),
+                'invalidated_answers': invalidated,
+                'duration_seconds': round(self.last_duration, 4),
+            }
+
+    def stats(self):
+        """Return the active version and reload counters for the health endpoint"""
+        return {
+            'version': self.version,
+            'reloads': self.reloads,
+            'failures': self.failures,
+            'last_reload_seconds': round(self.last_duration, 4) if self.last_duration is not None else None,
+            'last_reload_at': self.last_reload_at,
+            'last_error': self.last_error,
+            'watch_interval_seconds': self.interval,
+        }
@@ -0,0 +1,266 @@
+"""
+Precompiled, memory-mapped FAQ snapshot
+faq_data.json / Mental_Health_FAQ.csv stay the source of truth; this compiles
+them (text, retrieval indexes and prompt template) into one versioned binary file
+that servers memory-map at startup instead of re-parsing the source.
+Entry and passage text and the posting arrays of both indexes are read straight
+from the mapping; only the vocabularies and the prompt template are unpickled.
+
+Usage:
+    python faq_snapshot.py [source] [output]
+"""
+import copy
+import json
+import mmap
+import os
+import pickle
+import struct
+import sys
+from array import array
+from collections.abc import Sequence
+
+import numpy as np
+
+from faq_index import FAQIndex, register_index
+from faq_passages import PassageIndex, register_passage_index
+from faq_ingest import load_faq_file
+from prompt_builder import PromptTemplate, register_prompt_template
+
+MAGIC = b'FAQSNAP\0'
+FORMAT_VERSION = 7
+# magic, format version, metadata length
+HEADER = struct.Struct('<8sII')
+FIELDS = ('question_id', 'question', 'answer')
+PASSAGE_FIELDS = FIELDS + ('part', 'passage_id')
+# FAQIndex posting arrays stored as raw sections rather than pickled
+INDEX_ARRAYS = ('_offsets', '_doc_ids', '_impacts')
+
+DEFAULT_SNAPSHOT_PATH = 'faq_data.snapshot'
+
+
+def _source_stamp(source_path):
+    """Size and modification time identifying the source file the snapshot was built from"""
+    stat = os.stat(source_path)
+    return {'path': source_path, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def _align(offset, alignment=8):
+    return (offset + alignment - 1) // alignment * alignment
+
+
+def _pack_text(records, fields):
+    """Every field of every record in one UTF-8 buffer, addressed by offsets"""
+    text = bytearray()
+    offsets = array('Q', [0])
+    for record in records:
+        for field in fields:
+            text += str(record.get(field, '')).encode('utf-8')
+            offsets.append(len(text))
+    return offsets.tobytes(), bytes(text)
+
+
+def _split_index(index, name, sections, arrays):
+    """Move the posting arrays of index into raw sections; returns the index without them"""
+    shell = copy.copy(index)
+    for attribute in INDEX_ARRAYS:
+        values = np.ascontiguousarray(getattr(index, attribute))
+        sections.append((name + attribute, values.tobytes()))
+        arrays[name + attribute] = values.dtype.str
+        setattr(shell, attribute, None)
+    return shell
+
+
+def build_snapshot(faq_data, output_path=DEFAULT_SNAPSHOT_PATH, source_path=None):
+    """Compile FAQ entries, their indexes and prompt template into a snapshot file"""
+    index = FAQIndex(faq_data)
+    passage_index = PassageIndex(faq_data)
+    template = PromptTemplate(version=index.version)
+
+    offsets, text = _pack_text(faq_data, FIELDS)
+    passage_offsets, passage_text = _pack_text(passage_index.passages, PASSAGE_FIELDS)
+    sections = [
+        ('offsets', offsets),
+        ('text', text),
+        ('passage_offsets', passage_offsets),
+        ('passage_text', passage_text),
+    ]
+    arrays = {}
+    index_shell = _split_index(index, 'index', sections, arrays)
+    passage_shell = copy.copy(passage_index)
+    passage_shell._index = _split_index(passage_index._index, 'passages', sections, arrays)
+    passage_shell.passages = None
+    sections += [
+        ('index', pickle.dumps(index_shell, protocol=pickle.HIGHEST_PROTOCOL)),
+        ('passages', pickle.dumps(passage_shell, protocol=pickle.HIGHEST_PROTOCOL)),
+        ('prompt', pickle.dumps(template, protocol=pickle.HIGHEST_PROTOCOL)),
+    ]
+    layout = {}
+    position = 0
+    for name, data in sections:
+        position = _align(position)
+        layout[name] = [position, len(data)]
+        position += len(data)
+
+    metadata = json.dumps({
+        'faq_version': index.version,
+        'count': len(faq_data),
+        'source': _source_stamp(source_path) if source_path else None,
+        'sections': layout,
+        'arrays': arrays,
+    }).encode('utf-8')
+    data_start = _align(HEADER.size + len(metadata))
+
+    # Write to a temporary file and rename so readers never see a partial snapshot
+    tmp_path = f"{output_path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, len(metadata)))
+        f.write(metadata)
+        for name, data in sections:
+            f.seek(data_start + layout[name][0])
+            f.write(data)
+    os.replace(tmp_path, output_path)
+    return index.version
+
+
+class MappedRecords(Sequence):
+    """Read-only sequence of records decoded from mapped offsets and text on access"""
+
+    def __init__(self, offsets, text, fields, count):
+        self._offsets = offsets
+        self._text = text
+        self._fields = fields
+        self._count = count
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [self[i] for i in range(*position.indices(self._count))]
+        if position < 0:
+            position += self._count
+        if not 0 <= position < self._count:
+            raise IndexError('FAQ entry index out of range')
+        base = position * len(self._fields)
+        offsets = self._offsets
+        text = self._text
+        record = {
+            field: str(text[offsets[base + i]:offsets[base + i + 1]], 'utf-8')
+            for i, field in enumerate(self._fields)
+        }
+        if 'part' in record:
+            record['part'] = int(record['part'])
+        return record
+
+
+class FAQSnapshot(MappedRecords):
+    """Read-only, memory-mapped sequence of FAQ entries decoded on access"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, format_version, metadata_length = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or format_version != FORMAT_VERSION:
+            self._mmap.close()
+            raise ValueError(f"{path} is not a version {FORMAT_VERSION} FAQ snapshot")
+        self.metadata = json.loads(self._mmap[HEADER.size:HEADER.size + metadata_length])
+        self.version = self.metadata['faq_version']
+        self._data_start = _align(HEADER.size + metadata_length)
+        super().__init__(self._section('offsets').cast('Q'), self._section('text'), FIELDS,
+                         self.metadata['count'])
+
+    def _section(self, name):
+        offset, length = self.metadata['sections'][name]
+        start = self._data_start + offset
+        return memoryview(self._mmap)[start:start + length]
+
+    def _array(self, name):
+        """Read-only numpy view of a raw array section"""
+        dtype = np.dtype(self.metadata['arrays'][name])
+        section = self._section(name)
+        if not len(section):
+            return np.zeros(0, dtype=dtype)
+        return np.frombuffer(section, dtype=dtype)
+
+    def _restore_index(self, index, name):
+        for attribute in INDEX_ARRAYS:
+            setattr(index, attribute, self._array(name + attribute))
+        return index
+
+    def load_index(self):
+        """Retrieval index whose posting arrays are views of the mapped file"""
+        return self._restore_index(pickle.loads(self._section('index')), 'index')
+
+    def load_passage_index(self):
+        """Passage index whose passages and posting arrays are read from the mapped file"""
+        passage_index = pickle.loads(self._section('passages'))
+        self._restore_index(passage_index._index, 'passages')
+        offsets = self._section('passage_offsets').cast('Q')
+        passage_index.passages = MappedRecords(offsets, self._section('passage_text'), PASSAGE_FIELDS,
+                                               (len(offsets) - 1) // len(PASSAGE_FIELDS))
+        return passage_index
+
+    def load_prompt_template(self):
+        """Unpickle the prompt template stored in the snapshot"""
+        return pickle.loads(self._section('prompt'))
+
+    @property
+    def source_path(self):
+        """Path of the FAQ file the snapshot was built from, or None"""
+        source = self.metadata.get('source')
+        return source['path'] if source else None
+
+    def is_fresh(self, source_path=None):
+        """True when the source file (by default the one recorded at build time) is unchanged"""
+        source = self.metadata.get('source')
+        source_path = source_path or self.source_path
+        if not source or not source_path or not os.path.exists(source_path):
+            return False
+        current = _source_stamp(source_path)
+        return source['size'] == current['size'] and source['mtime_ns'] == current['mtime_ns']
+
+
+def load_snapshot(snapshot_path=DEFAULT_SNAPSHOT_PATH, source_path='faq_data.json'):
+    """Memory-map an up-to-date snapshot and register its indexes, or return None
+
+    The snapshot must match the file it was built from. When that was not
+    source_path (e.g. it was built from the CSV) but source_path now exists,
+    the snapshot is stale too, since the app would load source_path instead.
+    """
+    if not os.path.exists(snapshot_path):
+        return None
+    try:
+        snapshot = FAQSnapshot(snapshot_path)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Warning: could not read {snapshot_path}: {e}")
+        return None
+    built_from = snapshot.source_path
+    if (built_from and source_path and os.path.exists(source_path)
+            and os.path.abspath(built_from) != os.path.abspath(source_path)):
+        print(f"Warning: {snapshot_path} was built from {built_from}, not {source_path}. "
+              f"Run 'python faq_snapshot.py' to rebuild it.")
+        return None
+    if not snapshot.is_fresh():
+        rebuild = f"python faq_snapshot.py {built_from}" if built_from else "python faq_snapshot.py"
+        print(f"Warning: {snapshot_path} is out of date with {built_from or 'its source'}. "
+              f"Run '{rebuild}' to rebuild it.")
+        return None
+    register_index(snapshot, snapshot.load_index())
+    register_passage_index(snapshot, snapshot.load_passage_index())
+    register_prompt_template(snapshot.load_prompt_template())
+    return snapshot
+
+
+def main():
+    source_path = sys.argv[1] if len(sys.argv) > 1 else 'faq_data.json'
+    output_path = sys.argv[2] if len(sys.argv) > 2 else DEFAULT_SNAPSHOT_PATH
+    faq_data = load_faq_file(source_path)
+    version = build_snapshot(faq_data, output_path, source_path=source_path)
+    size_kb = os.path.getsize(output_path) / 1024
+    print(f"Wrote {output_path}: {len(faq_data)} entries, version {version}, {size_kb:.1f} KB")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
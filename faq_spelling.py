@@ -0,0 +1,183 @@
+"""
+Typo-tolerant term lookup for FAQ retrieval
+Query words missing from the FAQ vocabulary ("depresion", "anxeity") are
+matched to FAQ words through a character-trigram index. Only words of a
+similar length that share enough trigrams are checked with a bounded edit
+distance, so a lookup never scans the whole vocabulary.
+
+Only plausible typos are corrected: a word found in a general English
+dictionary (pyspellchecker's) is left alone even when the FAQ never uses it,
+so "kill" never becomes "skill". Without the dictionary nothing is corrected.
+"""
+import heapq
+import threading
+from array import array
+from collections import Counter, OrderedDict
+from itertools import chain
+
+try:
+    from spellchecker import SpellChecker
+except ImportError:
+    SpellChecker = None
+
+# Terms shorter than this are never corrected (too many near neighbours)
+MIN_TERM_LENGTH = 4
+# Longest term looked up; anything longer is left alone
+MAX_TERM_LENGTH = 30
+# At most this many trigram-filtered candidates are checked with edit distance
+MAX_VERIFIED_CANDIDATES = 30
+# Corrected terms count for less than exact matches, by edit distance
+CORRECTION_WEIGHTS = {1: 0.8, 2: 0.6}
+# Corrections remembered per index (misspellings repeat)
+CORRECTION_CACHE_SIZE = 4096
+
+_known_words = None
+_known_words_lock = threading.Lock()
+
+
+def known_words():
+    """Words of a general English dictionary, or None when pyspellchecker is not installed"""
+    global _known_words
+    if _known_words is None:
+        with _known_words_lock:
+            if _known_words is None:
+                if SpellChecker is None:
+                    print("Warning: pyspellchecker is not installed; typo correction is off. "
+                          "Install requirements: pip install -r requirements.txt")
+                    _known_words = frozenset()
+                else:
+                    # Only words a lookup could ever be asked about are kept
+                    _known_words = frozenset(
+                        word for word in SpellChecker(language='en').word_frequency.dictionary
+                        if MIN_TERM_LENGTH <= len(word) <= MAX_TERM_LENGTH and word.isalpha()
+                    )
+    return _known_words or None
+
+
+def max_distance(term):
+    """Edits allowed for a term of this length"""
+    if len(term) < MIN_TERM_LENGTH:
+        return 0
+    return 1 if len(term) <= 7 else 2
+
+
+def trigrams(term):
+    """Character trigrams of term with start and end markers ('^de', 'dep', ..., 'on$')"""
+    padded = f"^{term}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def edit_distance(a, b, limit):
+    """Optimal string alignment distance (adjacent swaps count as one edit), or limit + 1 once exceeded"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        row_best = i
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            value = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                value = min(value, previous2[j - 2] + 1)
+            current[j] = value
+            row_best = min(row_best, value)
+        if row_best > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+class TermCorrector:
+    """Trigram index over a vocabulary that maps misspelled words to known ones"""
+
+    def __init__(self, term_frequencies):
+        # term_frequencies: unstemmed word -> number of documents containing it
+        self._terms = []
+        self._frequencies = array('I')
+        # (length, trigram) -> ids of vocabulary terms of that length containing it
+        grams = {}
+        for term, frequency in term_frequencies.items():
+            if not MIN_TERM_LENGTH - 2 <= len(term) <= MAX_TERM_LENGTH + 2 or not term.isalpha():
+                continue
+            term_id = len(self._terms)
+            self._terms.append(term)
+            self._frequencies.append(min(frequency, 0xFFFFFFFF))
+            for gram in trigrams(term):
+                grams.setdefault((len(term), gram), array('I')).append(term_id)
+        self._grams = grams
+        self._init_cache()
+
+    def _init_cache(self):
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        # Loaded here, at build or unpickling time, rather than on the first request
+        self._dictionary = known_words()
+
+    def __getstate__(self):
+        # Rebuilt when unpickled (e.g. from a snapshot)
+        state = self.__dict__.copy()
+        del state['_cache'], state['_cache_lock'], state['_dictionary']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._init_cache()
+
+    def __len__(self):
+        return len(self._terms)
+
+    def correct(self, term):
+        """Return (vocabulary word, edit distance) closest to a misspelled word, or None
+
+        Dictionary words are real words rather than typos and are never corrected.
+        """
+        if self._dictionary is None or term in self._dictionary:
+            return None
+        with self._cache_lock:
+            if term in self._cache:
+                self._cache.move_to_end(term)
+                return self._cache[term]
+        result = self._lookup(term)
+        with self._cache_lock:
+            self._cache[term] = result
+            while len(self._cache) > CORRECTION_CACHE_SIZE:
+                self._cache.popitem(last=False)
+        return result
+
+    def _lookup(self, term):
+        limit = max_distance(term)
+        if not limit or len(term) > MAX_TERM_LENGTH or not term.isalpha():
+            return None
+        term_grams = trigrams(term)
+        # An edit changes at most three trigrams (four for a swap), so close terms share the rest
+        min_shared = max(1, len(term_grams) - 4 * limit)
+
+        # Only terms of a reachable length are counted, and only through shared trigrams
+        lists = (self._grams.get((length, gram), ())
+                 for length in range(len(term) - limit, len(term) + limit + 1)
+                 for gram in term_grams)
+        counts = Counter(chain.from_iterable(lists))
+        frequencies = self._frequencies
+        candidates = heapq.nlargest(
+            MAX_VERIFIED_CANDIDATES,
+            ((shared, term_id) for term_id, shared in counts.items() if shared >= min_shared),
+            key=lambda candidate: (candidate[0], frequencies[candidate[1]])
+        )
+
+        best = None
+        for shared, term_id in candidates:
+            # Once a match is found, terms sharing too few trigrams cannot be as close
+            if best is not None and shared < len(term_grams) - 4 * best[2]:
+                break
+            distance = edit_distance(term, self._terms[term_id], limit if best is None else best[2])
+            if distance > limit:
+                continue
+            # Fewer edits first, then the term more documents use
+            key = (distance, -frequencies[term_id])
+            if best is None or key < best[0]:
+                best = (key, term_id, distance)
+        if best is None:
+            return None
+        return self._terms[best[1]], best[2]
@@ -0,0 +1,234 @@
+"""
+Compact in-memory FAQ store for large corpora
+Entries are kept column-wise instead of as one dict of str objects each:
+integer question ids in an array, questions interned into one UTF-8 buffer
+addressed by offsets, and answers deflate-compressed and only inflated when an
+entry is read (a small LRU keeps recently used answers). Entries are read-only
+mappings, so code reading entry['answer'] or entry.get('question') is unchanged.
+"""
+import os
+import threading
+import zlib
+from array import array
+from collections import OrderedDict
+from collections.abc import Mapping, Sequence
+
+# FAQ data with at least this many entries is compacted at load time; 0 compacts always
+FAQ_COMPACT_MIN_ENTRIES = int(os.getenv('FAQ_COMPACT_MIN_ENTRIES', 10000))
+# Inflated answers kept per store
+FAQ_ANSWER_CACHE_SIZE = int(os.getenv('FAQ_ANSWER_CACHE_SIZE', 256))
+
+FIELDS = ('question_id', 'question', 'answer')
+PASSAGE_FIELDS = FIELDS + ('part', 'passage_id')
+
+COMPRESSION_LEVEL = 6
+# Raw deflate streams: no zlib header or checksum per answer
+WBITS = -15
+# Answers share most of their vocabulary; a preset dictionary sampled from them
+# lets short answers compress almost as well as one long stream would
+DICTIONARY_BYTES = 32 * 1024
+DICTIONARY_SAMPLE_BYTES = 512
+
+
+def _build_dictionary(answers):
+    """Sample evenly spaced answer prefixes into a deflate preset dictionary"""
+    if not answers:
+        return b''
+    count = max(1, DICTIONARY_BYTES // DICTIONARY_SAMPLE_BYTES)
+    step = max(1, len(answers) // count)
+    samples = [answers[i][:DICTIONARY_SAMPLE_BYTES] for i in range(0, len(answers), step)]
+    # Deflate looks back from the end, so the most useful material goes last
+    return b''.join(samples)[-DICTIONARY_BYTES:]
+
+
+class _TextColumn:
+    """Interned strings in one UTF-8 buffer; each row points at a distinct value"""
+
+    def __init__(self, values):
+        slots = {}
+        chunks = []
+        offsets = array('Q', [0])
+        rows = array('I')
+        for value in values:
+            slot = slots.get(value)
+            if slot is None:
+                slot = slots[value] = len(slots)
+                chunks.append(value.encode('utf-8'))
+                offsets.append(offsets[-1] + len(chunks[-1]))
+            rows.append(slot)
+        self._buffer = b''.join(chunks)
+        self._offsets = offsets
+        self._rows = rows
+
+    def __getitem__(self, row):
+        slot = self._rows[row]
+        return self._buffer[self._offsets[slot]:self._offsets[slot + 1]].decode('utf-8')
+
+    def nbytes(self):
+        return len(self._buffer) + self._offsets.itemsize * len(self._offsets) + self._rows.itemsize * len(self._rows)
+
+
+class _IdColumn:
+    """Question ids as 64-bit integers when every id is a plain decimal number"""
+
+    def __init__(self, values):
+        values = [str(value) for value in values]
+        try:
+            numbers = array('q', (int(value) for value in values))
+            compact = all(str(number) == value for number, value in zip(numbers, values))
+        except (ValueError, OverflowError):
+            compact = False
+        self._numbers = numbers if compact else None
+        self._text = None if compact else _TextColumn(values)
+
+    def __getitem__(self, row):
+        if self._numbers is not None:
+            return str(self._numbers[row])
+        return self._text[row]
+
+    def nbytes(self):
+        if self._numbers is not None:
+            return self._numbers.itemsize * len(self._numbers)
+        return self._text.nbytes()
+
+
+class FAQEntry(Mapping):
+    """Read-only view of one entry; the answer is inflated on access"""
+
+    __slots__ = ('_store', '_row')
+
+    def __init__(self, store, row):
+        self._store = store
+        self._row = row
+
+    def __getitem__(self, field):
+        return self._store.field(self._row, field)
+
+    def __iter__(self):
+        return iter(self._store.fields)
+
+    def __len__(self):
+        return len(self._store.fields)
+
+    def __repr__(self):
+        return f"FAQEntry({dict(self)!r})"
+
+
+class CompactFAQ(Sequence):
+    """Read-only sequence of FAQ entries stored column-wise with compressed answers
+
+    Entries with a 'part' field (answer passages) keep it and derive passage_id.
+    """
+
+    def __init__(self, entries, answer_cache_size=FAQ_ANSWER_CACHE_SIZE):
+        entries = list(entries)
+        self._count = len(entries)
+        self._ids = _IdColumn(entry.get('question_id', '') for entry in entries)
+        self._questions = _TextColumn(str(entry.get('question', '')) for entry in entries)
+        self._parts = None
+        self.fields = FIELDS
+        if entries and 'part' in entries[0]:
+            self._parts = array('I', (entry['part'] for entry in entries))
+            self.fields = PASSAGE_FIELDS
+
+        answers = [str(entry.get('answer', '')).encode('utf-8') for entry in entries]
+        self._dictionary = _build_dictionary(answers)
+        chunks = []
+        offsets = array('Q', [0])
+        # Loading the dictionary is most of the cost of a short stream, so it is done once
+        primed = zlib.compressobj(COMPRESSION_LEVEL, zlib.DEFLATED, WBITS, zdict=self._dictionary)
+        for answer in answers:
+            compressor = primed.copy()
+            chunks.append(compressor.compress(answer) + compressor.flush())
+            offsets.append(offsets[-1] + len(chunks[-1]))
+        self._answers = b''.join(chunks)
+        self._answer_offsets = offsets
+        self.answer_bytes = sum(len(answer) for answer in answers)
+
+        self._answer_cache_size = answer_cache_size
+        self._init_cache()
+
+    def _init_cache(self):
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self.answer_hits = 0
+        self.answer_misses = 0
+
+    def __getstate__(self):
+        # The cache and its lock are rebuilt when unpickled (e.g. from a snapshot)
+        state = self.__dict__.copy()
+        for name in ('_cache', '_cache_lock', 'answer_hits', 'answer_misses'):
+            del state[name]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._init_cache()
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [self[i] for i in range(*position.indices(self._count))]
+        if position < 0:
+            position += self._count
+        if not 0 <= position < self._count:
+            raise IndexError('FAQ entry index out of range')
+        return FAQEntry(self, position)
+
+    def field(self, row, field):
+        if field == 'answer':
+            return self.answer(row)
+        if field == 'question':
+            return self._questions[row]
+        if field == 'question_id':
+            return self._ids[row]
+        if self._parts is not None:
+            if field == 'part':
+                return self._parts[row]
+            if field == 'passage_id':
+                return f"{self._ids[row]}#{self._parts[row]}"
+        raise KeyError(field)
+
+    def answer(self, row):
+        """Return the answer of row, inflating it unless recently used"""
+        with self._cache_lock:
+            answer = self._cache.get(row)
+            if answer is not None:
+                self._cache.move_to_end(row)
+                self.answer_hits += 1
+                return answer
+            self.answer_misses += 1
+        decompressor = zlib.decompressobj(WBITS, zdict=self._dictionary)
+        data = self._answers[self._answer_offsets[row]:self._answer_offsets[row + 1]]
+        answer = (decompressor.decompress(data) + decompressor.flush()).decode('utf-8')
+        if self._answer_cache_size > 0:
+            with self._cache_lock:
+                self._cache[row] = answer
+                while len(self._cache) > self._answer_cache_size:
+                    self._cache.popitem(last=False)
+        return answer
+
+    def stats(self):
+        """Return storage sizes and answer cache counters for the health endpoint"""
+        parts = self._parts.itemsize * len(self._parts) if self._parts is not None else 0
+        with self._cache_lock:
+            return {
+                'entries': self._count,
+                'answer_bytes': self.answer_bytes,
+                'compressed_answer_bytes': len(self._answers),
+                'stored_bytes': (len(self._answers) + len(self._dictionary) + self._ids.nbytes()
+                                 + self._questions.nbytes() + parts
+                                 + self._answer_offsets.itemsize * len(self._answer_offsets)),
+                'answer_cache_size': len(self._cache),
+                'answer_cache_hits': self.answer_hits,
+                'answer_cache_misses': self.answer_misses,
+            }
+
+
+def compact_faq(faq_data, min_entries=FAQ_COMPACT_MIN_ENTRIES):
+    """Return faq_data as a CompactFAQ when it is large enough to be worth it"""
+    if isinstance(faq_data, CompactFAQ) or len(faq_data) < min_entries:
+        return faq_data
+    return CompactFAQ(faq_data)
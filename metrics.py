@@ -0,0 +1,268 @@
+"""
+Prometheus-style metrics for the Mental Health FAQ Chatbot
+Counters, gauges and histograms record into per-thread shards, so the hot
+path never takes a lock; shards are summed only when /metrics is scraped.
+"""
+import threading
+import time
+from bisect import bisect_left
+
+# Seconds; covers in-memory retrieval up to slow LLM calls
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Estimated tokens per prompt
+TOKEN_BUCKETS = (250, 500, 750, 1000, 1500, 2000, 3000, 4000, 6000, 8000)
+
+ERROR_TYPES = ('quota', 'auth', 'timeout', 'other')
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def classify_error(error):
+    """Sort an API error into quota, auth, timeout or other"""
+    message = str(error).lower()
+    if "api key" in message:
+        return 'auth'
+    if "quota" in message or "limit" in message:
+        return 'quota'
+    if isinstance(error, TimeoutError) or "deadline" in message or "timed out" in message:
+        return 'timeout'
+    return 'other'
+
+
+class _Shards:
+    """One list of values per thread, summed on read"""
+
+    def __init__(self, size):
+        self._size = size
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # (thread, values) for live threads; totals of finished threads are folded in
+        self._shards = []
+        self._retired = [0] * size
+
+    def local(self):
+        values = getattr(self._local, 'values', None)
+        if values is None:
+            values = [0] * self._size
+            self._local.values = values
+            # Only a thread's first recording takes the lock
+            with self._lock:
+                # Short-lived threads (e.g. batch pools) would otherwise pile up between scrapes
+                self._retire_finished()
+                self._shards.append((threading.current_thread(), values))
+        return values
+
+    def _retire_finished(self):
+        """Fold the shards of finished threads into the retired totals; caller holds the lock"""
+        live = []
+        for thread, values in self._shards:
+            if thread.is_alive():
+                live.append((thread, values))
+            else:
+                for i, value in enumerate(values):
+                    self._retired[i] += value
+        self._shards = live
+
+    def totals(self):
+        with self._lock:
+            self._retire_finished()
+            totals = list(self._retired)
+            for _, values in self._shards:
+                for i, value in enumerate(values):
+                    totals[i] += value
+            return totals
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in labels) + '}'
+
+
+def _format_value(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+class Metric:
+    """A metric family with at most one label; children are created on first use"""
+
+    kind = None
+
+    def __init__(self, name, documentation, label=None):
+        self.name = name
+        self.documentation = documentation
+        self.label = label
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def _child(self, label_value):
+        child = self._children.get(label_value)
+        if child is None:
+            with self._lock:
+                child = self._children.get(label_value)
+                if child is None:
+                    child = self._children[label_value] = self._new_child()
+        return child
+
+    def _labels(self, label_value):
+        return ((self.label, label_value),) if self.label else ()
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for label_value, child in sorted(self._children.items(), key=lambda item: str(item[0])):
+            lines.extend(self._expose_child(self._labels(label_value), child))
+        return lines
+
+
+class Counter(Metric):
+    """Monotonically increasing count"""
+
+    kind = 'counter'
+
+    def _new_child(self):
+        return _Shards(1)
+
+    def inc(self, label_value=None, amount=1):
+        self._child(label_value).local()[0] += amount
+
+    def value(self, label_value=None):
+        return self._child(label_value).totals()[0]
+
+    def _expose_child(self, labels, child):
+        return [f"{self.name}{_format_labels(labels)} {_format_value(child.totals()[0])}"]
+
+
+class Gauge(Counter):
+    """Value that goes up and down, such as requests in flight"""
+
+    kind = 'gauge'
+
+    def dec(self, label_value=None, amount=1):
+        self._child(label_value).local()[0] -= amount
+
+    def track(self, label_value=None):
+        """Context manager that counts the enclosed block while it runs"""
+        return _GaugeTracker(self, label_value)
+
+
+class _GaugeTracker:
+    def __init__(self, gauge, label_value):
+        self._gauge = gauge
+        self._label_value = label_value
+
+    def __enter__(self):
+        self._gauge.inc(self._label_value)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._gauge.dec(self._label_value)
+
+
+class Histogram(Metric):
+    """Distribution of observed values in fixed buckets"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, label=None, buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, label)
+        self.buckets = tuple(buckets)
+
+    def _new_child(self):
+        # One slot per bucket, one for +Inf, one for the sum
+        return _Shards(len(self.buckets) + 2)
+
+    def observe(self, value, label_value=None):
+        values = self._child(label_value).local()
+        values[bisect_left(self.buckets, value)] += 1
+        values[-1] += value
+
+    def time(self, label_value=None):
+        """Context manager that observes the enclosed block's duration in seconds"""
+        return _Timer(self, label_value)
+
+    def _expose_child(self, labels, child):
+        totals = child.totals()
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + ('+Inf',), totals):
+            cumulative += count
+            bucket_labels = _format_labels(labels + (('le', _format_value(bound)),))
+            lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+        lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(float(totals[-1]))}")
+        lines.append(f"{self.name}_count{_format_labels(labels)} {cumulative}")
+        return lines
+
+
+class _Timer:
+    def __init__(self, histogram, label_value):
+        self._histogram = histogram
+        self._label_value = label_value
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._histogram.observe(time.perf_counter() - self._started, self._label_value)
+
+
+# Every metric the app records, in exposition order
+STAGE_SECONDS = Histogram(
+    'chatbot_stage_seconds',
+    'Time spent per request stage (retrieval, prompt, llm, llm_first_chunk, total)',
+    label='stage'
+)
+PROMPT_TOKENS = Histogram(
+    'chatbot_prompt_tokens',
+    'Estimated size of prompts sent to the model, in tokens',
+    buckets=TOKEN_BUCKETS
+)
+REQUESTS = Counter('chatbot_requests_total', 'Chat requests received', label='endpoint')
+ANSWERS = Counter('chatbot_answers_total', 'Answers returned by source', label='source')
+ERRORS = Counter('chatbot_errors_total', 'Failed LLM requests by error type', label='type')
+REQUESTS_IN_FLIGHT = Gauge('chatbot_requests_in_flight', 'Chat requests being handled', label='endpoint')
+LLM_CALLS_IN_FLIGHT = Gauge('chatbot_llm_calls_in_flight', 'Model calls waiting for a response')
+LLM_ATTEMPTS = Counter('chatbot_llm_attempts_total', 'Model requests started by kind (primary, hedge, retry)',
+                       label='kind')
+LLM_HEDGE_WINS = Counter('chatbot_llm_hedge_wins_total', 'Calls answered by the hedged request first')
+ADMISSION_QUEUE_DEPTH = Gauge('chatbot_admission_queue_depth', 'Requests waiting for a model call slot')
+SHED_REQUESTS = Counter('chatbot_shed_requests_total',
+                        'Requests answered from the FAQ instead of the model, by reason', label='reason')
+BREAKER_STATE = Gauge('chatbot_circuit_breaker_state', 'Gemini circuit breaker state (1 for the current one)',
+                      label='state')
+
+METRICS = (STAGE_SECONDS, PROMPT_TOKENS, REQUESTS, ANSWERS, ERRORS, REQUESTS_IN_FLIGHT, LLM_CALLS_IN_FLIGHT,
+           LLM_ATTEMPTS, LLM_HEDGE_WINS, ADMISSION_QUEUE_DEPTH, SHED_REQUESTS, BREAKER_STATE)
+
+# Error types are always listed, even before the first error
+for error_type in ERROR_TYPES:
+    ERRORS.inc(error_type, 0)
+
+
+def record_error(error):
+    """Count a failed request under its error type"""
+    ERRORS.inc(classify_error(error))
+
+
+def start_request(endpoint):
+    """Count a request as started; returns the start time to pass to finish_request"""
+    REQUESTS.inc(endpoint)
+    REQUESTS_IN_FLIGHT.inc(endpoint)
+    return time.perf_counter()
+
+
+def finish_request(endpoint, started):
+    """Record a finished request's total time"""
+    STAGE_SECONDS.observe(time.perf_counter() - started, 'total')
+    REQUESTS_IN_FLIGHT.dec(endpoint)
+
+
+def render_metrics():
+    """Return every metric in the Prometheus text exposition format"""
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.expose())
+    return '\n'.join(lines) + '\n'
+
@@ -0,0 +1,111 @@
+"""
+Process-wide Gemini model registry
+Resolves the preferred model once and shares the client across requests and threads
+"""
+import os
+import threading
+
+import google.generativeai as genai
+
+# Model names must include 'models/' prefix
+# gemini-2.5-flash (faster), then gemini-2.5-pro (more capable), then latest flash
+PREFERRED_MODELS = (
+    'models/gemini-2.5-flash',
+    'models/gemini-2.5-pro',
+    'models/gemini-flash-latest',
+)
+
+# Model that hedged requests go to: empty for the same model, 'alternate' for the
+# next model in PREFERRED_MODELS, or a model name
+LLM_HEDGE_MODEL = os.getenv('LLM_HEDGE_MODEL', '')
+
+
+class ModelRegistry:
+    """Resolves GenerativeModel instances once and hands out the shared copies"""
+
+    def __init__(self, model_names=PREFERRED_MODELS):
+        self.model_names = tuple(model_names)
+        self._lock = threading.Lock()
+        self._api_key = None
+        self._models = {}
+        self._preferred = None
+
+    def configure(self, api_key):
+        """Configure the Gemini client, only when the API key changes"""
+        with self._lock:
+            if api_key == self._api_key:
+                return
+            genai.configure(api_key=api_key)
+            self._api_key = api_key
+            # Models hold a client bound to the old key
+            self._models.clear()
+            self._preferred = None
+
+    def resolve(self, verify=False):
+        """Pick the first preferred model that can be created (and optionally looked up)"""
+        with self._lock:
+            if self._preferred is not None:
+                return self._preferred
+            for name in self.model_names:
+                try:
+                    if verify:
+                        genai.get_model(name)
+                    model = self._models.get(name) or genai.GenerativeModel(name)
+                except Exception:
+                    continue
+                self._models[name] = model
+                self._preferred = model
+                return model
+            # Nothing verified; fall back to the first name and let the call report errors
+            model = genai.GenerativeModel(self.model_names[0])
+            self._models[self.model_names[0]] = model
+            self._preferred = model
+            return model
+
+    def use_model(self, model):
+        """Serve model for every request instead of a Gemini model (e.g. a local stub)"""
+        with self._lock:
+            self._models[model.model_name] = model
+            self._preferred = model
+
+    def get_model(self, name=None):
+        """Return the shared model for name, or the resolved preferred model"""
+        if name is None:
+            return self._preferred or self.resolve()
+        model = self._models.get(name)
+        if model is None:
+            with self._lock:
+                model = self._models.get(name)
+                if model is None:
+                    model = genai.GenerativeModel(name)
+                    self._models[name] = model
+        return model
+
+    def hedge_model(self, model, hedge=LLM_HEDGE_MODEL):
+        """Return the model a hedged request for model should go to"""
+        if not hedge:
+            return model
+        if hedge == 'alternate':
+            if model.model_name not in self.model_names:
+                return model
+            position = self.model_names.index(model.model_name)
+            hedge = self.model_names[(position + 1) % len(self.model_names)]
+        return self.get_model(hedge)
+
+
+registry = ModelRegistry()
+
+
+def configure(api_key):
+    """Configure the shared registry with an API key"""
+    registry.configure(api_key)
+
+
+def get_model(name=None):
+    """Return a model from the shared registry"""
+    return registry.get_model(name)
+
+
+def get_hedge_model(model):
+    """Return the model hedged requests for model go to"""
+    return registry.hedge_model(model)
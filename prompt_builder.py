@@ -0,0 +1,179 @@
+"""
+Prompt construction for the Mental Health FAQ Chatbot
+The instruction block is rendered once per FAQ version; FAQ context is packed
+per request from the retrieved entries or passages within a token budget
+"""
+import os
+import threading
+
+from faq_index import get_index
+
+SYSTEM_INTRO = """You are a helpful and empathetic mental health assistant chatbot.
+Your role is to provide accurate, supportive, and compassionate information about mental health based on the following FAQ database."""
+
+INSTRUCTIONS = """Instructions:
+1. Use the FAQ database above to answer user questions accurately
+2. If a question matches or is similar to a FAQ entry, provide that answer
+3. If the question is not directly in the FAQ, use your knowledge to provide helpful, empathetic responses
+4. Always be supportive, non-judgmental, and encourage professional help when appropriate
+5. If someone is in crisis or mentions self-harm, encourage them to seek immediate professional help
+6. Keep responses clear, concise, and easy to understand
+7. If you're unsure, acknowledge it and suggest consulting a mental health professional
+
+Remember: You are not a replacement for professional mental health care. Always encourage users to consult with qualified mental health professionals for diagnosis and treatment.
+"""
+
+RESPONSE_REQUEST = "Please provide a helpful and empathetic response:"
+
+# Token budget for FAQ context in each prompt, filled with whole entries by relevance
+PROMPT_TOKEN_BUDGET = int(os.getenv('PROMPT_TOKEN_BUDGET', 1000))
+# How many retrieval candidates are considered for packing
+PROMPT_CANDIDATES = int(os.getenv('PROMPT_CANDIDATES', 20))
+# The best matches are listed under their own heading
+RELEVANT_ENTRIES = 3
+
+
+def estimate_tokens(text):
+    """Rough local token estimate (about four characters per token for English)"""
+    return (len(text) + 3) // 4
+
+
+def format_entry(question, passages):
+    """Format one FAQ question with its answer, or the passages of it that were retrieved"""
+    answer = "\n".join(text.strip() for _, text in sorted(passages))
+    return f"Q: {question.strip()}\nA: {answer}\n\n"
+
+
+class PackingStats:
+    """Running totals of how much FAQ context went into prompts"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.prompts = 0
+        self.total_tokens = 0
+        self.max_tokens = 0
+        self.last_tokens = 0
+        self.skipped_entries = 0
+
+    def record(self, context_tokens, skipped):
+        with self._lock:
+            self.prompts += 1
+            self.total_tokens += context_tokens
+            self.max_tokens = max(self.max_tokens, context_tokens)
+            self.last_tokens = context_tokens
+            self.skipped_entries += skipped
+
+    def stats(self):
+        with self._lock:
+            return {
+                'token_budget': PROMPT_TOKEN_BUDGET,
+                'prompts': self.prompts,
+                'avg_context_tokens': round(self.total_tokens / self.prompts, 1) if self.prompts else 0.0,
+                'max_context_tokens': self.max_tokens,
+                'last_context_tokens': self.last_tokens,
+                'skipped_entries': self.skipped_entries,
+            }
+
+
+packing_stats = PackingStats()
+
+
+def pack_context(ranked_entries, token_budget=PROMPT_TOKEN_BUDGET, relevant_count=RELEVANT_ENTRIES):
+    """Fill the token budget with whole FAQ entries or answer passages in retrieval order
+
+    Passages of the same question are grouped under it in answer order.
+    Returns (relevant_blocks, additional_blocks, context_tokens, skipped).
+    """
+    # question_id -> [question, [(part, text), ...]] in the order questions were first packed
+    packed = {}
+    seen = set()
+    used = 0
+    skipped = 0
+    for entry in ranked_entries:
+        # The same entry or passage can only appear once
+        key = entry.get('passage_id', entry.get('question_id'))
+        if key in seen:
+            continue
+        question_id = entry.get('question_id')
+        group = packed.get(question_id)
+        if group is None:
+            tokens = estimate_tokens(format_entry(entry['question'], [(0, entry['answer'])]))
+        else:
+            tokens = estimate_tokens(entry['answer']) + 1
+        # The best match is always kept; anything else must fit what is left
+        if used + tokens > token_budget and packed:
+            skipped += 1
+            continue
+        seen.add(key)
+        used += tokens
+        if group is None:
+            group = packed[question_id] = [entry['question'], []]
+        group[1].append((entry.get('part', 0), entry['answer']))
+
+    blocks = [format_entry(question, passages) for question, passages in packed.values()]
+    return blocks[:relevant_count], blocks[relevant_count:], used, skipped
+
+
+class PromptTemplate:
+    """Precompiled prompt whose static sections are rendered once"""
+
+    def __init__(self, version=None, token_budget=None):
+        self.version = version
+        # None follows PROMPT_TOKEN_BUDGET, so snapshots do not pin the budget
+        self.token_budget = token_budget
+        self._prefix = f"{SYSTEM_INTRO}\n\n"
+        self._suffix = f"\n\n{INSTRUCTIONS}"
+
+    def render(self, user_question, ranked_entries=(), history=''):
+        """Pack the ranked entries into the budget and fill in the history and user question"""
+        return self.render_packed(user_question, ranked_entries, history)[0]
+
+    def render_packed(self, user_question, ranked_entries=(), history=''):
+        """Like render, but also return the number of FAQ context tokens packed"""
+        token_budget = self.token_budget if self.token_budget is not None else PROMPT_TOKEN_BUDGET
+        relevant_blocks, additional_blocks, context_tokens, skipped = pack_context(
+            ranked_entries, token_budget
+        )
+        packing_stats.record(context_tokens, skipped)
+        parts = [self._prefix]
+        if relevant_blocks:
+            parts.append("Most relevant FAQ entries:\n")
+            parts.extend(relevant_blocks)
+        if additional_blocks:
+            parts.append("\nAdditional FAQ Database Context:\n")
+            parts.extend(additional_blocks)
+        parts.append(self._suffix)
+        if history:
+            parts.extend(("\n\n", history.rstrip()))
+        parts.extend(("\n\nUser Question: ", user_question, "\n\n", RESPONSE_REQUEST))
+        return "".join(parts), context_tokens
+
+
+# Templates are shared by every request that sees the same FAQ version
+_templates = {}
+_templates_lock = threading.Lock()
+MAX_CACHED_TEMPLATES = 4
+
+
+def register_prompt_template(template):
+    """Register a prebuilt template (e.g. from a snapshot) for its FAQ version"""
+    with _templates_lock:
+        _templates[template.version] = template
+        while len(_templates) > MAX_CACHED_TEMPLATES:
+            del _templates[next(iter(_templates))]
+    return template
+
+
+def get_prompt_template(faq_data):
+    """Return the prompt template for the current version of faq_data"""
+    version = get_index(faq_data).version
+    template = _templates.get(version)
+    if template is None:
+        with _templates_lock:
+            template = _templates.get(version)
+            if template is None:
+                template = PromptTemplate(version=version)
+                _templates[version] = template
+                while len(_templates) > MAX_CACHED_TEMPLATES:
+                    del _templates[next(iter(_templates))]
+    return template
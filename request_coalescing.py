@@ -0,0 +1,125 @@
+"""
+Single-flight coalescing of identical in-flight chat requests
+Concurrent requests with the same key share one LLM call and its result
+"""
+import asyncio
+import threading
+
+
+class _Call:
+    """One in-flight call shared by a leader thread and its followers"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.followers = 0
+
+
+class SingleFlight:
+    """Thread-based coalescing for the Flask (WSGI) server"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    def do(self, key, func, *args):
+        """Run func(*args) once per key at a time; concurrent callers get the same result"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                self.leaders += 1
+            else:
+                call.followers += 1
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func(*args)
+            return call.result
+        except Exception as e:
+            # Followers see the same error as the leader
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'in_flight': len(self._calls),
+                'leaders': self.leaders,
+                'coalesced': self.coalesced,
+            }
+
+
+class _AsyncCall:
+    """One in-flight task and the number of requests awaiting it"""
+
+    def __init__(self, task):
+        self.task = task
+        self.waiters = 0
+
+
+class AsyncSingleFlight:
+    """Task-based coalescing for the ASGI server"""
+
+    def __init__(self):
+        self._calls = {}
+        self.leaders = 0
+        self.coalesced = 0
+        self.cancelled = 0
+
+    async def do(self, key, coroutine_factory):
+        """Await the shared call for key, starting it if nobody else has"""
+        call = self._calls.get(key)
+        if call is None:
+            call = _AsyncCall(asyncio.ensure_future(coroutine_factory()))
+            self._calls[key] = call
+            self.leaders += 1
+            call.task.add_done_callback(lambda _, key=key, call=call: self._forget(key, call))
+        else:
+            self.coalesced += 1
+
+        call.waiters += 1
+        try:
+            # shield() keeps one waiter's cancellation from cancelling everyone
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                # Every waiter disconnected; nobody needs the answer any more
+                call.task.cancel()
+                self.cancelled += 1
+
+    def _forget(self, key, call):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+        # Retrieve the exception so a cancelled or failed task is not reported as unhandled
+        if not call.task.cancelled():
+            call.task.exception()
+
+    def stats(self):
+        return {
+            'in_flight': len(self._calls),
+            'leaders': self.leaders,
+            'coalesced': self.coalesced,
+            'cancelled': self.cancelled,
+        }
+
+
+# Shared by every request in the process
+chat_singleflight = SingleFlight()
+async_chat_singleflight = AsyncSingleFlight()
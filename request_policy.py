@@ -0,0 +1,329 @@
+"""
+Deadlines, hedging and retries for model calls
+One slow or failing Gemini call should not stall a chat: every call gets a
+deadline, a second (hedged) request is started when the first runs longer than
+the recent p95 latency, the first answer wins, and transient errors are retried
+with jittered exponential backoff.
+The pinned google-generativeai client takes no per-request timeout, so the
+deadline is enforced here: the caller stops waiting once it passes.
+"""
+import asyncio
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import metrics
+from admission import admission_controller
+
+# Seconds a chat may wait for the model in total, across hedges and retries
+LLM_DEADLINE = float(os.getenv('LLM_DEADLINE', 30))
+# Hedge once a call runs longer than this quantile of recent latencies; 0 turns hedging off
+LLM_HEDGE_QUANTILE = float(os.getenv('LLM_HEDGE_QUANTILE', 0.95))
+# Never hedge sooner than this, and wait this long until enough latencies are known
+LLM_HEDGE_MIN_DELAY = float(os.getenv('LLM_HEDGE_MIN_DELAY', 1.0))
+LLM_HEDGE_INITIAL_DELAY = float(os.getenv('LLM_HEDGE_INITIAL_DELAY', 8.0))
+# Retries after transient errors, with full-jitter backoff starting at LLM_RETRY_BACKOFF seconds
+LLM_RETRIES = int(os.getenv('LLM_RETRIES', 2))
+LLM_RETRY_BACKOFF = float(os.getenv('LLM_RETRY_BACKOFF', 0.5))
+LLM_RETRY_MAX_BACKOFF = float(os.getenv('LLM_RETRY_MAX_BACKOFF', 4.0))
+# Threads running blocking model calls for the Flask app
+LLM_POLICY_WORKERS = int(os.getenv('LLM_POLICY_WORKERS', 64))
+
+# Latencies kept per model, and how many are needed before the quantile is trusted
+LATENCY_WINDOW = 200
+LATENCY_MIN_SAMPLES = 20
+
+# google.api_core exception names (and builtins) worth another attempt
+TRANSIENT_ERRORS = frozenset((
+    'ServiceUnavailable', 'InternalServerError', 'DeadlineExceeded', 'GatewayTimeout',
+    'BadGateway', 'TooManyRequests', 'ResourceExhausted', 'Aborted',
+    'TimeoutError', 'ConnectionError',
+))
+
+
+def is_transient(error):
+    """True for errors a later attempt may not hit again (overload, timeouts, 5xx)"""
+    if metrics.classify_error(error) == 'auth':
+        return False
+    return any(cls.__name__ in TRANSIENT_ERRORS for cls in type(error).__mro__)
+
+
+class LatencyTracker:
+    """Recent successful call latencies per model"""
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self._window = window
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, model_name, seconds):
+        with self._lock:
+            samples = self._samples.get(model_name)
+            if samples is None:
+                samples = self._samples[model_name] = deque(maxlen=self._window)
+            samples.append(seconds)
+
+    def quantile(self, model_name, fraction):
+        """Return the fraction quantile of recent latencies, or None with too few samples"""
+        with self._lock:
+            samples = self._samples.get(model_name)
+            if not samples or len(samples) < LATENCY_MIN_SAMPLES:
+                return None
+            ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    def model_names(self):
+        with self._lock:
+            return list(self._samples)
+
+
+class _Call:
+    """Decides which attempt of one call to start next, and when"""
+
+    def __init__(self, policy, model, hedge_model):
+        self.policy = policy
+        self.model = model
+        self.hedge_model = hedge_model
+        self.started = time.monotonic()
+        self.deadline_at = self.started + policy.deadline
+        self.hedge_at = None
+        self.retry_at = None
+        self.retries = 0
+        self.hedged = False
+        self.attempts = 0
+        self.error = None
+
+    def due(self, now, running):
+        """Return the (kind, model) attempts to start now"""
+        starts = []
+        if self.attempts == 0:
+            starts.append(('primary', self.model))
+        elif self.retry_at is not None and now >= self.retry_at:
+            self.retry_at = None
+            # Retries and hedges never queue for admission: they go out now or not at all
+            if self.policy.try_admit():
+                starts.append(('retry', self.model))
+        elif running and not self.hedged and self.hedge_at is not None and now >= self.hedge_at:
+            self.hedged = True
+            if self.policy.try_admit():
+                starts.append(('hedge', self.hedge_model))
+        if starts and not self.hedged:
+            delay = self.policy.hedge_delay(self.model.model_name)
+            self.hedge_at = now + delay if delay is not None else None
+        self.attempts += len(starts)
+        return starts
+
+    def wait_time(self, now, running):
+        """Seconds until something is due: the deadline, a hedge or a retry"""
+        wake = self.deadline_at
+        if self.retry_at is not None:
+            wake = min(wake, self.retry_at)
+        if running and not self.hedged and self.hedge_at is not None:
+            wake = min(wake, self.hedge_at)
+        return max(0.0, wake - now)
+
+    def failed(self, error, running):
+        """Record a failed attempt; schedules a retry once nothing else is running"""
+        self.error = error
+        if running or self.retries >= self.policy.retries or not is_transient(error):
+            return
+        backoff = self.policy.backoff(self.retries)
+        if time.monotonic() + backoff < self.deadline_at:
+            self.retries += 1
+            self.retry_at = time.monotonic() + backoff
+
+    def given_up(self, running):
+        """True when nothing is running or scheduled, so the last error stands"""
+        return not running and self.retry_at is None
+
+    def remaining(self, now):
+        return max(0.0, self.deadline_at - now)
+
+    def timeout_error(self):
+        return TimeoutError(f"The model did not respond within {self.policy.deadline:g} seconds")
+
+
+class RequestPolicy:
+    """Runs model calls under a deadline with hedging and retries"""
+
+    def __init__(self, deadline=LLM_DEADLINE, hedge_quantile=LLM_HEDGE_QUANTILE,
+                 hedge_min_delay=LLM_HEDGE_MIN_DELAY, hedge_initial_delay=LLM_HEDGE_INITIAL_DELAY,
+                 retries=LLM_RETRIES, backoff_base=LLM_RETRY_BACKOFF,
+                 backoff_max=LLM_RETRY_MAX_BACKOFF, workers=LLM_POLICY_WORKERS, admission=None):
+        self.deadline = deadline
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_initial_delay = hedge_initial_delay
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.latencies = LatencyTracker()
+        # Rate limit, load shedding and circuit breaker; None lets every call through
+        self.admission = admission
+        self._workers = workers
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self._random = random.Random()
+
+    def hedge_delay(self, model_name):
+        """Seconds to wait before hedging a call to model_name, or None when hedging is off"""
+        if self.hedge_quantile <= 0:
+            return None
+        delay = self.latencies.quantile(model_name, self.hedge_quantile)
+        if delay is None:
+            delay = self.hedge_initial_delay
+        return max(self.hedge_min_delay, delay)
+
+    def backoff(self, retry):
+        """Full-jitter exponential backoff before the given retry (0-based)"""
+        return self._random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** retry))
+
+    def try_admit(self):
+        return self.admission is None or self.admission.try_admit()
+
+    def _run(self, attempt, model):
+        # Every attempt's outcome feeds the circuit breaker, even after the caller gave up on it
+        try:
+            result = attempt(model)
+        except Exception as e:
+            if self.admission is not None:
+                self.admission.record_failure(e)
+            raise
+        if self.admission is not None:
+            self.admission.record_success()
+        return result
+
+    async def _run_async(self, attempt, model):
+        try:
+            result = await attempt(model)
+        except asyncio.CancelledError:
+            if self.admission is not None:
+                self.admission.record_abandoned()
+            raise
+        except Exception as e:
+            if self.admission is not None:
+                self.admission.record_failure(e)
+            raise
+        if self.admission is not None:
+            self.admission.record_success()
+        return result
+
+    def _abandon(self, future):
+        if future.cancel() and self.admission is not None:
+            # Never started, so it will not report an outcome
+            self.admission.record_abandoned()
+
+    def _finished(self, kind, model, started):
+        self.latencies.record(model.model_name, time.monotonic() - started)
+        if kind == 'hedge':
+            metrics.LLM_HEDGE_WINS.inc()
+
+    def _pool(self):
+        # Created on first use; blocking calls run here so the caller can stop waiting
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self._workers,
+                                                        thread_name_prefix='llm-call')
+        return self._executor
+
+    def call(self, attempt, model, hedge_model=None):
+        """Return the first successful attempt(model) result
+
+        attempt blocks and cannot be interrupted: at the deadline, or once another
+        attempt wins, running attempts are abandoned and hold their pool thread
+        until the client returns.
+        Raises admission.Overloaded when the call is shed.
+        """
+        call = _Call(self, model, hedge_model or model)
+        if self.admission is not None:
+            self.admission.admit(call.remaining(time.monotonic()))
+        running = {}
+        while True:
+            now = time.monotonic()
+            if now >= call.deadline_at:
+                for future in running:
+                    self._abandon(future)
+                raise call.timeout_error()
+            for kind, attempt_model in call.due(now, bool(running)):
+                metrics.LLM_ATTEMPTS.inc(kind)
+                future = self._pool().submit(self._run, attempt, attempt_model)
+                running[future] = (kind, attempt_model, now)
+            if call.given_up(bool(running)):
+                raise call.error
+
+            if not running:
+                # Backing off before a retry
+                time.sleep(call.wait_time(now, False))
+                continue
+            done, _ = wait(running, timeout=call.wait_time(now, True), return_when=FIRST_COMPLETED)
+            for future in done:
+                kind, attempt_model, started = running.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    call.failed(e, bool(running))
+                    continue
+                self._finished(kind, attempt_model, started)
+                # Attempts not yet started are dropped; running ones cannot be interrupted
+                for other in running:
+                    self._abandon(other)
+                return result
+
+    async def call_async(self, attempt, model, hedge_model=None):
+        """Async counterpart of call(); attempt(model) returns a coroutine
+
+        Losing attempts are cancelled as soon as one succeeds, and every attempt at the deadline.
+        """
+        call = _Call(self, model, hedge_model or model)
+        if self.admission is not None:
+            await self.admission.admit_async(call.remaining(time.monotonic()))
+        running = {}
+        try:
+            while True:
+                now = time.monotonic()
+                if now >= call.deadline_at:
+                    raise call.timeout_error()
+                for kind, attempt_model in call.due(now, bool(running)):
+                    metrics.LLM_ATTEMPTS.inc(kind)
+                    task = asyncio.ensure_future(self._run_async(attempt, attempt_model))
+                    running[task] = (kind, attempt_model, now)
+                if call.given_up(bool(running)):
+                    raise call.error
+
+                if not running:
+                    await asyncio.sleep(call.wait_time(now, False))
+                    continue
+                done, _ = await asyncio.wait(running, timeout=call.wait_time(now, True),
+                                             return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    kind, attempt_model, started = running.pop(task)
+                    try:
+                        result = task.result()
+                    except Exception as e:
+                        call.failed(e, bool(running))
+                        continue
+                    self._finished(kind, attempt_model, started)
+                    return result
+        finally:
+            for task in running:
+                task.cancel()
+
+    def stats(self):
+        """Return the policy settings and current hedge delays for the health endpoint"""
+        return {
+            'deadline_seconds': self.deadline,
+            'hedge_quantile': self.hedge_quantile,
+            'hedge_delay_seconds': {name: round(self.hedge_delay(name), 3) for name in self.latencies.model_names()}
+            if self.hedge_quantile > 0 else {},
+            'retries': self.retries,
+            'attempts': {kind: metrics.LLM_ATTEMPTS.value(kind) for kind in ('primary', 'hedge', 'retry')},
+            'hedge_wins': metrics.LLM_HEDGE_WINS.value(),
+        }
+
+
+# Shared by every request in the process
+model_policy = RequestPolicy(admission=admission_controller)
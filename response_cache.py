@@ -0,0 +1,121 @@
+"""
+In-process cache of chatbot answers
+Keyed on the normalized question, the FAQ data version and the model name,
+backed by the semantic cache for paraphrased questions
+"""
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from semantic_cache import semantic_cache
+
+RESPONSE_CACHE_SIZE = int(os.getenv('RESPONSE_CACHE_SIZE', 1024))
+RESPONSE_CACHE_TTL = float(os.getenv('RESPONSE_CACHE_TTL', 3600))
+
+PUNCTUATION_PATTERN = re.compile(r"[^\w\s]")
+
+
+def normalize_question(question):
+    """Fold case, punctuation and whitespace so trivial variants share a key"""
+    return ' '.join(PUNCTUATION_PATTERN.sub(' ', question.lower()).split())
+
+
+class ResponseCache:
+    """Bounded LRU cache with per-entry time-to-live"""
+
+    def __init__(self, max_size=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(question, faq_version, model_name):
+        """Build the cache key for a question"""
+        return (normalize_question(question), faq_version, model_name)
+
+    def get(self, key):
+        """Return the cached answer for key, or None"""
+        now = time.monotonic()
+        with self._lock:
+            item = self._entries.get(key)
+            if item is not None:
+                expires_at, value = item
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, value, ttl=None):
+        """Store an answer for ttl seconds (default self.ttl), evicting the least recently used entry when full"""
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate_version(self, faq_version):
+        """Drop the answers cached for one FAQ version; returns how many were dropped"""
+        with self._lock:
+            stale = [key for key in self._entries if key[1] == faq_version]
+            for key in stale:
+                del self._entries[key]
+            return len(stale)
+
+    def clear(self):
+        """Drop every cached answer"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Return counters for the health endpoint"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+# Shared by every request in the process
+response_cache = ResponseCache()
+
+
+def lookup_answer(question, faq_version, model_name):
+    """Return a cached answer for the exact normalized question or a close paraphrase"""
+    key = response_cache.make_key(question, faq_version, model_name)
+    answer = response_cache.get(key)
+    if answer is None:
+        answer, seconds_left = semantic_cache.lookup(question, faq_version, model_name)
+        if answer is not None:
+            # Later repeats of this exact wording skip the vector search, until the
+            # paraphrased answer itself expires
+            response_cache.set(key, answer, ttl=seconds_left)
+    return answer
+
+
+def store_answer(question, faq_version, model_name, answer):
+    """Cache a freshly generated answer in both caches"""
+    response_cache.set(response_cache.make_key(question, faq_version, model_name), answer)
+    semantic_cache.set(question, faq_version, model_name, answer, ttl=response_cache.ttl)
+
+
+def invalidate_version(faq_version):
+    """Drop every cached answer tied to an FAQ version that is no longer served"""
+    return response_cache.invalidate_version(faq_version) + semantic_cache.invalidate_version(faq_version)
@@ -1,9 +1,29 @@
 #!/usr/bin/env python3
 """
 Quick start script for Mental Health Chatbot
+`python run.py` starts Flask's development server; `python run.py --production`
+loads the FAQ data and indexes once, then forks gunicorn workers that share
+them copy-on-write.
 """
+import argparse
+import gc
 import os
 import sys
+import time
+
+# Production server: worker processes (WEB_CONCURRENCY is also gunicorn's own setting)
+# and request threads per worker. Conversation sessions live in one worker, so more
+# than one worker needs sticky routing by session_id in front of the server
+WEB_CONCURRENCY = int(os.getenv('WEB_CONCURRENCY', 1))
+WEB_THREADS = int(os.getenv('WEB_THREADS', 4))
+# Workers are replaced after this many requests, plus up to the jitter so they
+# do not all restart at once; 0 never replaces them
+WEB_MAX_REQUESTS = int(os.getenv('WEB_MAX_REQUESTS', 1000))
+WEB_MAX_REQUESTS_JITTER = int(os.getenv('WEB_MAX_REQUESTS_JITTER', 100))
+# Seconds a worker gets to finish its requests on restart or shutdown
+WEB_GRACEFUL_TIMEOUT = int(os.getenv('WEB_GRACEFUL_TIMEOUT', 30))
+# Seconds a worker may stop responding to the parent before it is replaced
+WEB_TIMEOUT = int(os.getenv('WEB_TIMEOUT', 60))
 
 def check_requirements():
     """Check if required packages are installed"""
@@ -39,33 +59,147 @@ def check_data_files():
         print("❌ Error: Neither faq_data.json nor Mental_Health_FAQ.csv found")
         return False
 
+def memory_usage():
+    """Return this process's memory in MB, split into pages shared with other processes and private ones"""
+    values = {}
+    try:
+        with open('/proc/self/smaps_rollup') as f:
+            for line in f:
+                name, _, value = line.partition(':')
+                if value.strip().endswith('kB'):
+                    values[name] = int(value.split()[0]) / 1024
+        return {
+            'rss_mb': round(values['Rss'], 1),
+            'shared_mb': round(values['Shared_Clean'] + values['Shared_Dirty'], 1),
+            'private_mb': round(values['Private_Clean'] + values['Private_Dirty'], 1),
+        }
+    except (OSError, KeyError, ValueError):
+        # No smaps (e.g. macOS): only the peak resident size is known
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return {'max_rss_mb': round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)}
+
+def format_memory(usage):
+    if 'rss_mb' not in usage:
+        return f"peak memory {usage['max_rss_mb']} MB"
+    return f"memory {usage['rss_mb']} MB ({usage['shared_mb']} MB shared, {usage['private_mb']} MB private)"
+
+def serve_production(port, workers, threads, max_requests):
+    """Serve the Flask app with gunicorn worker processes forked after the FAQ data is loaded"""
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        print("❌ Production mode needs gunicorn: pip install gunicorn")
+        print("   gunicorn does not run on Windows; use 'uvicorn asgi:app --workers N' there")
+        sys.exit(1)
+
+    # Load the FAQ data, indexes and prompt template once, in the parent
+    started = time.perf_counter()
+    import app as chatbot
+    # Each worker watches the FAQ files itself; no reload may be running while the parent forks
+    chatbot.faq_reloader.stop()
+    # Keep the garbage collector from writing to (and so copying) the loaded objects in every worker
+    gc.collect()
+    gc.freeze()
+    print(f"📚 Loaded {len(chatbot.faq_data)} FAQ entries in {time.perf_counter() - started:.2f}s, "
+          f"{format_memory(memory_usage())}")
+
+    def post_fork(server, worker):
+        worker.started = time.perf_counter()
+        # LLM_RATE_LIMIT is the quota of the whole server, so each worker gets its share
+        chatbot.admission_controller.share_quota(workers)
+        chatbot.faq_reloader.resume()
+
+    def post_worker_init(worker):
+        worker.log.info(f"Worker {worker.pid} ready in {time.perf_counter() - worker.started:.3f}s, "
+                        f"{format_memory(memory_usage())}")
+
+    def worker_exit(server, worker):
+        server.log.info(f"Worker {worker.pid} exiting after {worker.nr} requests, "
+                        f"{format_memory(memory_usage())}")
+
+    def on_reload(server):
+        # SIGHUP: reload the FAQ data in the parent so the replacement workers share the new version
+        result = chatbot.faq_reloader.reload()
+        gc.collect()
+        gc.freeze()
+        server.log.info(f"FAQ data {result['status']} (version {result['version']}), restarting workers")
+
+    options = {
+        'bind': f"0.0.0.0:{port}",
+        'workers': workers,
+        'threads': threads,
+        'worker_class': 'gthread',
+        'preload_app': True,
+        'max_requests': max_requests,
+        'max_requests_jitter': WEB_MAX_REQUESTS_JITTER if max_requests else 0,
+        'graceful_timeout': WEB_GRACEFUL_TIMEOUT,
+        'timeout': WEB_TIMEOUT,
+        'post_fork': post_fork,
+        'post_worker_init': post_worker_init,
+        'worker_exit': worker_exit,
+        'on_reload': on_reload,
+    }
+
+    class ChatbotServer(BaseApplication):
+        def load_config(self):
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return chatbot.app
+
+    if workers > 1:
+        print(f"⚠️  Conversation sessions are kept per worker: with {workers} workers, follow-up "
+              f"questions only keep their history behind a proxy that routes each session_id to one worker")
+    print(f"✅ Starting {workers} workers x {threads} threads on port {port} "
+          f"(kill -HUP {os.getpid()} reloads the FAQ data and restarts workers gracefully)")
+    ChatbotServer().run()
+
 def main():
+    parser = argparse.ArgumentParser(description="Start the Mental Health Chatbot")
+    parser.add_argument('--production', action='store_true',
+                        help="serve with gunicorn worker processes instead of Flask's development server")
+    parser.add_argument('--workers', type=int, default=WEB_CONCURRENCY,
+                        help="worker processes in production mode (default: WEB_CONCURRENCY or 1)")
+    parser.add_argument('--threads', type=int, default=WEB_THREADS,
+                        help="request threads per worker (default: WEB_THREADS or 4)")
+    parser.add_argument('--max-requests', type=int, default=WEB_MAX_REQUESTS,
+                        help="replace a worker after this many requests, 0 never (default: WEB_MAX_REQUESTS or 1000)")
+    args = parser.parse_args()
+
     print("🧠 Mental Health Chatbot - Starting...\n")
-    
+
     # Check requirements
     if not check_requirements():
         sys.exit(1)
-    
+
     # Check API key
     api_configured = check_api_key()
-    
+
     # Check data files
     if not check_data_files():
         sys.exit(1)
-    
+
+    port = int(os.getenv('PORT', 5000))
+    if args.production:
+        # No one to ask; the app refuses to start without a key
+        if not api_configured:
+            sys.exit(1)
+        serve_production(port, args.workers, args.threads, args.max_requests)
+        return
+
     if not api_configured:
         response = input("\nContinue anyway? (y/n): ")
         if response.lower() != 'y':
             sys.exit(1)
-    
+
     print("\n✅ Starting Flask server...")
     print("🌐 Open http://localhost:5000 in your browser\n")
-    
+
     # Import and run the app
     from app import app
-    port = int(os.getenv('PORT', 5000))
     app.run(host='0.0.0.0', port=port, debug=True)
 
 if __name__ == '__main__':
     main()
-
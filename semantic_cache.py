@@ -0,0 +1,230 @@
+"""
+Similarity-keyed answer cache for paraphrased questions
+Questions are vectorized locally with hashed word and character n-grams
+"""
+import os
+import re
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from faq_index import CLAUSE_BREAKS, CONTRACTED_NOT, NEGATIONS, STOP_WORDS, stem
+
+SEMANTIC_CACHE_SIZE = int(os.getenv('SEMANTIC_CACHE_SIZE', 512))
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv('SEMANTIC_CACHE_THRESHOLD', 0.8))
+SEMANTIC_CACHE_DIM = int(os.getenv('SEMANTIC_CACHE_DIM', 1024))
+# Answers expire like those in the exact-match response cache
+SEMANTIC_CACHE_TTL = float(os.getenv('RESPONSE_CACHE_TTL', 3600))
+
+# Whole (stemmed) words carry most of the meaning; character trigrams
+# smooth over spelling variants the stemmer does not catch
+WORD_WEIGHT = 1.0
+TRIGRAM_WEIGHT = 0.3
+
+# Negations (faq_index.NEGATIONS) flip the meaning of a question, so unlike in retrieval
+# they are kept: every word after one (up to the end of the clause) becomes a different feature
+# Words that only frame a question ("how do I know if I have ...", "can you tell me ...")
+QUESTION_FILLER = frozenset("""
+know tell wonder wondering sure think please ask asking question mean means ca wo
+""".split())
+
+# Who a question is about matters as much as negation ("kill myself" vs "kill him"),
+# so personal pronouns are kept too, folded into one feature per person; reflexives
+# ("myself") stay apart from the plain pronoun ("me")
+PERSONS = {
+    'i': 'p1', 'me': 'p1', 'my': 'p1', 'mine': 'p1', 'we': 'p1', 'us': 'p1', 'our': 'p1', 'ours': 'p1',
+    'myself': 'p1self', 'ourselves': 'p1self',
+    'you': 'p2', 'your': 'p2', 'yours': 'p2', 'yourself': 'p2self', 'yourselves': 'p2self',
+    'he': 'p3', 'him': 'p3', 'his': 'p3', 'she': 'p3', 'her': 'p3', 'hers': 'p3',
+    'they': 'p3', 'them': 'p3', 'their': 'p3', 'theirs': 'p3',
+    'himself': 'p3self', 'herself': 'p3self', 'themselves': 'p3self',
+}
+
+SEMANTIC_STOP_WORDS = (STOP_WORDS - NEGATIONS - set(PERSONS)) | QUESTION_FILLER
+WORD_PATTERN = re.compile(r"[a-z0-9]+|[.,;:!?]")
+
+
+def semantic_tokens(question):
+    """Stemmed content words and pronoun persons of a question, with 'not_' before negated ones"""
+    text = CONTRACTED_NOT.sub(' not', question.lower()).replace('cannot', 'can not')
+    words = WORD_PATTERN.findall(text)
+    tokens = []
+    negated = False
+    for i, word in enumerate(words):
+        if word in CLAUSE_BREAKS:
+            negated = False
+        elif word in NEGATIONS:
+            negated = True
+        elif word in PERSONS and (i and words[i - 1] in QUESTION_FILLER
+                                  or i + 1 < len(words) and words[i + 1] in QUESTION_FILLER):
+            # Part of the question's frame ("can you tell me", "I wonder"), not its subject
+            continue
+        elif word not in SEMANTIC_STOP_WORDS:
+            token = PERSONS.get(word) or stem(word)
+            tokens.append('not_' + token if negated else token)
+    return tokens
+
+
+def _hash_feature(feature, dim):
+    """Map a feature to a (bucket, sign) pair with a stable hash"""
+    h = zlib.crc32(feature.encode('utf-8'))
+    return h % dim, (1.0 if (h >> 31) & 1 else -1.0)
+
+
+def vectorize(question, dim=SEMANTIC_CACHE_DIM):
+    """Return an L2-normalized hashed n-gram vector for a question"""
+    vector = np.zeros(dim, dtype=np.float32)
+    tokens = semantic_tokens(question)
+    for token in tokens:
+        bucket, sign = _hash_feature('w:' + token, dim)
+        vector[bucket] += sign * WORD_WEIGHT
+        # Negated words share no character features with the plain word either
+        kind = 'n:' if token.startswith('not_') else 'c:'
+        padded = f"#{token[4:] if kind == 'n:' else token}#"
+        for i in range(len(padded) - 2):
+            bucket, sign = _hash_feature(kind + padded[i:i + 3], dim)
+            vector[bucket] += sign * TRIGRAM_WEIGHT
+    for first, second in zip(tokens, tokens[1:]):
+        bucket, sign = _hash_feature(f"b:{first} {second}", dim)
+        vector[bucket] += sign * WORD_WEIGHT
+    norm = np.linalg.norm(vector)
+    if norm > 0:
+        vector /= norm
+    return vector
+
+
+class SemanticCache:
+    """Fixed-size matrix of question vectors with per-answer expiry and least-recently-used eviction"""
+
+    def __init__(self, max_size=SEMANTIC_CACHE_SIZE, threshold=SEMANTIC_CACHE_THRESHOLD,
+                 dim=SEMANTIC_CACHE_DIM, ttl=SEMANTIC_CACHE_TTL):
+        self.max_size = max_size
+        self.threshold = threshold
+        self.dim = dim
+        self.ttl = ttl
+        self._vectors = np.zeros((max_size, dim), dtype=np.float32)
+        self._scopes = np.full(max_size, -1, dtype=np.int32)
+        self._last_used = np.zeros(max_size, dtype=np.int64)
+        # time.monotonic() after which each slot's answer is no longer served
+        self._expires_at = np.zeros(max_size, dtype=np.float64)
+        self._answers = [None] * max_size
+        self._scope_ids = {}
+        self._count = 0
+        self._clock = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _scope_id(self, faq_version, model_name):
+        """Answers are only shared between questions for the same FAQ version and model"""
+        key = (faq_version, model_name)
+        scope = self._scope_ids.get(key)
+        if scope is None:
+            scope = len(self._scope_ids)
+            self._scope_ids[key] = scope
+        return scope
+
+    def _best_match(self, vector, scope, now=None):
+        """Return (slot, similarity) of the closest cached question in scope, unexpired at now if given"""
+        if self._count == 0:
+            return None, 0.0
+        similarities = self._vectors[:self._count] @ vector
+        similarities[self._scopes[:self._count] != scope] = -1.0
+        if now is not None:
+            similarities[self._expires_at[:self._count] <= now] = -1.0
+        slot = int(np.argmax(similarities))
+        return slot, float(similarities[slot])
+
+    def get(self, question, faq_version, model_name):
+        """Return the answer cached for a sufficiently similar question, or None"""
+        return self.lookup(question, faq_version, model_name)[0]
+
+    def lookup(self, question, faq_version, model_name):
+        """Return (answer, seconds until it expires) for a sufficiently similar question, or (None, 0)"""
+        if self.max_size <= 0:
+            return None, 0.0
+        vector = vectorize(question, self.dim)
+        now = time.monotonic()
+        with self._lock:
+            slot, similarity = self._best_match(vector, self._scope_id(faq_version, model_name), now)
+            if slot is not None and similarity >= self.threshold:
+                self._clock += 1
+                self._last_used[slot] = self._clock
+                self.hits += 1
+                return self._answers[slot], float(self._expires_at[slot]) - now
+            self.misses += 1
+            return None, 0.0
+
+    def set(self, question, faq_version, model_name, answer, ttl=None):
+        """Cache an answer for ttl seconds (default self.ttl), replacing a near-identical question or the LRU slot"""
+        if self.max_size <= 0:
+            return
+        vector = vectorize(question, self.dim)
+        if not vector.any():
+            return
+        now = time.monotonic()
+        with self._lock:
+            scope = self._scope_id(faq_version, model_name)
+            slot, similarity = self._best_match(vector, scope)
+            if slot is None or similarity < 0.999:
+                if self._count < self.max_size:
+                    slot = self._count
+                    self._count += 1
+                else:
+                    # Expired answers go first, then the least recently used
+                    expired = np.flatnonzero(self._expires_at <= now)
+                    slot = int(expired[0]) if len(expired) else int(np.argmin(self._last_used))
+                    self.evictions += 1
+            self._clock += 1
+            self._vectors[slot] = vector
+            self._scopes[slot] = scope
+            self._last_used[slot] = self._clock
+            self._expires_at[slot] = now + (self.ttl if ttl is None else ttl)
+            self._answers[slot] = answer
+
+    def invalidate_version(self, faq_version):
+        """Drop the answers cached for one FAQ version; returns how many were dropped"""
+        with self._lock:
+            scopes = [scope for (version, _), scope in self._scope_ids.items() if version == faq_version]
+            stale = np.flatnonzero(np.isin(self._scopes[:self._count], scopes))
+            for slot in stale:
+                self._answers[slot] = None
+            self._scopes[stale] = -1
+            # Freed slots are the first to be reused
+            self._last_used[stale] = 0
+            self._expires_at[stale] = 0.0
+            return len(stale)
+
+    def clear(self):
+        """Drop every cached answer"""
+        with self._lock:
+            self._scopes[:] = -1
+            self._last_used[:] = 0
+            self._expires_at[:] = 0.0
+            self._answers = [None] * self.max_size
+            self._scope_ids = {}
+            self._count = 0
+            self._clock = 0
+
+    def stats(self):
+        """Return counters for the health endpoint"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': self._count,
+                'max_size': self.max_size,
+                'threshold': self.threshold,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'memory_bytes': int(self._vectors.nbytes),
+            }
+
+
+# Shared by every request in the process
+semantic_cache = SemanticCache()
@@ -3,10 +3,20 @@ Streamlit version of the Mental Health FAQ Chatbot
 For deployment on Streamlit Cloud
 """
 import streamlit as st
-import google.generativeai as genai
-import json
 import os
-import pandas as pd
+from faq_index import build_index, get_index
+from faq_passages import build_passage_index, get_passage_index
+from faq_ingest import load_faq_file
+from faq_store import compact_faq
+from prompt_builder import PROMPT_CANDIDATES, get_prompt_template
+import model_registry
+from response_cache import lookup_answer, store_answer
+from conversation import Conversation
+from request_policy import model_policy
+from admission import Overloaded
+from faq_answers import get_faq_response
+from metrics import classify_error
+from faq_snapshot import DEFAULT_SNAPSHOT_PATH, load_snapshot
 
 # Page configuration
 st.set_page_config(
@@ -65,77 +75,99 @@ if 'messages' not in st.session_state:
         }
     ]
 
-if 'faq_data' not in st.session_state:
-    # Load FAQ data
-    @st.cache_data
-    def load_faq_data():
-        """Load FAQ data from JSON or CSV"""
-        try:
-            # Try faq_data.json first
-            if os.path.exists('faq_data.json'):
-                with open('faq_data.json', 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    if data and len(data) > 0:
-                        return data
-                    else:
-                        st.warning("⚠️ faq_data.json is empty. Trying CSV file...")
+if 'conversation' not in st.session_state:
+    # Turns sent to the model: recent ones verbatim, older ones in a rolling summary
+    st.session_state.conversation = Conversation()
+
+# Compiled FAQ snapshot (build with: python faq_snapshot.py)
+FAQ_SNAPSHOT_PATH = os.getenv('FAQ_SNAPSHOT_PATH', DEFAULT_SNAPSHOT_PATH)
+FAQ_FILES = ('faq_data.json', FAQ_SNAPSHOT_PATH, 'Mental_Health_FAQ.csv')
+
+def load_faq_data():
+    """Load FAQ data from JSON or CSV; returns (faq_data, [(level, message), ...])"""
+    # Messages are returned rather than shown, since this runs once per process, not per session
+    messages = []
+    try:
+        # Try faq_data.json first (streamed, repaired and deduplicated)
+        if os.path.exists('faq_data.json'):
+            data = load_faq_file('faq_data.json')
+            if data and len(data) > 0:
+                return data, messages
+            else:
+                messages.append(('warning', "⚠️ faq_data.json is empty. Trying CSV file..."))
+        
+        # Try CSV file
+        if os.path.exists('Mental_Health_FAQ.csv'):
+            faq_data = load_faq_file('Mental_Health_FAQ.csv')
             
-            # Try CSV file
-            if os.path.exists('Mental_Health_FAQ.csv'):
-                df = pd.read_csv('Mental_Health_FAQ.csv')
-                if df.empty:
-                    st.error("❌ CSV file is empty!")
-                    return []
-                
-                faq_data = []
-                for idx, row in df.iterrows():
-                    faq_data.append({
-                        'question_id': str(row['Question_ID']),
-                        'question': str(row['Questions']).strip(),
-                        'answer': str(row['Answers']).strip()
-                    })
-                
-                if faq_data:
-                    return faq_data
-                else:
-                    st.error("❌ No valid FAQ entries found in CSV!")
-                    return []
+            if faq_data:
+                return faq_data, messages
             else:
-                st.error("❌ FAQ data file not found!")
-                st.info("💡 Please ensure either 'faq_data.json' or 'Mental_Health_FAQ.csv' is in your repository.")
-                return []
-        except FileNotFoundError as e:
-            st.error(f"❌ File not found: {str(e)}")
-            return []
-        except json.JSONDecodeError as e:
-            st.error(f"❌ Invalid JSON in faq_data.json: {str(e)}")
-            st.info("💡 Trying to load from CSV instead...")
-            # Try CSV as fallback
-            if os.path.exists('Mental_Health_FAQ.csv'):
-                try:
-                    df = pd.read_csv('Mental_Health_FAQ.csv')
-                    faq_data = []
-                    for idx, row in df.iterrows():
-                        faq_data.append({
-                            'question_id': str(row['Question_ID']),
-                            'question': str(row['Questions']).strip(),
-                            'answer': str(row['Answers']).strip()
-                        })
-                    return faq_data
-                except Exception as e2:
-                    st.error(f"❌ Error loading CSV: {str(e2)}")
-            return []
-        except Exception as e:
-            st.error(f"❌ Error loading FAQ data: {str(e)}")
-            import traceback
-            st.code(traceback.format_exc())
-            return []
-    
-    st.session_state.faq_data = load_faq_data()
-    
+                messages.append(('error', "❌ No valid FAQ entries found in CSV!"))
+                return [], messages
+        else:
+            messages.append(('error', "❌ FAQ data file not found!"))
+            messages.append(('info', "💡 Please ensure either 'faq_data.json' or 'Mental_Health_FAQ.csv' is in your repository."))
+            return [], messages
+    except FileNotFoundError as e:
+        messages.append(('error', f"❌ File not found: {str(e)}"))
+        return [], messages
+    except ValueError as e:  # includes json.JSONDecodeError
+        messages.append(('error', f"❌ Invalid JSON in faq_data.json: {str(e)}"))
+        messages.append(('info', "💡 Trying to load from CSV instead..."))
+        # Try CSV as fallback
+        if os.path.exists('Mental_Health_FAQ.csv'):
+            try:
+                return load_faq_file('Mental_Health_FAQ.csv'), messages
+            except Exception as e2:
+                messages.append(('error', f"❌ Error loading CSV: {str(e2)}"))
+        return [], messages
+    except Exception as e:
+        import traceback
+        messages.append(('error', f"❌ Error loading FAQ data: {str(e)}"))
+        messages.append(('code', traceback.format_exc()))
+        return [], messages
+
+def faq_files_stamp():
+    """Size and modification time of the FAQ files, so edits load a new store"""
+    stamp = []
+    for path in FAQ_FILES:
+        try:
+            stat = os.stat(path)
+            stamp.append((path, stat.st_size, stat.st_mtime_ns))
+        except OSError:
+            stamp.append((path, None, None))
+    return tuple(stamp)
+
+@st.cache_resource(max_entries=1, show_spinner="Loading FAQ data...")
+def get_faq_store(files_stamp):
+    """Load the FAQ data and build its indexes and prompt template once per process
+
+    Every session shares the returned objects and must treat them as read-only;
+    st.cache_resource hands out the same instance rather than a copy per session.
+    """
+    # The memory-mapped snapshot already contains the indexes and prompt context
+    snapshot = load_snapshot(FAQ_SNAPSHOT_PATH, 'faq_data.json')
+    if snapshot is not None:
+        return snapshot, ()
+    faq_data, messages = load_faq_data()
+    # Large corpora are kept column-wise with compressed answers
+    faq_data = compact_faq(faq_data)
+    build_index(faq_data)
+    build_passage_index(faq_data)
+    get_prompt_template(faq_data)
+    return faq_data, tuple(messages)
+
+# Shared by every session; session state only holds the chat history
+faq_data, faq_load_messages = get_faq_store(faq_files_stamp())
+
+if 'faq_status_shown' not in st.session_state:
+    st.session_state.faq_status_shown = True
+    for level, message in faq_load_messages:
+        getattr(st, level)(message)
     # Show status
-    if st.session_state.faq_data:
-        st.success(f"✅ Loaded {len(st.session_state.faq_data)} FAQ entries")
+    if faq_data:
+        st.success(f"✅ Loaded {len(faq_data)} FAQ entries")
     else:
         st.error("❌ No FAQ data loaded! The chatbot may not work properly.")
 
@@ -148,89 +180,92 @@ def get_gemini_model():
         st.error("⚠️ GEMINI_API_KEY not found! Please set it in Streamlit Cloud secrets.")
         st.stop()
     
-    genai.configure(api_key=api_key)
-    
-    # Try to initialize model with fallbacks
-    try:
-        return genai.GenerativeModel('models/gemini-2.5-flash')
-    except Exception:
-        try:
-            return genai.GenerativeModel('models/gemini-2.5-pro')
-        except Exception:
-            return genai.GenerativeModel('models/gemini-flash-latest')
+    model_registry.configure(api_key)
+    return model_registry.get_model()
 
 def find_similar_question(user_question, faq_data, top_n=3):
     """Find similar questions from FAQ"""
-    user_lower = user_question.lower()
-    scores = []
-    
-    for entry in faq_data:
-        question = entry['question'].lower()
-        keywords = user_lower.split()
-        matches = sum(1 for keyword in keywords if keyword in question)
-        if matches > 0:
-            scores.append((matches, entry))
-    
-    scores.sort(reverse=True, key=lambda x: x[0])
-    return [entry for _, entry in scores[:top_n]]
+    index = get_index(faq_data)
+    return [faq_data[doc_id] for _, doc_id in index.search(user_question, top_n)]
 
-def get_chatbot_response(user_question, faq_data, model):
-    """Generate response using Gemini API"""
-    try:
-        # Check if FAQ data is available
-        if not faq_data or len(faq_data) == 0:
-            return "I apologize, but the FAQ database is not available. Please contact the administrator."
-        
-        # Find similar questions
-        similar_questions = find_similar_question(user_question, faq_data)
-        
-        # Create context
-        relevant_context = ""
-        if similar_questions:
-            relevant_context = "Most relevant FAQ entries:\n"
-            for entry in similar_questions:
-                relevant_context += f"Q: {entry['question']}\nA: {entry['answer']}\n\n"
-        
-        # Add general FAQ context (limit to avoid token limits)
-        faq_context = ""
-        max_entries = min(100, len(faq_data))  # Use available entries
-        for entry in faq_data[:max_entries]:
-            faq_context += f"Q: {entry['question']}\nA: {entry['answer']}\n\n"
-        
-        system_prompt = f"""You are a helpful and empathetic mental health assistant chatbot. 
-Your role is to provide accurate, supportive, and compassionate information about mental health based on the following FAQ database.
+def find_relevant_passages(user_question, faq_data, top_n=PROMPT_CANDIDATES):
+    """Find the answer passages that best match the question"""
+    return get_passage_index(faq_data).search(user_question, top_n)
 
-{relevant_context}
+def friendly_error_message(error_msg):
+    """Map an API error to a message suitable for the user"""
+    error_type = classify_error(error_msg)
+    if error_type == 'auth':
+        return "I apologize, but there's an issue with the API configuration. Please contact the administrator."
+    elif error_type == 'quota':
+        return "I apologize, but the service is currently experiencing high demand. Please try again later."
+    else:
+        return f"I apologize, but I encountered an error: {error_msg}. Please try again or contact support."
 
-Additional FAQ Database Context:
-{faq_context[:3000]}
+def build_chat_prompt(user_question, faq_data, conversation=None):
+    """Build the full prompt for a user question and any earlier turns"""
+    # Retrieve the best-matching answer passages to fill the context token budget
+    query = user_question
+    if conversation:
+        # Follow-ups such as "what are the symptoms?" lean on the previous question
+        query = f"{conversation.last_user_message()} {user_question}"
+    relevant_passages = find_relevant_passages(query, faq_data)
+    
+    # Static instructions are prebuilt per FAQ version
+    history = conversation.render() if conversation else ''
+    return get_prompt_template(faq_data).render(user_question, relevant_passages, history)
 
-Instructions:
-1. Use the FAQ database above to answer user questions accurately
-2. If a question matches or is similar to a FAQ entry, provide that answer
-3. If the question is not directly in the FAQ, use your knowledge to provide helpful, empathetic responses
-4. Always be supportive, non-judgmental, and encourage professional help when appropriate
-5. If someone is in crisis or mentions self-harm, encourage them to seek immediate professional help
-6. Keep responses clear, concise, and easy to understand
-7. If you're unsure, acknowledge it and suggest consulting a mental health professional
+def stream_model(model, full_prompt):
+    """Yield answer chunks as they arrive; opening the stream runs under the request policy"""
+    def attempt(attempt_model):
+        # An attempt lasts until the first chunk; the winner's stream is read on below
+        chunks = iter(attempt_model.generate_content(full_prompt, stream=True))
+        for chunk in chunks:
+            if chunk.text:
+                return chunk.text, chunks
+        return '', iter(())
+    
+    # Deadline, hedging after the recent p95 latency and retries of transient errors
+    first, chunks = model_policy.call(attempt, model, model_registry.get_hedge_model(model))
+    if first:
+        yield first
+    for chunk in chunks:
+        if chunk.text:
+            yield chunk.text
 
-Remember: You are not a replacement for professional mental health care. Always encourage users to consult with qualified mental health professionals for diagnosis and treatment.
-"""
-        
-        full_prompt = f"{system_prompt}\n\nUser Question: {user_question}\n\nPlease provide a helpful and empathetic response:"
-        
-        response = model.generate_content(full_prompt)
-        return response.text
-        
+def stream_chatbot_response(user_question, faq_data, model, conversation=None):
+    """Yield the Gemini response in chunks as they are generated"""
+    if not faq_data or len(faq_data) == 0:
+        yield "I apologize, but the FAQ database is not available. Please contact the administrator."
+        return
+    
+    parts = []
+    try:
+        # Follow-ups depend on the conversation, so only standalone questions share answers
+        standalone = not conversation
+        faq_version = get_index(faq_data).version
+        cached = lookup_answer(user_question, faq_version, model.model_name) if standalone else None
+        if cached is not None:
+            yield cached
+            answer = cached
+        else:
+            full_prompt = build_chat_prompt(user_question, faq_data, conversation)
+            for text in stream_model(model, full_prompt):
+                parts.append(text)
+                yield text
+            answer = "".join(parts)
+            if answer and standalone:
+                store_answer(user_question, faq_version, model.model_name, answer)
+        if answer and conversation is not None:
+            conversation.add_turn(user_question, answer)
+    except Overloaded:
+        yield get_faq_response(user_question, faq_data, mode='faq-only')['response']
     except Exception as e:
-        error_msg = str(e)
-        # Provide more helpful error messages
-        if "API key" in error_msg.lower():
-            return "I apologize, but there's an issue with the API configuration. Please contact the administrator."
-        elif "quota" in error_msg.lower() or "limit" in error_msg.lower():
-            return "I apologize, but the service is currently experiencing high demand. Please try again later."
+        if parts:
+            yield friendly_error_message(str(e))
         else:
-            return f"I apologize, but I encountered an error: {error_msg}. Please try again or contact support."
+            # Nothing was shown yet, so answer from the FAQ rather than with the error
+            yield get_faq_response(user_question, faq_data, mode='faq-only')['response']
 
 # Main UI
 st.title("🧠 Mental Health FAQ Assistant")
@@ -239,8 +274,8 @@ st.caption("Ask me anything about mental health")
 # Show FAQ data status in sidebar (collapsed by default but visible if needed)
 with st.sidebar:
     st.header("ℹ️ App Status")
-    if st.session_state.get('faq_data'):
-        st.success(f"✅ {len(st.session_state.faq_data)} FAQ entries loaded")
+    if faq_data:
+        st.success(f"✅ {len(faq_data)} FAQ entries loaded")
     else:
         st.error("❌ No FAQ data loaded")
     
@@ -266,10 +301,14 @@ if prompt := st.chat_input("Type your question here..."):
     
     # Get bot response
     with st.chat_message("assistant"):
-        with st.spinner("Thinking..."):
-            model = get_gemini_model()
-            response = get_chatbot_response(prompt, st.session_state.faq_data, model)
-            st.markdown(response)
+        model = get_gemini_model()
+        placeholder = st.empty()
+        response = ""
+        # Render chunks as they arrive instead of waiting for the full answer
+        for text in stream_chatbot_response(prompt, faq_data, model, st.session_state.conversation):
+            response += text
+            placeholder.markdown(response + "▌")
+        placeholder.markdown(response)
     
     # Add assistant response
     st.session_state.messages.append({"role": "assistant", "content": response})
@@ -0,0 +1,18 @@
+from check_security import check_file, scan_files
+
+# Built at run time so this file does not trip the scanner itself
+KEY = 'AIza' + 'Sy' + 'A1b2C3d4E5f6G7h8I9j0K1l2M3n4O5p6Q7r'
+
+
+def test_key_after_nul_byte_is_found(tmp_path):
+    path = tmp_path / 'dump.json'
+    path.write_bytes(b'\x00\x01\x02header\n' + b'\x00' * 16 + b'key=' + KEY.encode('ascii') + b'\x00\xff\n')
+    issues, stats = scan_files([str(path)])
+    assert [issue['line'] for issue in issues] == [2]
+    assert stats['binary'] == [str(path)]
+
+
+def test_key_in_utf16_file_is_found(tmp_path):
+    path = tmp_path / 'settings.ps1'
+    path.write_bytes(f'# settings\n$key = "{KEY}"\n'.encode('utf-16'))
+    assert [issue['line'] for issue in check_file(str(path))] == [2]
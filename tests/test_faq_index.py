@@ -0,0 +1,48 @@
+import pytest
+
+from faq_index import FAQIndex
+
+FAQ = [
+    {'question_id': '1', 'question': 'What is depression?',
+     'answer': 'Depression is a mood disorder that causes a persistent feeling of sadness.'},
+    {'question_id': '2', 'question': 'What is anxiety?',
+     'answer': 'Anxiety is a feeling of worry or fear that can be mild or severe.'},
+    {'question_id': '3', 'question': 'How do I find a therapist?',
+     'answer': 'Ask your doctor for a referral or search a directory of licensed therapists.'},
+    {'question_id': '4', 'question': 'Can depression and anxiety occur together?',
+     'answer': 'Yes, many people with depression also have anxiety.'},
+]
+
+QUERIES = ['what is depression', 'anxiety and depression', 'therapist', 'feeling', '', 'unrelated words']
+
+
+@pytest.mark.parametrize('top_n', [1, 2, 3, 10])
+def test_search_batch_matches_search(top_n):
+    index = FAQIndex(FAQ)
+    assert index.search_batch(QUERIES, top_n) == [index.search(query, top_n) for query in QUERIES]
+
+
+def test_search_batch_of_no_queries():
+    assert FAQIndex(FAQ).search_batch([]) == []
+
+
+NEGATION_FAQ = [
+    {'question_id': '1', 'question': 'What causes mental illness?',
+     'answer': 'Genetics, life events and brain chemistry can all play a part.'},
+    {'question_id': '2', 'question': 'How do I find a therapist?',
+     'answer': 'Ask your doctor for a referral.'},
+]
+
+
+def test_negated_question_is_not_a_confident_match():
+    index = FAQIndex(NEGATION_FAQ)
+    assert index.match_confidence('What causes mental illness?', 'What causes mental illness?') == 1.0
+    assert index.match_confidence('What does not cause mental illness?', 'What causes mental illness?') < 0.3
+    assert index.match_confidence("What doesn't cause mental illness?", 'What causes mental illness?') < 0.3
+
+
+def test_faq_only_does_not_answer_the_opposite_question():
+    from faq_answers import NO_MATCH_MESSAGE, get_faq_response
+    assert get_faq_response('What causes mental illness?', NEGATION_FAQ, mode='faq-only')['response'] != NO_MATCH_MESSAGE
+    assert get_faq_response('What does not cause mental illness?', NEGATION_FAQ, mode='faq-only')['response'] == NO_MATCH_MESSAGE
+    assert get_faq_response('What does not cause mental illness?', NEGATION_FAQ, mode='faq-first') is None
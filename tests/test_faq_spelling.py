@@ -0,0 +1,46 @@
+import pytest
+
+pytest.importorskip('spellchecker')
+
+from faq_index import FAQIndex
+
+FAQ = [
+    {'question_id': '1', 'question': 'What is depression?',
+     'answer': 'Depression is a mood disorder. Many people need help to overcome it.'},
+    {'question_id': '2', 'question': 'How can I manage anxiety?',
+     'answer': 'Breathing is a coping skill that can fully calm a rare panic attack.'},
+    {'question_id': '3', 'question': 'How do I find a therapist?',
+     'answer': 'Ask your doctor for a referral. Drink water and rest before your first session.'},
+]
+
+
+@pytest.fixture(scope='module')
+def index():
+    return FAQIndex(FAQ, typo_correction=True)
+
+
+@pytest.mark.parametrize('word', ['kill', 'overdose', 'rape', 'bully', 'weed', 'drunk'])
+def test_real_words_are_not_corrected(index, word):
+    assert index.correct(word) is None
+    assert index.query_terms(f"I {word}") == {}
+
+
+@pytest.mark.parametrize('typo, word', [
+    ('depresion', 'depression'),
+    ('anxeity', 'anxiety'),
+    ('theripist', 'therapist'),
+])
+def test_typos_are_corrected(index, typo, word):
+    term, weight = index.correct(typo)
+    assert index.correct(word) == (term, 1.0)
+    assert 0 < weight < 1
+
+
+def test_match_confidence_uses_words_as_typed(index):
+    assert index.match_confidence('how can I manage anxeity', 'How can I manage anxiety?') < \
+        index.match_confidence('how can I manage anxiety', 'How can I manage anxiety?')
+
+
+def test_direct_answer_search_skips_correction(index):
+    assert index.search('anxeity', top_n=1)
+    assert index.search('anxeity', top_n=1, typo_correction=False) == []
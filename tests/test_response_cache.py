@@ -0,0 +1,35 @@
+import time
+
+import pytest
+
+import response_cache
+from response_cache import lookup_answer, store_answer
+from semantic_cache import SemanticCache
+
+
+@pytest.fixture
+def short_ttl(monkeypatch):
+    monkeypatch.setattr(response_cache.response_cache, 'ttl', 0.01)
+    response_cache.response_cache.clear()
+    response_cache.semantic_cache.clear()
+    yield
+    response_cache.response_cache.clear()
+    response_cache.semantic_cache.clear()
+
+
+def test_expired_answer_is_not_served_through_semantic_path(short_ttl):
+    store_answer("What is depression?", 'v1', 'model', 'old answer')
+    assert lookup_answer("What is depression?", 'v1', 'model') == 'old answer'
+    time.sleep(0.05)
+    assert lookup_answer("What is depression?", 'v1', 'model') is None
+    assert lookup_answer("what's depression", 'v1', 'model') is None
+
+
+def test_clear_forgets_scopes():
+    cache = SemanticCache(max_size=4)
+    for version in ('v1', 'v2', 'v3'):
+        cache.set("What is depression?", version, 'model', 'answer')
+    cache.clear()
+    assert cache.stats()['size'] == 0
+    assert cache._scope_ids == {}
+    assert cache.get("What is depression?", 'v1', 'model') is None
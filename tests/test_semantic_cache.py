@@ -0,0 +1,63 @@
+import pytest
+
+from semantic_cache import SEMANTIC_CACHE_THRESHOLD, SemanticCache, vectorize
+
+
+def similarity(first, second):
+    return float(vectorize(first) @ vectorize(second))
+
+
+@pytest.mark.parametrize('cached, asked', [
+    ("How do I know if I have depression?", "Am I depressed?"),
+    ("How can I help a friend with depression?", "How do I help my friend who is depressed?"),
+    ("Where can I find a therapist?", "how do i find a therapist"),
+])
+def test_paraphrase_reuses_cached_answer(cached, asked):
+    assert similarity(cached, asked) >= SEMANTIC_CACHE_THRESHOLD
+    cache = SemanticCache(max_size=8)
+    cache.set(cached, 'v1', 'model', 'cached answer')
+    assert cache.get(asked, 'v1', 'model') == 'cached answer'
+
+
+@pytest.mark.parametrize('cached, asked', [
+    ("I want to kill myself", "I don't want to kill myself"),
+    ("What is depression?", "What is not depression?"),
+    ("Should I stop taking my medication?", "Should I not stop taking my medication?"),
+    ("I can sleep", "I can't sleep"),
+])
+def test_negation_misses(cached, asked):
+    assert similarity(cached, asked) < SEMANTIC_CACHE_THRESHOLD
+    cache = SemanticCache(max_size=8)
+    cache.set(cached, 'v1', 'model', 'cached answer')
+    assert cache.get(asked, 'v1', 'model') is None
+
+
+@pytest.mark.parametrize('cached, asked', [
+    ("I want to kill myself", "I want to kill him"),
+    ("I want to hurt myself", "I want to hurt her"),
+    ("Is it my fault?", "Is it his fault?"),
+    ("Someone wants to kill me", "I want to kill myself"),
+])
+def test_different_person_misses(cached, asked):
+    for first, second in ((cached, asked), (asked, cached)):
+        assert similarity(first, second) < SEMANTIC_CACHE_THRESHOLD
+        cache = SemanticCache(max_size=8)
+        cache.set(first, 'v1', 'model', 'cached answer')
+        assert cache.get(second, 'v1', 'model') is None
+
+
+def test_question_frame_pronouns_are_ignored():
+    assert similarity("Can you tell me what depression is?", "What is depression?") >= SEMANTIC_CACHE_THRESHOLD
+
+
+def test_different_topics_miss():
+    cache = SemanticCache(max_size=8)
+    cache.set("What are the symptoms of depression?", 'v1', 'model', 'symptoms')
+    assert cache.get("What is the treatment for depression?", 'v1', 'model') is None
+    assert cache.get("Is my friend depressed?", 'v1', 'model') is None
+
+
+def test_answers_are_scoped_to_faq_version():
+    cache = SemanticCache(max_size=8)
+    cache.set("What is depression?", 'v1', 'model', 'old answer')
+    assert cache.get("What is depression?", 'v2', 'model') is None